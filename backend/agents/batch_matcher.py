@@ -0,0 +1,171 @@
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+from core.audit_logger import AuditLogger
+from agents.retriever import DocumentRetriever
+from agents.po_matcher import POMatchingAgent
+
+# Invoices in these states are settled and skipped unless statuses are given explicitly
+CLOSED_STATUSES = {"approved", "paid", "rejected"}
+
+MatchInput = Tuple[Dict[str, Any], Optional[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+# One worker pool per process, shared by every batch: starting workers costs more than a small batch
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _process_pool(max_workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_pid
+    # The pool's management thread does not survive a fork, so each process gets its own pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=max_workers)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Forget a pool whose worker died, so the next batch starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _summarize(invoice: Dict[str, Any], po: Optional[Dict[str, Any]], gr: Optional[Dict[str, Any]],
+               result: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop the full documents from a match result; batch output only needs the verdict"""
+    return {
+        "invoice_id": invoice.get("invoice_id") or invoice.get("id"),
+        "po_id": po.get("po_id") or po.get("id") if po else None,
+        "goods_receipt_id": gr.get("id") if gr else None,
+        "match_score": result["match_score"],
+        "flag_reason": result["flag_reason"],
+        "discrepancies": result["discrepancies"],
+        "evidence": result["evidence"],
+    }
+
+
+def match_chunk(chunk: List[MatchInput]) -> List[Dict[str, Any]]:
+    """Process-pool entry point: three-way match a chunk of pre-joined documents, no LLM involved"""
+    matcher = POMatchingAgent(llm_client=None, audit_logger=None, retriever=None)
+    return [_summarize(invoice, po, gr, matcher._analyze_three_way_match(invoice, po, gr))
+            for invoice, po, gr in chunk]
+
+
+class BatchMatchingEngine:
+    def __init__(self, retriever: DocumentRetriever, audit_logger: AuditLogger,
+                 max_workers: int = None, chunk_size: int = 500):
+        self.retriever = retriever
+        self.audit_logger = audit_logger
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+
+    def select_invoices(self, invoice_ids: List[str] = None, vendor: str = None,
+                        statuses: List[str] = None) -> Iterator[Dict[str, Any]]:
+        """Open invoices, or the subset matching the given ids / vendor / statuses"""
+        store = self.retriever.store
+        if invoice_ids:
+            candidates = (store.get("invoices", invoice_id) for invoice_id in invoice_ids)
+        elif vendor:
+            candidates = iter(store.find_by("invoices", "vendor", vendor))
+        else:
+            candidates = iter(store.documents("invoices"))
+
+        wanted = set(statuses) if statuses else None
+        for invoice in candidates:
+            if invoice is None:
+                continue
+            if vendor and invoice.get("vendor") != vendor:
+                continue
+            status = invoice.get("status")
+            if wanted is not None and status not in wanted:
+                continue
+            if wanted is None and not invoice_ids and status in CLOSED_STATUSES:
+                continue
+            yield invoice
+
+    def _join(self, invoices: Iterator[Dict[str, Any]]) -> Iterator[List[MatchInput]]:
+        """Attach each invoice's PO and goods receipt by po_reference in one pass, in chunks"""
+        store = self.retriever.store
+        chunk: List[MatchInput] = []
+        for invoice in invoices:
+            po_id = invoice.get("po_reference")
+            po = gr = None
+            if po_id:
+                po = store.get("purchase_orders", po_id)
+                receipts = store.find_by("goods_receipts", "po_reference", po_id)
+                gr = receipts[0] if receipts else None
+            chunk.append((invoice, po, gr))
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def run(self, session_id: str, invoice_ids: List[str] = None, vendor: str = None,
+            statuses: List[str] = None) -> Iterator[Dict[str, Any]]:
+        """Yield match results as chunks complete, then one summary record"""
+        started = time.time()
+        chunks = self._join(self.select_invoices(invoice_ids, vendor, statuses))
+        matched = flagged = 0
+
+        for results in self._execute(chunks):
+            for result in results:
+                matched += 1
+                if result["match_score"] <= 0.8:
+                    flagged += 1
+                yield result
+
+        summary = {
+            "matched": matched,
+            "flagged": flagged,
+            "elapsed_seconds": round(time.time() - started, 3),
+        }
+        self.audit_logger.log_action(
+            session_id=session_id,
+            action_type="batch_po_matching",
+            agent="po_matcher",
+            input_data={"invoice_ids": invoice_ids, "vendor": vendor, "statuses": statuses},
+            output_data=summary
+        )
+        yield {"summary": summary}
+
+    def _execute(self, chunks: Iterator[List[MatchInput]]) -> Iterator[List[Dict[str, Any]]]:
+        head = [chunk for chunk in (next(chunks, None), next(chunks, None)) if chunk is not None]
+        chunks = itertools.chain(head, chunks)
+        if len(head) < 2 or self.max_workers == 1:
+            # Too little work to pay for sending it to the pool
+            for chunk in chunks:
+                yield match_chunk(chunk)
+            return
+
+        pool = _process_pool(self.max_workers)
+        in_flight = set()
+        try:
+            while True:
+                # Keep a bounded number of chunks in flight so memory stays flat on huge batches
+                while len(in_flight) < self.max_workers * 2:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    in_flight.add(pool.submit(match_chunk, chunk))
+                if not in_flight:
+                    break
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            raise
+        finally:
+            # A batch abandoned by its client leaves nothing queued on the shared pool
+            for future in in_flight:
+                future.cancel()
@@ -0,0 +1,155 @@
+import threading
+from collections import defaultdict
+from typing import Dict, List, Any, Optional, Set, Tuple
+from core.document_store import DocumentChange
+from agents.po_matcher import POMatchingAgent
+
+DOC_TYPES = ("invoices", "purchase_orders", "goods_receipts")
+
+# Result fields holding whole documents: stored as ids and looked up again on read
+_DOCUMENT_FIELDS = (("invoice", "invoices"), ("purchase_order", "purchase_orders"), ("goods_receipt", "goods_receipts"))
+
+
+def _invoice_key(doc: Dict[str, Any]) -> Optional[str]:
+    return doc.get("invoice_id") or doc.get("id")
+
+
+def _po_key(doc: Dict[str, Any]) -> Optional[str]:
+    return doc.get("po_id") or doc.get("id")
+
+
+class MatchResultStore:
+    """Materialized three-way match results per invoice, kept fresh by incremental invalidation.
+
+    Dependencies run invoice -> PO (the invoice's po_reference) -> GR (the GR's
+    po_reference), so a changed PO or GR only re-matches the invoices that
+    reference that PO. Only the analysis and the ids of the three documents are
+    kept; `get` looks the documents up again, so resident memory does not grow
+    with the corpus beyond what the document store itself holds.
+    """
+
+    def __init__(self, po_matcher: POMatchingAgent):
+        self.po_matcher = po_matcher
+        self.store = po_matcher.retriever.store
+        # invoice id -> (generation, result without its documents, (invoice, PO, GR) lookup ids)
+        self.results: Dict[str, Tuple[int, Dict[str, Any], Tuple[Optional[str], ...]]] = {}
+        self.invoices_by_po: Dict[str, Set[str]] = defaultdict(set)
+        self._po_of_invoice: Dict[str, str] = {}
+        self._generations: Dict[str, int] = defaultdict(int)
+        self._dirty: Set[str] = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.ready = threading.Event()
+        self.stats = {"hits": 0, "misses": 0, "rematched": 0}
+        self.store.subscribe(self._on_change)
+
+    def start(self):
+        """Materialize every invoice, then keep re-matching invalidated ones, in a background thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="match-store", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        # Already built when started again in a forked worker, which inherits the results
+        if not self.ready.is_set():
+            try:
+                self.build()
+            finally:
+                self.ready.set()
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self._drain()
+
+    def build(self):
+        for invoice in self.store.documents("invoices"):
+            invoice_id = _invoice_key(invoice)
+            if invoice_id:
+                self._rematch(invoice_id)
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._dirty:
+                    return
+                invoice_id = self._dirty.pop()
+            self._rematch(invoice_id)
+
+    def _rematch(self, invoice_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            generation = self._generations[invoice_id]
+        result = self.po_matcher.compute_match(invoice_id)
+
+        with self._lock:
+            self.stats["rematched"] += 1
+            old_po = self._po_of_invoice.pop(invoice_id, None)
+            if old_po is not None:
+                self.invoices_by_po[old_po].discard(invoice_id)
+            if result is None:
+                self.results.pop(invoice_id, None)
+                return None
+            po_id = result["invoice"].get("po_reference")
+            if po_id:
+                self._po_of_invoice[invoice_id] = po_id
+                self.invoices_by_po[po_id].add(invoice_id)
+            # An invalidation that raced with this computation bumped the generation,
+            # so the result is stored as already stale and will be recomputed
+            self.results[invoice_id] = (generation, *self._compact(invoice_id, result))
+        return result
+
+    @staticmethod
+    def _compact(invoice_id: str, result: Dict[str, Any]) -> Tuple[Dict[str, Any], Tuple[Optional[str], ...]]:
+        """The result without its documents, and the ids compute_match finds them by"""
+        po_id = result["invoice"].get("po_reference")
+        # The PO and the GR are both found by the invoice's po_reference, as in compute_match
+        ids = (invoice_id, po_id if result.get("purchase_order") else None,
+               po_id if result.get("goods_receipt") else None)
+        fields = {field for field, _ in _DOCUMENT_FIELDS}
+        return {key: value for key, value in result.items() if key not in fields}, ids
+
+    def _expand(self, compact: Dict[str, Any], ids: Tuple[Optional[str], ...]) -> Dict[str, Any]:
+        result = {}
+        for (field, doc_type), doc_id in zip(_DOCUMENT_FIELDS, ids):
+            result[field] = (self.po_matcher.retriever.get_specific_document(doc_id, doc_type)
+                             if doc_id is not None else None)
+        result.update(compact)
+        return result
+
+    def _on_change(self, doc_type: str, changes: List[DocumentChange]):
+        with self._lock:
+            affected = set()
+            for before, after in changes:
+                for doc in (before, after):
+                    if doc is None:
+                        continue
+                    if doc_type == "invoices":
+                        affected.add(_invoice_key(doc))
+                    elif doc_type == "purchase_orders":
+                        affected |= self.invoices_by_po.get(_po_key(doc), set())
+                    elif doc_type == "goods_receipts":
+                        affected |= self.invoices_by_po.get(doc.get("po_reference"), set())
+            affected.discard(None)
+            for invoice_id in affected:
+                self._generations[invoice_id] += 1
+            self._dirty |= affected
+        if affected:
+            self._wakeup.set()
+
+    def get(self, invoice_id: str) -> Optional[Dict[str, Any]]:
+        """Current match result for an invoice; O(1) unless it was invalidated and not yet re-matched"""
+        for doc_type in DOC_TYPES:
+            self.store.collection(doc_type)  # Reloads changed files, which fires _on_change
+
+        with self._lock:
+            entry = self.results.get(invoice_id)
+            fresh = entry is not None and entry[0] == self._generations.get(invoice_id, 0)
+            self.stats["hits" if fresh else "misses"] += 1
+        if fresh:
+            return self._expand(entry[1], entry[2])
+        return self._rematch(invoice_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, size=len(self.results), pending=len(self._dirty),
+                        ready=self.ready.is_set())
@@ -1,16 +1,236 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
+from collections import OrderedDict
 from core.llm_client import LLMClient
 from core.audit_logger import AuditLogger
+from core.prompt_compactor import count_tokens, truncate_to_budget
+import copy
+import json
 import re
+import threading
+import time
+
+# Query parts that vary between otherwise identical requests, masked before template lookup
+_SLOT_PATTERNS = (
+    ("INV", re.compile(r'\bINV-\d+\b', re.IGNORECASE)),
+    ("PO", re.compile(r'\bPO-\d+\b', re.IGNORECASE)),
+    ("AMOUNT", re.compile(r'[$€£]?\d[\d,]*(?:\.\d+)?')),
+)
+
+PLAN_TEMPLATES = {
+    "approval_request": {
+        "query_type": "approval_request",
+        "agents_to_call": ["retriever", "verifier"],
+        "reasoning": "User requesting approval action",
+        "parameters": {"action": "approve"}
+    },
+    "invoice_analysis": {
+        "query_type": "invoice_analysis",
+        "agents_to_call": ["retriever", "po_matcher", "verifier"],
+        "reasoning": "Analyzing flagged invoice",
+        "parameters": {"analysis_type": "flagged_invoice"}
+    },
+    "general_inquiry": {
+        "query_type": "general_inquiry",
+        "agents_to_call": ["retriever", "web_search", "verifier"],
+        "reasoning": "General inquiry requiring comprehensive search",
+        "parameters": {}
+    }
+}
+
+# Keyword evidence per query type; a type's score is the sum of its matched weights (capped at 1)
+_CLASSIFIER_SIGNALS = {
+    "approval_request": (
+        (re.compile(r'\bapprov\w*'), 0.85),
+        (re.compile(r'<inv>|\binvoice\b'), 0.15),
+    ),
+    "invoice_analysis": (
+        (re.compile(r'<inv>'), 0.35),
+        (re.compile(r'\binvoices?\b'), 0.15),
+        (re.compile(r'\b(flag\w*|why|mismatch\w*|discrepanc\w*|match\w*|hold|reject\w*)\b'), 0.4),
+        (re.compile(r'<po>|\b(purchase order|receipt)\b'), 0.15),
+    ),
+    "general_inquiry": (
+        (re.compile(r'\b(vendor|supplier|compliance|risk|audit\w*|policy)\b'), 0.6),
+        (re.compile(r'\b(who|what|tell me|info\w*|about)\b'), 0.2),
+    ),
+}
+
+
+def normalize_query(query: str) -> Tuple[str, List[str]]:
+    """Lowercased query with ids and amounts masked, plus the masked values in order"""
+    slots: List[str] = []
+    text = query.strip()
+    for name, pattern in _SLOT_PATTERNS:
+        def mask(match, name=name):
+            slots.append(match.group(0).upper())
+            return f"<{name.lower()}>"
+        text = pattern.sub(mask, text)
+    return " ".join(text.lower().split()), slots
+
+
+class _SlotRef:
+    """Stands in a template for a plan value that was exactly the query's index-th slot value:
+    the string itself, or (kind int/float) the number an amount slot spells"""
+    __slots__ = ("index", "kind")
+
+    def __init__(self, index: int, kind: type = None):
+        self.index = index
+        self.kind = kind
+
+
+def _slot_number(slot: str) -> Optional[float]:
+    """The number a slot value spells: an amount's value, or an id's numeric part"""
+    try:
+        return float(slot.lstrip("$€£").replace(",", "").rpartition("-")[2])
+    except ValueError:
+        return None
+
+
+class _Uncacheable(Exception):
+    pass
+
+
+def _to_template(value: Any, slots: List[str], patterns: List["re.Pattern"]) -> Any:
+    if isinstance(value, dict):
+        return {k: _to_template(v, slots, patterns) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_to_template(v, slots, patterns) for v in value]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        matches = [i for i, slot in enumerate(slots) if _slot_number(slot) == value]
+        if len(matches) == 1 and "-" not in slots[matches[0]]:
+            return _SlotRef(matches[0], type(value))
+        if matches:
+            # Taken from an id, or from one of several equal amounts: no way to tell which to replay
+            raise _Uncacheable()
+    if isinstance(value, str):
+        if value.upper() in slots:
+            return _SlotRef(slots.index(value.upper()))
+        if any(pattern.search(value) for pattern in patterns):
+            # A slot value inside longer text would be replayed stale for the next query
+            raise _Uncacheable()
+    return value
+
+
+def _from_template(value: Any, slots: List[str]) -> Any:
+    if isinstance(value, dict):
+        return {k: _from_template(v, slots) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_from_template(v, slots) for v in value]
+    if isinstance(value, _SlotRef):
+        if value.kind is None:
+            return slots[value.index]
+        number = _slot_number(slots[value.index])
+        return int(number) if value.kind is int and number.is_integer() else number
+    return value
+
+
+class PlanTemplateCache:
+    """LRU of plans keyed by normalized query (and, for context-dependent plans, context).
+
+    Whole string values equal to a masked slot value, and numbers equal to a masked
+    amount, become slot references; other values are kept as they are. A plan that
+    mentions a slot value inside longer text, or a number it cannot attribute to
+    exactly one amount, is not cached.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        # (key, context) -> template; context is None for plans that do not depend on it
+        self._templates: "OrderedDict[Tuple[str, Optional[str]], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, slots: List[str], context: str = "") -> Optional[Dict[str, Any]]:
+        with self._lock:
+            for entry in ((key, context), (key, None)):
+                template = self._templates.get(entry)
+                if template is not None:
+                    self._templates.move_to_end(entry)
+                    return _from_template(template, slots)
+        return None
+
+    def put(self, key: str, slots: List[str], plan: Dict[str, Any], context: Optional[str] = None):
+        """Cache plan; pass the context it was made with if it depends on it, None if not"""
+        patterns = [re.compile(r'(?<![\w.-])' + re.escape(value) + r'(?![\w-]|\.\d)', re.IGNORECASE)
+                    for value in slots]
+        try:
+            template = _to_template(plan, slots, patterns)
+        except _Uncacheable:
+            return
+        with self._lock:
+            self._templates[(key, context)] = template
+            self._templates.move_to_end((key, context))
+            while len(self._templates) > self.max_entries:
+                self._templates.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._templates)
 
 class QueryPlanner:
     def __init__(self, llm_client: LLMClient, audit_logger: AuditLogger):
         self.llm = llm_client
         self.audit_logger = audit_logger
+        self.context_budget = 300  # Tokens of conversation context sent with each plan request
+        self.max_output_tokens = 300
+        self.classifier_threshold = 0.75  # Below this the classifier defers to the LLM
+        self.templates = PlanTemplateCache()
+        self.tier_stats = {tier: {"count": 0, "seconds": 0.0}
+                           for tier in ("template_cache", "classifier", "llm", "fallback")}
+        self._stats_lock = threading.Lock()
     
     def plan_query(self, query: str, session_id: str, context: str = "") -> Dict[str, Any]:
-        """Plan the execution strategy for a query"""
+        """Plan the execution strategy for a query.
+
+        Tiers, cheapest first: plan-template cache, local classifier, LLM. The tier
+        that answered is recorded in the audit metadata and in get_stats().
+        """
+        started = time.perf_counter()
+        key, slots = normalize_query(query)
+        prompt_stats = None
+
+        # The LLM only sees the most recent context_budget tokens, so only those distinguish its plans
+        plan_context = truncate_to_budget(context, self.context_budget) if context else ""
+        plan = self.templates.get(key, slots, plan_context)
+        tier = "template_cache"
+        if plan is None:
+            plan, confidence = self._classify(key)
+            tier = "classifier"
+            if confidence < self.classifier_threshold:
+                plan, tier, prompt_stats = self._llm_plan(query, context)
+            if tier != "fallback":
+                self.templates.put(key, slots, plan, plan_context if tier == "llm" else None)
+        elapsed = time.perf_counter() - started
+
+        with self._stats_lock:
+            self.tier_stats[tier]["count"] += 1
+            self.tier_stats[tier]["seconds"] += elapsed
+
+        metadata = {"tier": tier, "planning_ms": round(elapsed * 1000, 3)}
+        if prompt_stats:
+            metadata["prompt_stats"] = prompt_stats
+        # Log the planning decision
+        self.audit_logger.log_action(
+            session_id=session_id,
+            action_type="query_planning",
+            agent="planner",
+            input_data={"query": query, "context": context},
+            output_data=plan,
+            metadata=metadata
+        )
         
+        return plan
+
+    def _classify(self, normalized_query: str) -> Tuple[Dict[str, Any], float]:
+        """Score each query type on keyword evidence; confidence is reduced by a close runner-up"""
+        scores = {
+            query_type: min(1.0, sum(weight for pattern, weight in signals if pattern.search(normalized_query)))
+            for query_type, signals in _CLASSIFIER_SIGNALS.items()
+        }
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (best, best_score), (_, runner_up) = ranked[0], ranked[1]
+        confidence = best_score - 0.5 * runner_up
+        return copy.deepcopy(PLAN_TEMPLATES[best]), round(confidence, 3)
+
+    def _llm_plan(self, query: str, context: str) -> Tuple[Dict[str, Any], str, Dict[str, int]]:
         planning_prompt = """
         You are a query planner for an invoice-PO matching system. Analyze the query and determine:
         1. What type of query this is (invoice_analysis, approval_request, general_inquiry)
@@ -35,53 +255,48 @@ class QueryPlanner:
         }}
         """
         
+        # Most recent context wins when the conversation outgrows the budget
+        compact_context = truncate_to_budget(context, self.context_budget)
+        prompt = planning_prompt.format(query=query, context=compact_context)
+        prompt_stats = {
+            "context_tokens_before": count_tokens(context),
+            "context_tokens_after": count_tokens(compact_context),
+            "prompt_tokens": count_tokens(prompt)
+        }
+        
         messages = [
-            {"role": "system", "content": planning_prompt.format(query=query, context=context)}
+            {"role": "system", "content": prompt}
         ]
         
-        response = self.llm.chat_completion(messages)
+        response = self.llm.chat_completion(messages, max_tokens=self.max_output_tokens)
         
         try:
             # Extract JSON from response
-            import json
             plan = json.loads(response)
-        except:
+            if not isinstance(plan, dict) or not isinstance(plan.get("agents_to_call"), list):
+                raise ValueError("plan has no agents_to_call list")
+            return plan, "llm", prompt_stats
+        except (ValueError, TypeError):
             # Fallback to rule-based planning
-            plan = self._rule_based_plan(query)
-        
-        # Log the planning decision
-        self.audit_logger.log_action(
-            session_id=session_id,
-            action_type="query_planning",
-            agent="planner",
-            input_data={"query": query, "context": context},
-            output_data=plan
-        )
-        
-        return plan
+            return self._rule_based_plan(query), "fallback", prompt_stats
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            tiers = {
+                tier: {"count": s["count"],
+                       "avg_ms": round(s["seconds"] / s["count"] * 1000, 3) if s["count"] else 0.0}
+                for tier, s in self.tier_stats.items()
+            }
+        return {"tiers": tiers, "templates": len(self.templates)}
     
     def _rule_based_plan(self, query: str) -> Dict[str, Any]:
         """Fallback rule-based planning"""
         query_lower = query.lower()
         
         if "approve" in query_lower:
-            return {
-                "query_type": "approval_request",
-                "agents_to_call": ["retriever", "verifier"],
-                "reasoning": "User requesting approval action",
-                "parameters": {"action": "approve"}
-            }
+            query_type = "approval_request"
         elif "invoice" in query_lower and ("flag" in query_lower or "why" in query_lower):
-            return {
-                "query_type": "invoice_analysis",
-                "agents_to_call": ["retriever", "po_matcher", "verifier"],
-                "reasoning": "Analyzing flagged invoice",
-                "parameters": {"analysis_type": "flagged_invoice"}
-            }
+            query_type = "invoice_analysis"
         else:
-            return {
-                "query_type": "general_inquiry",
-                "agents_to_call": ["retriever", "web_search", "verifier"],
-                "reasoning": "General inquiry requiring comprehensive search",
-                "parameters": {}
-            }
\ No newline at end of file
+            query_type = "general_inquiry"
+        return copy.deepcopy(PLAN_TEMPLATES[query_type])
@@ -1,21 +1,46 @@
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Optional, Tuple
 from core.llm_client import LLMClient
 from core.audit_logger import AuditLogger
 from agents.retriever import DocumentRetriever
+from core.line_alignment import align_lines, line_keys, received_quantities
 
 class POMatchingAgent:
     def __init__(self, llm_client: LLMClient, audit_logger: AuditLogger, retriever: DocumentRetriever):
         self.llm = llm_client
         self.audit_logger = audit_logger
         self.retriever = retriever
+        self.match_store = None  # Optional MatchResultStore serving precomputed results
     
     def match_invoice_to_po(self, invoice_id: str, session_id: str) -> Dict[str, Any]:
         """Match invoice to purchase orders and analyze discrepancies"""
         
+        if self.match_store is not None:
+            # Precomputed; only re-matched when the invoice, its PO or its GR changed
+            match_result = self.match_store.get(invoice_id)
+        else:
+            match_result = self.compute_match(invoice_id)
+        
+        if match_result is None:
+            return {"error": f"Invoice {invoice_id} not found"}
+        
+        # Log the matching process
+        self.audit_logger.log_action(
+            session_id=session_id,
+            action_type="po_matching",
+            agent="po_matcher",
+            input_data={"invoice_id": invoice_id},
+            output_data=match_result
+        )
+        
+        return match_result
+    
+    def compute_match(self, invoice_id: str) -> Optional[Dict[str, Any]]:
+        """Look up an invoice with its PO and goods receipt and run the three-way match"""
+        
         # Get invoice details
         invoice = self.retriever.get_specific_document(invoice_id, "invoices")
         if not invoice:
-            return {"error": f"Invoice {invoice_id} not found"}
+            return None
         
         # Get related PO
         po_id = invoice.get('po_reference')
@@ -27,24 +52,14 @@ class POMatchingAgent:
             goods_receipt = self.retriever.get_specific_document(po_id, "goods_receipts")
         
         # Perform matching analysis
-        match_result = self._analyze_three_way_match(invoice, purchase_order, goods_receipt)
-        
-        # Log the matching process
-        self.audit_logger.log_action(
-            session_id=session_id,
-            action_type="po_matching",
-            agent="po_matcher",
-            input_data={"invoice_id": invoice_id},
-            output_data=match_result
-        )
-        
-        return match_result
+        return self._analyze_three_way_match(invoice, purchase_order, goods_receipt)
     
     def _analyze_three_way_match(self, invoice: Dict, po: Dict = None, 
                                 gr: Dict = None) -> Dict[str, Any]:
         """Perform three-way matching analysis"""
         
         discrepancies = []
+        line_alignment = []
         match_score = 1.0
         
         if not po:
@@ -73,8 +88,11 @@ class POMatchingAgent:
         
         # Check line items
         if po and invoice:
-            line_item_issues = self._check_line_items(invoice.get('line_items', []), 
-                                                    po.get('line_items', []))
+            line_item_issues, line_alignment = self._check_line_items(
+                invoice.get('line_items', []),
+                po.get('line_items', []),
+                gr.get('received_items', []) if gr else None
+            )
             discrepancies.extend(line_item_issues)
             match_score -= len(line_item_issues) * 0.1
         
@@ -89,6 +107,7 @@ class POMatchingAgent:
             "goods_receipt": gr,
             "match_score": round(match_score, 2),
             "discrepancies": discrepancies,
+            "line_item_analysis": line_alignment,
             "flag_reason": flag_reason,
             "evidence": {
                 "invoice_amount": invoice.get('total_amount') if invoice else None,
@@ -97,20 +116,47 @@ class POMatchingAgent:
             }
         }
     
-    def _check_line_items(self, invoice_lines: List[Dict], po_lines: List[Dict]) -> List[str]:
-        """Check line item matching"""
+    def _check_line_items(self, invoice_lines: List[Dict], po_lines: List[Dict],
+                          received_items: List[Dict] = None) -> Tuple[List[str], List[Dict]]:
+        """Check line item matching; lines are paired by SKU/description rather than position"""
         issues = []
         
         if len(invoice_lines) != len(po_lines):
             issues.append(f"Line item count mismatch: Invoice has {len(invoice_lines)}, PO has {len(po_lines)}")
         
-        # Simple line matching - in production would be more sophisticated
-        for i, inv_line in enumerate(invoice_lines):
-            if i < len(po_lines):
-                po_line = po_lines[i]
-                if inv_line.get('quantity') != po_line.get('quantity'):
-                    issues.append(f"Quantity mismatch on line {i+1}")
-                if inv_line.get('unit_price') != po_line.get('unit_price'):
-                    issues.append(f"Unit price mismatch on line {i+1}")
+        alignment = align_lines(invoice_lines, po_lines)
+        received = received_quantities(received_items) if received_items is not None else None
         
-        return issues
\ No newline at end of file
+        for row in alignment:
+            n = row["invoice_line"]
+            if n is None:
+                continue  # PO line not invoiced (yet); covered by the count check
+            inv_line = invoice_lines[n - 1]
+            label = f"line {n} ({row['description']})"
+            
+            if row["match"] == "unmatched_invoice":
+                issues.append(f"No matching PO line for invoice {label}")
+            else:
+                if row["quantity_delta"]:
+                    issues.append(f"Quantity mismatch on {label}: {row['quantity_delta']:+g} vs PO line {row['po_line']}")
+                if row["unit_price_delta"]:
+                    issues.append(f"Unit price mismatch on {label}: {row['unit_price_delta']:+.2f} vs PO line {row['po_line']}")
+            
+            quantity, unit_price, total = (inv_line.get(f) for f in ('quantity', 'unit_price', 'total'))
+            if None not in (quantity, unit_price, total):
+                if abs(float(quantity) * float(unit_price) - float(total)) > 0.01:
+                    issues.append(f"Line total on {label} does not equal quantity x unit price")
+            
+            if received is not None and quantity is not None:
+                keys = line_keys(inv_line)
+                if row["po_line"]:
+                    keys += line_keys(po_lines[row["po_line"] - 1])
+                received_quantity = next((received[k] for k in keys if k in received), None)
+                row["received_quantity"] = received_quantity
+                if received_quantity is None:
+                    issues.append(f"No goods received for invoice {label}")
+                elif float(quantity) > received_quantity:
+                    issues.append(f"Invoiced quantity exceeds received on {label}: "
+                                  f"invoiced {float(quantity):g}, received {received_quantity:g}")
+        
+        return issues, alignment
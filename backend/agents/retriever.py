@@ -1,14 +1,16 @@
-import json
 import os
 from typing import Dict, List, Any, Optional
 from core.llm_client import LLMClient
 from core.audit_logger import AuditLogger
+from core.document_store import DocumentStore
 
 class DocumentRetriever:
     def __init__(self, llm_client: LLMClient, audit_logger: AuditLogger):
         self.llm = llm_client
         self.audit_logger = audit_logger
-        self.data_path = "data/"
+        self.data_path = os.getenv('DATA_DIR', 'data/')
+        self.store = DocumentStore(self.data_path)
+        self.rrf_k = 60  # Reciprocal-rank fusion constant
         
     def retrieve_documents(self, query: str, session_id: str, 
                           doc_types: List[str] = None) -> Dict[str, Any]:
@@ -24,11 +26,14 @@ class DocumentRetriever:
         }
         
         for doc_type in doc_types:
-            file_path = os.path.join(self.data_path, f"{doc_type}.json")
-            if os.path.exists(file_path):
+            file_path = self.store.file_path(doc_type)
+            if self.store.exists(doc_type):
                 docs = self._search_documents(file_path, query, doc_type)
                 results["documents"].extend(docs)
         
+        # Rank across document types, not just within each file
+        results["documents"].sort(key=lambda doc: doc["relevance_score"], reverse=True)
+        
         # Log retrieval
         self.audit_logger.log_action(
             session_id=session_id,
@@ -40,38 +45,26 @@ class DocumentRetriever:
         
         return results
     
-    def _search_documents(self, file_path: str, query: str, doc_type: str) -> List[Dict[str, Any]]:
-        """Search documents in a file"""
+    def _search_documents(self, file_path: str, query: str, doc_type: str,
+                          limit: int = 5) -> List[Dict[str, Any]]:
+        """Hybrid search of a file: BM25 and dense-vector rankings merged by reciprocal-rank fusion"""
         try:
-            with open(file_path, 'r') as f:
-                documents = json.load(f)
-            
-            relevant_docs = []
-            query_lower = query.lower()
-            
-            for doc in documents:
-                # Simple keyword matching - in production would use embeddings
-                doc_text = json.dumps(doc).lower()
-                if any(term in doc_text for term in query_lower.split()):
-                    doc["source_type"] = doc_type
-                    doc["source_file"] = file_path
-                    relevant_docs.append(doc)
-            
-            return relevant_docs[:5]  # Limit results
+            hits = self.store.hybrid_search(doc_type, query, k=limit, rrf_k=self.rrf_k)
+            # Copy so the store's cached documents are never mutated
+            return [dict(doc, source_type=doc_type, source_file=file_path,
+                         relevance_score=round(score, 4))
+                    for score, doc in hits]
             
         except Exception as e:
             return []
     
     def get_specific_document(self, doc_id: str, doc_type: str) -> Optional[Dict[str, Any]]:
-        """Get specific document by ID"""
-        file_path = os.path.join(self.data_path, f"{doc_type}.json")
+        """Get specific document by ID (goods receipts are also found by their po_reference)"""
         try:
-            with open(file_path, 'r') as f:
-                documents = json.load(f)
-            
-            for doc in documents:
-                if doc.get('id') == doc_id or doc.get('invoice_id') == doc_id or doc.get('po_id') == doc_id:
-                    return doc
-            return None
+            doc = self.store.get(doc_type, doc_id)
+            if doc is None:
+                matches = self.store.find_by(doc_type, "po_reference", doc_id)
+                doc = matches[0] if matches else None
+            return doc
         except:
-            return None
\ No newline at end of file
+            return None
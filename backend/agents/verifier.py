@@ -1,15 +1,133 @@
-from typing import Dict, List, Any
+from typing import Callable, Dict, List, Any, Optional, Tuple
 from core.llm_client import LLMClient
 from core.audit_logger import AuditLogger
+from core.prompt_compactor import compact_agent_results, count_tokens, to_prompt_json
+import json
+import os
+import re
+
+_JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+def _hex(digits: str) -> int:
+    try:
+        return int(digits, 16)
+    except ValueError:
+        return -1
+
+
+class JSONFieldStream:
+    """Decodes one string field of a JSON object while the object is still arriving in pieces.
+
+    feed() takes the next piece of raw text and returns the newly decoded part
+    of the field's value ("" until the field starts and once it has ended).
+    """
+
+    def __init__(self, field: str):
+        self._start = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._text = ""
+        self._pos = None  # Next undecoded character of the value, once found
+        self.done = False
+
+    def feed(self, delta: str) -> str:
+        self._text += delta
+        if self.done:
+            return ""
+        if self._pos is None:
+            match = self._start.search(self._text)
+            if match is None:
+                return ""
+            self._pos = match.end()
+        decoded = []
+        text, pos = self._text, self._pos
+        while pos < len(text):
+            char = text[pos]
+            if char == '"':
+                self.done = True
+                break
+            if char != '\\':
+                decoded.append(char)
+                pos += 1
+                continue
+            if pos + 1 >= len(text):
+                break  # Escape split across pieces: wait for the rest
+            code = text[pos + 1]
+            if code == 'u':
+                if pos + 6 > len(text):
+                    break
+                point = _hex(text[pos + 2:pos + 6])
+                if 0xD800 <= point < 0xDC00:
+                    # A high surrogate combines with the low one escaped right after it
+                    if pos + 12 > len(text):
+                        break
+                    low = _hex(text[pos + 8:pos + 12]) if text[pos + 6:pos + 8] == '\\u' else -1
+                    if 0xDC00 <= low < 0xE000:
+                        point = 0x10000 + ((point - 0xD800) << 10) + (low - 0xDC00)
+                        pos += 6
+                decoded.append(chr(point) if point >= 0 else '\ufffd')
+                pos += 6
+            else:
+                decoded.append(_JSON_ESCAPES.get(code, code))
+                pos += 2
+        self._pos = pos
+        return "".join(decoded)
+
 
 class ResultVerifier:
     def __init__(self, llm_client: LLMClient, audit_logger: AuditLogger):
         self.llm = llm_client
         self.audit_logger = audit_logger
         self.confidence_threshold = 0.7
+        self.max_output_tokens = 400
+        self.token_budgets = None  # Per-agent prompt budgets; None uses the compactor defaults
+        # Rule confidence in [low, high) is too close to call and goes to the LLM
+        self.ambiguity_band = (float(os.getenv('VERIFIER_ESCALATE_MIN', 0.4)),
+                               float(os.getenv('VERIFIER_ESCALATE_MAX', 0.75)))
     
-    def verify_results(self, agent_results: Dict[str, Any], session_id: str) -> Dict[str, Any]:
-        """Verify and synthesize results from multiple agents"""
+    def verify_results(self, agent_results: Dict[str, Any], session_id: str,
+                       on_summary_token: Callable[[str], None] = None) -> Dict[str, Any]:
+        """Verify and synthesize results from multiple agents.
+
+        Confidence comes from deterministic rules over the agent outputs; the LLM is
+        consulted only when a three-way match result lands inside the ambiguity band.
+        Results without one (retrieval only) are always decided by the rules. The result's `tier`
+        says which produced it: "rules", "llm" or "rules_fallback" (unusable LLM reply).
+        With on_summary_token, the LLM reply is streamed and the text of its summary
+        is passed on piece by piece as it is generated.
+        """
+        verification = self._rule_based_verification(agent_results)
+        rule_confidence = verification["confidence"]
+        metadata = {"rule_confidence": rule_confidence}
+        tier = "rules"
+        
+        low, high = self.ambiguity_band
+        if "po_matching" in agent_results and low <= rule_confidence < high:
+            llm_verification, prompt_stats = self._llm_verification(agent_results, on_summary_token)
+            metadata["prompt_stats"] = prompt_stats
+            if llm_verification is not None:
+                verification, tier = llm_verification, "llm"
+            else:
+                tier = "rules_fallback"
+        
+        verification["tier"] = tier
+        # Add confidence-based routing
+        verification["requires_human_review"] = verification.get("confidence", 0) < self.confidence_threshold
+        
+        # Log verification
+        self.audit_logger.log_action(
+            session_id=session_id,
+            action_type="result_verification",
+            agent="verifier",
+            input_data=agent_results,
+            output_data=verification,
+            metadata=dict(metadata, tier=tier)
+        )
+        
+        return verification
+    
+    def _llm_verification(self, agent_results: Dict[str, Any], on_summary_token: Callable[[str], None] = None
+                          ) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+        """Ask the LLM for a verification; None when its reply is not a usable verdict"""
         
         verification_prompt = """
         You are a result verifier for an invoice-PO matching system. 
@@ -25,63 +143,102 @@ class ResultVerifier:
         Respond in JSON format with fields: confidence, summary, risks, recommendations, conflicts
         """
         
+        # Only decision-relevant fields go to the LLM, deduplicated and within per-agent budgets
+        compact_results, prompt_stats = compact_agent_results(agent_results, self.token_budgets)
+        prompt = verification_prompt.format(results=to_prompt_json(compact_results))
+        prompt_stats["prompt_tokens"] = count_tokens(prompt)
+        
         messages = [
-            {"role": "system", "content": verification_prompt.format(results=str(agent_results))}
+            {"role": "system", "content": prompt}
         ]
         
-        verification_text = self.llm.chat_completion(messages)
+        if on_summary_token is None:
+            verification_text = self.llm.chat_completion(messages, max_tokens=self.max_output_tokens)
+        else:
+            summary = JSONFieldStream("summary")
+            parts = []
+            for delta in self.llm.stream_chat_completion(messages, max_tokens=self.max_output_tokens):
+                parts.append(delta)
+                text = summary.feed(delta)
+                if text:
+                    on_summary_token(text)
+            verification_text = "".join(parts)
         
         # Parse verification results
         try:
-            import json
             verification = json.loads(verification_text)
-        except:
-            # Fallback verification
-            verification = self._fallback_verification(agent_results)
-        
-        # Add confidence-based routing
-        verification["requires_human_review"] = verification.get("confidence", 0) < self.confidence_threshold
-        
-        # Log verification
-        self.audit_logger.log_action(
-            session_id=session_id,
-            action_type="result_verification",
-            agent="verifier",
-            input_data=agent_results,
-            output_data=verification
-        )
-        
-        return verification
+            confidence = float(verification["confidence"])
+        except (ValueError, TypeError, KeyError):
+            return None, prompt_stats
+        verification["confidence"] = round(min(1.0, max(0.0, confidence)), 2)
+        return verification, prompt_stats
     
-    def _fallback_verification(self, results: Dict[str, Any]) -> Dict[str, Any]:
-        """Fallback verification logic"""
+    def _rule_based_verification(self, results: Dict[str, Any]) -> Dict[str, Any]:
+        """Deterministic verification from the nested agent outputs"""
         
-        confidence = 0.8  # Default confidence
+        confidence = 0.6  # Documents alone are suggestive, not conclusive
         risks = []
         recommendations = []
+        conflicts = []
+        discrepancies = []
+        
+        po_result = results.get("po_matching")
+        documents = results.get("retrieval", {}).get("documents", [])
         
-        # Check match score if available
-        if "match_score" in results:
-            match_score = results["match_score"]
-            confidence = match_score
-            
-            if match_score < 0.5:
-                risks.append("Low match score indicates significant discrepancies")
+        if po_result is not None:
+            if "error" in po_result:
+                confidence = 0.2
+                risks.append(f"PO matching failed: {po_result['error']}")
                 recommendations.append("Manual review required before approval")
-            elif match_score < 0.8:
-                risks.append("Moderate discrepancies found")
-                recommendations.append("Supervisor approval recommended")
+            else:
+                # Check match score
+                match_score = po_result.get("match_score", 0)
+                confidence = match_score
+                discrepancies = po_result.get("discrepancies", [])
+                
+                if match_score < 0.5:
+                    risks.append("Low match score indicates significant discrepancies")
+                    recommendations.append("Manual review required before approval")
+                elif match_score < 0.8:
+                    risks.append("Moderate discrepancies found")
+                    recommendations.append("Supervisor approval recommended")
+                
+                # Check discrepancies
+                if len(discrepancies) > 2:
+                    confidence *= 0.8
+                    risks.append("Multiple discrepancies detected")
+                
+                invoice = po_result.get("invoice") or {}
+                if invoice.get("status") == "approved" and discrepancies:
+                    conflicts.append("Invoice is marked approved but the three-way match found discrepancies")
+                if invoice.get("status") == "flagged" and not discrepancies:
+                    conflicts.append("Invoice is flagged but the three-way match found no discrepancies")
+        elif not documents:
+            confidence = 0.3
+            risks.append("No supporting documents found")
+            recommendations.append("Provide a specific invoice or PO ID")
         
-        # Check discrepancies
-        discrepancies = results.get("discrepancies", [])
-        if len(discrepancies) > 2:
+        web_result = results.get("web_search") or {}
+        vendor_data = web_result.get("data") or {}
+        if "error" in web_result:
+            risks.append(f"Vendor check unavailable: {web_result['error']}")
+        elif vendor_data.get("risk_level") == "high" or vendor_data.get("status") == "flagged":
             confidence *= 0.8
-            risks.append("Multiple discrepancies detected")
+            risks.append(f"Vendor {web_result.get('vendor', '')} is rated high risk")
+            recommendations.append("Review vendor compliance before payment")
+        
+        if conflicts:
+            confidence *= 0.9
+        
+        if po_result is not None and "error" not in po_result:
+            summary = f"Analysis complete with {len(discrepancies)} discrepancies found"
+        else:
+            summary = f"Analysis based on {len(documents)} retrieved documents"
         
         return {
             "confidence": round(confidence, 2),
-            "summary": f"Analysis complete with {len(discrepancies)} discrepancies found",
+            "summary": summary,
             "risks": risks,
             "recommendations": recommendations,
-            "conflicts": []
-        }
\ No newline at end of file
+            "conflicts": conflicts
+        }
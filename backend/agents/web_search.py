@@ -1,68 +1,114 @@
+import os
 import requests
-from typing import Dict, List, Any
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, Any, Optional
+from urllib.parse import quote
 from core.llm_client import LLMClient
 from core.audit_logger import AuditLogger
+from core.vendor_cache import VendorRiskCache
+
+# Simulate different vendor scenarios
+MOCK_VENDOR_DB = {
+    "Acme Corp": {
+        "status": "verified",
+        "compliance_score": 85,
+        "risk_level": "low",
+        "last_audit": "2024-01-15",
+        "issues": []
+    },
+    "Suspicious Vendor LLC": {
+        "status": "flagged",
+        "compliance_score": 45,
+        "risk_level": "high",
+        "last_audit": "2023-06-10",
+        "issues": ["Payment delays", "Quality complaints"]
+    }
+}
+
+DEFAULT_ASSESSMENT = {
+    "status": "unknown",
+    "compliance_score": 70,
+    "risk_level": "medium",
+    "last_audit": "N/A",
+    "issues": []
+}
+
+
+class MockVendorBackend:
+    """Mock vendor search - in production would use actual search API"""
+
+    def __call__(self, vendor_name: str) -> Optional[Dict[str, Any]]:
+        if vendor_name in MOCK_VENDOR_DB:
+            return {"data": MOCK_VENDOR_DB[vendor_name], "source": "mock_vendor_database"}
+        return {"data": DEFAULT_ASSESSMENT, "source": "default_assessment"}
+
+
+class HTTPVendorBackend:
+    """Vendor risk API client over pooled keep-alive connections: GET {base_url}/vendors/{name}"""
+
+    def __init__(self, base_url: str, timeout: float = None, pool_size: int = 16):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout or float(os.getenv('VENDOR_API_TIMEOUT', 5))
+        self.pool_size = pool_size
+        self._session: Optional[requests.Session] = None
+        self._session_pid = None
+
+    def _http_session(self) -> requests.Session:
+        # Connections must not be shared across a fork
+        if self._session is None or self._session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session, self._session_pid = session, os.getpid()
+        return self._session
+
+    def __call__(self, vendor_name: str) -> Optional[Dict[str, Any]]:
+        response = self._http_session().get(f"{self.base_url}/vendors/{quote(vendor_name, safe='')}",
+                                            timeout=self.timeout)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return {"data": response.json(), "source": "vendor_api"}
+
+
+def default_vendor_backend():
+    """HTTP backend when VENDOR_API_URL is set, otherwise the local mock"""
+    base_url = os.getenv('VENDOR_API_URL')
+    return HTTPVendorBackend(base_url) if base_url else MockVendorBackend()
+
 
 class WebSearchAgent:
-    def __init__(self, llm_client: LLMClient, audit_logger: AuditLogger):
+    def __init__(self, llm_client: LLMClient, audit_logger: AuditLogger,
+                 backend=None, cache: VendorRiskCache = None):
         self.llm = llm_client
         self.audit_logger = audit_logger
-    
+        self.backend = backend or default_vendor_backend()
+        self.cache = cache or VendorRiskCache(self.backend)
+
     def search_vendor_info(self, vendor_name: str, session_id: str) -> Dict[str, Any]:
         """Search for vendor information online"""
-        
-        # Mock web search - in production would use actual search API
-        mock_results = self._mock_vendor_search(vendor_name)
-        
+
+        try:
+            hit = self.cache.get(vendor_name)
+            if hit is None:
+                results = {"vendor": vendor_name, "found": False, "data": None, "source": "not_found"}
+            else:
+                results = {"vendor": vendor_name, "found": True, "data": hit["data"], "source": hit["source"]}
+        except Exception as e:
+            results = {"vendor": vendor_name, "found": False, "error": f"Vendor lookup failed: {e}"}
+
         # Log search
         self.audit_logger.log_action(
             session_id=session_id,
             action_type="web_search",
             agent="web_search",
             input_data={"vendor": vendor_name},
-            output_data=mock_results
+            output_data=results
         )
-        
-        return mock_results
-    
-    def _mock_vendor_search(self, vendor_name: str) -> Dict[str, Any]:
-        """Mock vendor search results"""
-        
-        # Simulate different vendor scenarios
-        mock_db = {
-            "Acme Corp": {
-                "status": "verified",
-                "compliance_score": 85,
-                "risk_level": "low",
-                "last_audit": "2024-01-15",
-                "issues": []
-            },
-            "Suspicious Vendor LLC": {
-                "status": "flagged",
-                "compliance_score": 45,
-                "risk_level": "high",
-                "last_audit": "2023-06-10",
-                "issues": ["Payment delays", "Quality complaints"]
-            }
-        }
-        
-        if vendor_name in mock_db:
-            return {
-                "vendor": vendor_name,
-                "found": True,
-                "data": mock_db[vendor_name],
-                "source": "mock_vendor_database"
-            }
-        else:
-            return {
-                "vendor": vendor_name,
-                "found": True,
-                "data": {
-                    "status": "unknown",
-                    "compliance_score": 70,
-                    "risk_level": "medium",
-                    "last_audit": "N/A",
-                    "issues": []
-                },
-                "source": "default_assessment"
-            }
\ No newline at end of file
+
+        return results
+
+    def prefetch_vendors(self, vendors: List[str]) -> Dict[str, Any]:
+        """Warm the cache for the given vendors (e.g. every vendor with an invoice)"""
+        return self.cache.prefetch(vendors)
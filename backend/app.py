@@ -1,25 +1,38 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
+import io
+import itertools
+import json
 import os
+import queue
+import sys
+import threading
 from dotenv import load_dotenv
 
 from core.llm_client import LLMClient
-from core.memory import ConversationMemory
+from core.memory import create_memory
 from core.audit_logger import AuditLogger
+from core.plan_executor import AgentTask, PlanExecutor
+from core.ingest import SCHEMAS, DocumentIngester, format_for, read_records
+from core.json_provider import FastJSONProvider
+from core.response_profile import PROFILES, parse_fields, shape_response, stage_summary
 from agents.planner import QueryPlanner
 from agents.retriever import DocumentRetriever
 from agents.po_matcher import POMatchingAgent
 from agents.web_search import WebSearchAgent
 from agents.verifier import ResultVerifier
+from agents.batch_matcher import BatchMatchingEngine
+from agents.match_store import DOC_TYPES, MatchResultStore
 
 load_dotenv()
 
 app = Flask(__name__, static_folder='../frontend/static/', static_url_path='')
+app.json = FastJSONProvider(app)
 CORS(app)
 
 # Initialize components
 llm_client = LLMClient()
-memory = ConversationMemory()
+memory = create_memory()
 audit_logger = AuditLogger()
 
 # Initialize agents
@@ -28,6 +41,40 @@ planner = QueryPlanner(llm_client, audit_logger)
 po_matcher = POMatchingAgent(llm_client, audit_logger, retriever)
 web_search = WebSearchAgent(llm_client, audit_logger)
 verifier = ResultVerifier(llm_client, audit_logger)
+batch_matcher = BatchMatchingEngine(retriever, audit_logger)
+plan_executor = PlanExecutor(timeouts={"retriever": 10.0, "po_matcher": 15.0, "web_search": 10.0})
+
+# Serve PO-matching answers from precomputed results, invalidated when documents change
+match_store = MatchResultStore(po_matcher)
+po_matcher.match_store = match_store
+
+# Bulk uploads go straight into the retriever's store, indexed as they are appended
+ingester = DocumentIngester(retriever.store)
+
+def invoice_vendors() -> set:
+    """Every vendor that has an invoice on file"""
+    return {invoice.get("vendor") for invoice in retriever.store.documents("invoices") if invoice.get("vendor")}
+
+def preload() -> dict:
+    """Load documents and indexes, materialize match results and fetch vendor risk data, synchronously.
+
+    serve.py calls this before forking its workers, so they share it all copy-on-write."""
+    counts = retriever.store.preload(DOC_TYPES)
+    match_store.build()
+    match_store.ready.set()
+    web_search.prefetch_vendors(invoice_vendors())
+    return counts
+
+def start_background_tasks(warm: bool = True):
+    """Start the match store's invalidation thread and the daily vendor prefetch (warming the cache
+    now unless warm is False). Threads do not survive a fork: pre-forked workers call this again."""
+    match_store.start()
+    # Warm vendor risk data at startup and again daily before the business day
+    web_search.cache.schedule_prefetch(invoice_vendors, at=os.getenv('VENDOR_PREFETCH_AT', '06:00'), run_now=warm)
+
+# serve.py preloads and starts these itself, in its workers rather than in the pre-fork parent
+if os.getenv('APP_PREFORK') != '1':
+    start_background_tasks()
 
 @app.route('/')
 def index():
@@ -39,52 +86,123 @@ def static_files(filename):
     """Serve static files"""
     return send_from_directory('../frontend/static/', filename)
 
+class QueryCancelled(Exception):
+    """Raised inside a streamed query's pipeline once its client has disconnected"""
+
+def query_options(data: dict):
+    """(query, session_id, profile, fields) of a query request, or an error message for a bad profile"""
+    # Response shape: a profile (minimal/standard/debug) or explicit field paths such as "agent_results.po_matching"
+    profile = data.get('profile') or request.args.get('profile') or os.getenv('RESPONSE_PROFILE', 'standard')
+    fields = parse_fields(data.get('fields') or request.args.get('fields'))
+    if profile not in PROFILES:
+        return None, f"Unknown profile '{profile}'; expected one of {sorted(PROFILES)}"
+    return (data.get('query', ''), data.get('session_id', ''), profile, fields), None
+
 @app.route('/api/query', methods=['POST'])
 def handle_query():
     """Main query endpoint"""
-    data = request.json
-    query = data.get('query', '')
-    session_id = data.get('session_id', '')
+    options, error = query_options(request.json)
+    if error:
+        return jsonify({"error": error}), 400
+    return jsonify(run_query(*options))
+
+@app.route('/api/query/stream', methods=['POST'])
+def handle_query_stream():
+    """Main query endpoint as server-sent events, one per stage as it completes:
+    session, plan, retrieval, po_matching, web_search, verification (plus token events carrying
+    the verifier's summary while the LLM writes it) and final, the response /api/query returns"""
+    options, error = query_options(request.json)
+    if error:
+        return jsonify({"error": error}), 400
+    events = queue.Queue()
+    disconnected = threading.Event()
     
+    def emit(event: str, data):
+        # Raising here stops the pipeline at its next stage (or summary token) once nobody is listening
+        if disconnected.is_set():
+            raise QueryCancelled()
+        events.put((event, data))
+    
+    def pipeline():
+        try:
+            emit("final", run_query(*options, emit=emit))
+        except QueryCancelled:
+            pass
+        except Exception as e:
+            if not disconnected.is_set():
+                events.put(("error", {"error": f"Query failed: {e}"}))
+        finally:
+            events.put(None)
+    
+    # The pipeline runs on its own thread so each stage can be sent while later ones are still working
+    threading.Thread(target=pipeline, name="query-stream", daemon=True).start()
+    
+    def stream():
+        try:
+            while True:
+                item = events.get()
+                if item is None:
+                    return
+                event, data = item
+                yield f"event: {event}\ndata: {app.json.dumps(data)}\n\n"
+        finally:
+            disconnected.set()  # The server closes the response when the client goes away
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def run_query(query: str, session_id: str, profile: str = "standard", fields: list = None, emit=None) -> dict:
+    """Plan, run the agents, verify and synthesize; emit(event, data) is told about each stage as it completes"""
+    fields = fields or []
     if not session_id:
         session_id = memory.create_session()
+    if emit:
+        emit("session", {"session_id": session_id})
     
     # Get conversation context
     context = memory.get_context(session_id)
     
     # Plan the query
     plan = planner.plan_query(query, session_id, context)
+    if emit:
+        emit("plan", plan if profile == "debug" else {"query_type": plan.get("query_type"),
+                                                       "agents_to_call": plan.get("agents_to_call", [])})
     
-    # Execute plan
-    agent_results = {}
-    
-    if "retriever" in plan.get("agents_to_call", []):
-        agent_results["retrieval"] = retriever.retrieve_documents(query, session_id)
+    def on_finish(task, report, result):
+        if emit:
+            emit(task.result_key, dict(report, result=result if profile == "debug"
+                                       else stage_summary(task.result_key, result)))
     
-    if "po_matcher" in plan.get("agents_to_call", []):
-        # Extract invoice ID from query
-        invoice_id = extract_invoice_id(query)
-        if invoice_id:
-            agent_results["po_matching"] = po_matcher.match_invoice_to_po(invoice_id, session_id)
-    
-    if "web_search" in plan.get("agents_to_call", []):
-        # Extract vendor from results or query
-        vendor = extract_vendor_name(query, agent_results)
-        if vendor:
-            agent_results["web_search"] = web_search.search_vendor_info(vendor, session_id)
+    # Execute plan: independent agents run concurrently, web search waits for the PO match's vendor
+    agent_results, execution = plan_executor.run(build_agent_tasks(query, session_id, plan), on_finish)
+    audit_logger.log_action(
+        session_id=session_id,
+        action_type="plan_execution",
+        agent="system",
+        input_data={"agents_to_call": plan.get("agents_to_call", [])},
+        output_data=execution
+    )
     
     # Verify results
-    verification = verifier.verify_results(agent_results, session_id)
+    on_summary_token = (lambda text: emit("token", {"stage": "verification", "text": text})) if emit else None
+    verification = verifier.verify_results(agent_results, session_id, on_summary_token)
+    if emit:
+        emit("verification", verification if profile == "debug" else {
+            key: verification.get(key) for key in ("confidence", "requires_human_review", "tier", "summary")})
     
     # Synthesize final response
     final_response = synthesize_response(query, agent_results, verification, plan)
+    final_response["debug_info"]["execution"] = execution
     final_response["session_id"] = session_id
-    final_response["audit_trail"] = audit_logger.get_session_logs(session_id)
+    final_response["audit_url"] = f"/api/audit/{session_id}"
+    # The whole trail grows with every turn: inline it only when asked for, otherwise page through audit_url
+    if (profile == "debug" and not fields) or any(f.split(".")[0] == "audit_trail" for f in fields):
+        final_response["audit_trail"] = audit_logger.get_session_logs(session_id)
     
     # Store in memory
     memory.add_interaction(session_id, query, final_response)
     
-    return jsonify(final_response)
+    return shape_response(final_response, profile, fields)
 
 @app.route('/api/approve', methods=['POST'])
 def approve_invoice():
@@ -111,6 +229,135 @@ def approve_invoice():
     
     return jsonify(response)
 
+@app.route('/api/match/batch', methods=['POST'])
+def batch_match():
+    """Three-way match all open invoices (or a filtered set), streamed back as NDJSON"""
+    data = request.json or {}
+    for field in ('invoice_ids', 'statuses'):
+        value = data.get(field)
+        if value is not None and not (isinstance(value, list) and all(isinstance(item, str) for item in value)):
+            return jsonify({"error": f"{field} must be a list of strings"}), 400
+    if data.get('vendor') is not None and not isinstance(data['vendor'], str):
+        return jsonify({"error": "vendor must be a string"}), 400
+    session_id = data.get('session_id') or memory.create_session()
+    
+    results = batch_matcher.run(
+        session_id,
+        invoice_ids=data.get('invoice_ids'),
+        vendor=data.get('vendor'),
+        statuses=data.get('statuses')
+    )
+    return Response((json.dumps(result) + '\n' for result in results),
+                    mimetype='application/x-ndjson')
+
+@app.route('/api/ingest/<doc_type>', methods=['POST'])
+def ingest_documents(doc_type):
+    """Stream a CSV or JSONL upload (request body or multipart file) into invoices, purchase_orders
+    or goods_receipts; ?format= overrides the format implied by the file name or content type"""
+    if doc_type not in SCHEMAS:
+        return jsonify({"error": f"Unknown document type '{doc_type}'; expected one of {sorted(SCHEMAS)}"}), 404
+    upload = next(iter(request.files.values()), None)
+    fmt = request.args.get('format') or format_for(upload.filename if upload else None,
+                                                   upload.content_type if upload else request.content_type)
+    if fmt not in ("csv", "jsonl"):
+        return jsonify({"error": "Upload format must be csv or jsonl (set ?format= or the content type)"}), 400
+    # Read incrementally: the upload is never held in memory as a whole
+    stream = io.TextIOWrapper(upload.stream if upload else request.stream, encoding='utf-8', newline='')
+    report = ingester.ingest(doc_type, read_records(stream, fmt))
+    audit_logger.log_action(
+        session_id=request.args.get('session_id', ''),
+        action_type="document_ingestion",
+        agent="system",
+        input_data={"doc_type": doc_type, "format": fmt},
+        output_data={key: value for key, value in report.items() if key != "errors"}
+    )
+    return jsonify(report)
+
+@app.route('/api/vendors/prefetch', methods=['POST'])
+def prefetch_vendors():
+    """Refresh cached risk data for the given vendors, or for every vendor with an invoice"""
+    data = request.json or {}
+    return jsonify(web_search.prefetch_vendors(data.get('vendors') or invoice_vendors()))
+
+def int_arg(name: str, default: int, low: int, high: int):
+    """(query parameter clamped to [low, high], None), or (None, error message) when it is not an integer"""
+    value = request.args.get(name)
+    if value is None:
+        return default, None
+    try:
+        return min(max(int(value), low), high), None
+    except ValueError:
+        return None, f"'{name}' must be an integer, got '{value}'"
+
+@app.route('/api/audit/query', methods=['GET'])
+def query_audit_log():
+    """Audit entries filtered by time range (ISO timestamps; a date-only end covers that day), agent,
+    action_type and session_id"""
+    limit, error = int_arg('limit', 100, 0, 1000)
+    if error:
+        return jsonify({"error": error}), 400
+    entries = audit_logger.query(
+        start=request.args.get('start'),
+        end=request.args.get('end'),
+        agent=request.args.get('agent'),
+        action_type=request.args.get('action_type'),
+        session_id=request.args.get('session_id')
+    )
+    return jsonify({"entries": list(itertools.islice(entries, limit)), "limit": limit})
+
+@app.route('/api/audit/<session_id>', methods=['GET'])
+def session_audit_trail(session_id):
+    """A page of the session's audit trail: offset, limit (max 1000) and order (asc, or desc for newest first)"""
+    offset, error = int_arg('offset', 0, 0, sys.maxsize)
+    if error is None:
+        limit, error = int_arg('limit', 50, 1, 1000)
+    if error:
+        return jsonify({"error": error}), 400
+    newest_first = request.args.get('order', 'asc') == 'desc'
+    entries, total, skipped = audit_logger.get_session_page(session_id, offset, limit, newest_first)
+    next_offset = offset + limit if offset + limit < total else None
+    # "skipped": entries of this page that could not be read back, so len(entries) < limit even mid-trail
+    return jsonify({"session_id": session_id, "entries": entries, "offset": offset, "limit": limit,
+                    "total": total, "next_offset": next_offset, "skipped": skipped})
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Cache and store counters"""
+    return jsonify({
+        "llm_cache": llm_client.cache.get_stats(),
+        "llm_inflight": llm_client.inflight.get_stats(),
+        "planner": planner.get_stats(),
+        "match_store": match_store.get_stats(),
+        "vendor_cache": web_search.cache.get_stats(),
+        "audit_log": audit_logger.get_stats(),
+        "memory": memory.get_stats()
+    })
+
+def build_agent_tasks(query: str, session_id: str, plan: dict) -> list:
+    """Turn the plan's agents_to_call into executor tasks with their data dependencies"""
+    agents_to_call = plan.get("agents_to_call", [])
+    tasks = []
+    
+    if "retriever" in agents_to_call:
+        tasks.append(AgentTask("retriever", "retrieval",
+                               lambda results: retriever.retrieve_documents(query, session_id)))
+    
+    if "po_matcher" in agents_to_call:
+        # Extract invoice ID from query
+        invoice_id = extract_invoice_id(query)
+        if invoice_id:
+            tasks.append(AgentTask("po_matcher", "po_matching",
+                                   lambda results: po_matcher.match_invoice_to_po(invoice_id, session_id)))
+    
+    if "web_search" in agents_to_call:
+        def search(results):
+            # Extract vendor from results or query
+            vendor = extract_vendor_name(query, results)
+            return web_search.search_vendor_info(vendor, session_id) if vendor else None
+        tasks.append(AgentTask("web_search", "web_search", search, depends_on=("po_matcher",)))
+    
+    return tasks
+
 def extract_invoice_id(query: str) -> str:
     """Extract invoice ID from query"""
     import re
@@ -129,6 +376,7 @@ def synthesize_response(query: str, agent_results: dict, verification: dict, pla
     explanation = "Query processed successfully."
     evidence = {}
     match_score = 0
+    invoice_id = None
     
     # Debug information
     debug_info = {
@@ -159,9 +407,10 @@ def synthesize_response(query: str, agent_results: dict, verification: dict, pla
                 explanation = f"Invoice analysis complete. {flag_reason}. No discrepancies found."
             
             evidence = po_result.get("evidence", {})
+            invoice_id = (po_result.get("invoice") or {}).get("invoice_id")
     else:
         # If no PO matching was done, explain why
-        if "retriever" in agent_results:
+        if "retrieval" in agent_results:
             retrieval_result = agent_results["retrieval"]
             doc_count = len(retrieval_result.get("documents", []))
             explanation = f"Document retrieval completed. Found {doc_count} relevant documents."
@@ -184,6 +433,8 @@ def synthesize_response(query: str, agent_results: dict, verification: dict, pla
         "verifier_confidence": verification.get("confidence", 0),
         "requires_human_review": verification.get("requires_human_review", False),
         "recommendations": verification.get("recommendations", []),
+        "invoice_id": invoice_id,
+        "query_type": plan.get("query_type", "unknown"),
         "query_plan": plan,
         "agent_results": agent_results,
         "debug_info": debug_info  # Add debug information
@@ -1,39 +1,460 @@
+import atexit
 import json
-from datetime import datetime
-from typing import Dict, Any, List
+import queue
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Union
 import os
+import re
+import threading
+import time
+import weakref
+from core.audit_segments import AuditSegments, entry_matches
+from core.blob_store import BlobStore
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; the index is then only safe within one process
+    fcntl = None
+
+# fsync policies: after every batch, at most once per AUDIT_FSYNC_INTERVAL seconds, or leave it to the OS
+FSYNC_POLICIES = ("always", "interval", "never")
+
+_STOP = object()
+
+# Every entry starts with its timestamp, so a segment's age can be read from its first bytes
+_FIRST_TIMESTAMP = re.compile(rb'"timestamp": "([^"]+)"')
 
 class AuditLogger:
-    def __init__(self, log_file: str = "audit.jsonl"):
-        self.log_file = log_file
-        
-    def log_action(self, session_id: str, action_type: str, agent: str, 
-                   input_data: Dict[str, Any], output_data: Dict[str, Any], 
+    """Append-only JSONL audit log.
+
+    Nested objects of at least AUDIT_BLOB_MIN_BYTES are written once to a
+    content-addressed blob store and referenced from entries by hash; reads
+    return entries with the references resolved.
+
+    Entries are serialized in the caller and handed to a background writer that
+    group-commits them: one append per batch of up to `batch_size` entries or
+    `batch_ms` milliseconds, fsynced according to `fsync_policy`. The queue is
+    bounded, so a stalled disk slows callers down instead of growing memory.
+    `flush()` is a barrier: it returns once everything logged before it is written.
+
+    The log is segmented: `log_file` is the active segment, rolled into
+    `<stem>_segments/` once it reaches `segment_bytes` or `segment_seconds` of
+    age, then compressed there. `get_session_logs` and `query` read across
+    all segments, opening only those the manifest says can match.
+    """
+
+    def __init__(self, log_file: str = None, batch_size: int = None, batch_ms: float = None,
+                 fsync_policy: str = None, queue_size: int = None,
+                 segment_bytes: int = None, segment_seconds: float = None):
+        self.log_file = log_file or os.getenv('AUDIT_LOG_FILE', 'audit.jsonl')
+        self.segment_bytes = segment_bytes or int(os.getenv('AUDIT_SEGMENT_BYTES', 64 * 1024 * 1024))
+        self.segment_seconds = segment_seconds or float(os.getenv('AUDIT_SEGMENT_SECONDS', 24 * 3600))
+        stem = os.path.splitext(self.log_file)[0]
+        self.segments = AuditSegments(stem + "_segments")
+        # Large nested payloads (documents, match results) are stored once and referenced by hash
+        self.blobs = BlobStore(stem + "_blobs.sqlite")
+        self._segment_started: Dict[int, Optional[datetime]] = {}  # inode -> first entry's timestamp
+        self.batch_size = batch_size or int(os.getenv('AUDIT_BATCH_SIZE', 256))
+        self.batch_ms = batch_ms if batch_ms is not None else float(os.getenv('AUDIT_BATCH_MS', 5))
+        self.fsync_policy = fsync_policy or os.getenv('AUDIT_FSYNC', 'interval')
+        if self.fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {self.fsync_policy!r}, expected one of {FSYNC_POLICIES}")
+        self.fsync_interval = float(os.getenv('AUDIT_FSYNC_INTERVAL', 1.0))
+        self.queue_size = queue_size or int(os.getenv('AUDIT_QUEUE_SIZE', 10000))
+        self._queue: Optional[queue.Queue] = None
+        self._writer: Optional[threading.Thread] = None
+        self._writer_pid = None
+        self._writer_lock = threading.Lock()
+        self._atexit_registered = False
+        self.stats = {"entries": 0, "batches": 0, "fsyncs": 0, "write_errors": 0, "rolls": 0}
+        # Sidecar index of the active segment: an {"inode": n} header, then one JSON line
+        # [session_id, offset, length] per log entry, in log order
+        self.index_file = self.log_file + ".idx"
+        self._offsets: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._indexed_inode = None
+        self._index_pos = 0  # Bytes of the index file already loaded
+        self._indexed_upto = 0  # Bytes of the log covered by the index
+        self._index_lock = threading.Lock()
+        # A fork can happen while another thread holds one of the locks; the child must not inherit that
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: ref() and ref()._after_fork())
+
+    def _after_fork(self):
+        self._writer_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+
+    def log_action(self, session_id: str, action_type: str, agent: str,
+                   input_data: Dict[str, Any], output_data: Dict[str, Any],
                    metadata: Dict[str, Any] = None):
         """Log agent action with full context"""
+        blobs: Dict[str, str] = {}
         log_entry = {
             "timestamp": datetime.now().isoformat(),
             "session_id": session_id,
             "action_type": action_type,
             "agent": agent,
-            "input": input_data,
-            "output": output_data,
-            "metadata": metadata or {}
+            "input": self.blobs.dedupe(input_data, blobs),
+            "output": self.blobs.dedupe(output_data, blobs),
+            "metadata": self.blobs.dedupe(metadata or {}, blobs)
         }
-        
-        with open(self.log_file, 'a') as f:
-            f.write(json.dumps(log_entry) + '\n')
-    
+
+        # Serialized now: the caller may keep mutating these dicts after we return.
+        # New blobs travel with the entry; the writer stores them before writing it
+        self._writer_queue().put(((json.dumps(log_entry) + '\n').encode('utf-8'), blobs))
+
+    def _writer_queue(self) -> queue.Queue:
+        """The queue of this process's writer thread, started on first use (and again after a fork)"""
+        if self._writer_pid != os.getpid():
+            with self._writer_lock:
+                if self._writer_pid != os.getpid():
+                    # Entries left in a parent's queue are the parent's to write
+                    self._queue = queue.Queue(maxsize=self.queue_size)
+                    self._writer = threading.Thread(target=self._run_writer, args=(self._queue,),
+                                                    name="audit-writer", daemon=True)
+                    self._writer.start()
+                    if any(segment["status"] == "sealing" for segment in self.segments.load()):
+                        self.segments.seal_pending()  # Left over from a process that exited mid-roll
+                    if not self._atexit_registered:
+                        atexit.register(self.close)
+                        self._atexit_registered = True
+                    self._writer_pid = os.getpid()
+        return self._queue
+
+    def _run_writer(self, entries: queue.Queue):
+        # Every failure is counted and the loop goes on: a dead writer would block log_action once
+        # the queue fills. The log is (re)opened lazily, so a failed open is retried with the next batch
+        fd = None
+        last_sync = time.monotonic()
+        stop = False
+        try:
+            while not stop:
+                batch, barriers, blobs = [], [], {}
+                item = entries.get()
+                deadline = time.monotonic() + self.batch_ms / 1000
+                while True:
+                    if item is _STOP:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        barriers.append(item)
+                    else:
+                        line, entry_blobs = item
+                        batch.append(line)
+                        blobs.update(entry_blobs)
+                    if stop or len(batch) >= self.batch_size:
+                        break
+                    try:
+                        # Someone is waiting on a barrier: take what is queued, but do not linger
+                        timeout = 0 if barriers else max(0.0, deadline - time.monotonic())
+                        item = entries.get(timeout=timeout) if timeout else entries.get_nowait()
+                    except queue.Empty:
+                        break
+
+                if blobs:
+                    try:
+                        self.blobs.store(blobs)  # Committed before any entry that references them
+                    except Exception as e:
+                        self.stats["write_errors"] += 1
+                        print(f"Audit blob write failed, {len(blobs)} blobs unavailable to rehydrate: {e}")
+                if batch:
+                    written = False
+                    try:
+                        if fd is None:
+                            fd = self._open_log()
+                        fd = self._append(fd, b''.join(batch))
+                        written = True
+                        now = time.monotonic()
+                        if self.fsync_policy == "always" or (
+                                self.fsync_policy == "interval" and now - last_sync >= self.fsync_interval):
+                            os.fsync(fd)
+                            last_sync = now
+                            self.stats["fsyncs"] += 1
+                        self.stats["entries"] += len(batch)
+                        self.stats["batches"] += 1
+                        fd = self._maybe_roll(fd)
+                    except Exception as e:
+                        self.stats["write_errors"] += 1
+                        if written:
+                            print(f"Audit log sync or roll failed after writing {len(batch)} entries: {e!r}")
+                        else:
+                            print(f"Audit log write failed, {len(batch)} entries lost: {e!r}")
+                        self._close_log(fd, sync=False)
+                        fd = None  # Reopened for the next batch
+                for barrier in barriers:
+                    barrier.set()
+        finally:
+            self._close_log(fd, sync=self.fsync_policy != "never")
+
+    @staticmethod
+    def _close_log(fd: Optional[int], sync: bool):
+        if fd is None:
+            return
+        try:
+            if sync:
+                os.fsync(fd)
+        except OSError:
+            pass
+        try:
+            os.close(fd)
+        except OSError:
+            pass  # Already closed by a roll that failed to reopen the log
+
+    def _open_log(self) -> int:
+        return os.open(self.log_file, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _rotated(self, fd: int) -> bool:
+        """Whether fd no longer refers to the active segment (another writer rolled it)"""
+        try:
+            return os.stat(self.log_file).st_ino != os.fstat(fd).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _append(self, fd: int, payload: bytes) -> int:
+        """Append payload to the active segment; returns the fd to keep using"""
+        while True:
+            # Worker processes share the log: hold an exclusive lock so batches never interleave
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if not self._rotated(fd):
+                    view = memoryview(payload)
+                    while view:
+                        written = os.write(fd, view)
+                        view = view[written:]
+                    return fd
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+            fd = self._open_log()
+
+    def _segment_full(self, fd: int) -> bool:
+        st = os.fstat(fd)
+        if st.st_size >= self.segment_bytes:
+            return True
+        if st.st_size == 0:
+            return False
+        if st.st_ino not in self._segment_started:
+            match = _FIRST_TIMESTAMP.search(os.pread(fd, 64, 0))
+            try:
+                self._segment_started = {st.st_ino: datetime.fromisoformat(match.group(1).decode())}
+            except (AttributeError, ValueError):
+                self._segment_started = {st.st_ino: None}
+        started = self._segment_started[st.st_ino]
+        return started is not None and datetime.now() - started >= timedelta(seconds=self.segment_seconds)
+
+    def _maybe_roll(self, fd: int) -> int:
+        """Roll the active segment once it is full; returns the fd to keep using"""
+        if not self._segment_full(fd):
+            return fd
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            # Re-checked under the lock: another process may have rolled it already
+            rolled = not self._rotated(fd) and self._segment_full(fd)
+            if rolled:
+                self.segments.add(self.log_file)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        if rolled:
+            self.stats["rolls"] += 1
+            self.segments.seal_pending()
+        os.close(fd)
+        return self._open_log()
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every entry logged before this call is written; False on timeout"""
+        if self._writer_pid != os.getpid() or not self._writer.is_alive():
+            return True  # Nothing was logged from this process, or the writer has stopped
+        barrier = threading.Event()
+        self._queue.put(barrier)
+        return barrier.wait(timeout)
+
+    def close(self):
+        """Write out queued entries and stop the writer thread"""
+        if self._writer_pid == os.getpid() and self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+            self._writer_pid = None  # A later log_action starts a new writer
+
+    def get_stats(self) -> Dict[str, Any]:
+        queued = self._queue.qsize() if self._writer_pid == os.getpid() else 0
+        return dict(self.stats, queued=queued, fsync_policy=self.fsync_policy,
+                    sealed=self.segments.get_stats(), blobs=self.blobs.get_stats())
+
+    def _snapshot(self) -> Tuple[List[Dict[str, Any]], Optional[Any]]:
+        """The sealed segments and an open handle on the active segment, taken consistently.
+
+        A shared lock on the active segment keeps it from being rolled between
+        reading the manifest and opening it, so no entry is seen twice or missed.
+        """
+        while True:
+            try:
+                log = open(self.log_file, 'rb')
+            except FileNotFoundError:
+                return self.segments.load(), None
+            if fcntl is not None:
+                fcntl.flock(log, fcntl.LOCK_SH)
+            try:
+                if fcntl is None or not self._rotated(log.fileno()):
+                    return self.segments.load(), log
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(log, fcntl.LOCK_UN)
+            log.close()
+
+    def _session_offsets(self, log, session_id: str) -> List[Tuple[int, int]]:
+        """Offsets of the session's entries in the open active segment, after indexing new entries.
+
+        Loads index lines other processes appended, then indexes log lines nobody
+        has indexed yet. Cost is proportional to what was appended since the last
+        call, not to the size of the log.
+        """
+        st = os.fstat(log.fileno())
+        with self._index_lock, open(self.index_file, 'a+b') as index:
+            if fcntl is not None:
+                fcntl.flock(index, fcntl.LOCK_EX)
+            try:
+                index.seek(0, os.SEEK_END)
+                truncated = st.st_ino == self._indexed_inode and st.st_size < self._indexed_upto
+                if st.st_ino != self._indexed_inode or truncated or index.tell() < self._index_pos:
+                    # A new active segment, or the log or index was replaced: reload from the start
+                    self._offsets.clear()
+                    self._index_pos = self._indexed_upto = 0
+                    self._indexed_inode = st.st_ino
+                    index.seek(0)
+                    header = index.readline()
+                    try:
+                        valid = not truncated and json.loads(header)["inode"] == st.st_ino
+                    except (ValueError, KeyError, TypeError):
+                        valid = False
+                    if valid:
+                        self._index_pos = len(header)
+                    else:
+                        index.truncate(0)
+                        index.write((json.dumps({"inode": st.st_ino}) + '\n').encode('utf-8'))
+                        index.flush()
+                        self._index_pos = index.tell()
+
+                index.seek(self._index_pos)
+                for raw in index:
+                    if not raw.endswith(b'\n'):
+                        break
+                    entry_session, offset, length = json.loads(raw)
+                    self._offsets[entry_session].append((offset, length))
+                    self._indexed_upto = max(self._indexed_upto, offset + length)
+                    self._index_pos += len(raw)
+
+                if st.st_size > self._indexed_upto:
+                    self._index_log_tail(index, log)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(index, fcntl.LOCK_UN)
+            return list(self._offsets.get(session_id, ()))
+
+    def _index_log_tail(self, index, log):
+        new_lines = []
+        offset = self._indexed_upto
+        log.seek(offset)
+        for raw in log:
+            if not raw.endswith(b'\n'):
+                break  # A write still in progress; index it on a later call
+            try:
+                session_id = json.loads(raw).get('session_id')
+            except (json.JSONDecodeError, UnicodeDecodeError, AttributeError):
+                session_id = None
+            if session_id is not None:
+                self._offsets[session_id].append((offset, len(raw)))
+                new_lines.append(json.dumps([session_id, offset, len(raw)]) + '\n')
+            offset += len(raw)
+        if new_lines:
+            payload = ''.join(new_lines).encode('utf-8')
+            index.seek(0, os.SEEK_END)
+            index.write(payload)
+            index.flush()
+            self._index_pos += len(payload)
+        # Unparseable lines have no index entry; after a restart they are simply scanned (and skipped) again
+        self._indexed_upto = offset
+
     def get_session_logs(self, session_id: str) -> List[Dict[str, Any]]:
         """Retrieve all logs for a session"""
-        logs = []
-        if os.path.exists(self.log_file):
-            with open(self.log_file, 'r') as f:
-                for line in f:
+        self.flush()  # Read-your-writes: include this request's still-queued entries
+        segments, log = self._snapshot()
+        logs = [self.blobs.rehydrate(entry) for entry in self.segments.scan(segments, session_id=session_id)]
+        if log is not None:
+            with log:
+                for offset, length in self._session_offsets(log, session_id):
+                    log.seek(offset)
                     try:
-                        log_entry = json.loads(line.strip())
-                        if log_entry.get('session_id') == session_id:
-                            logs.append(log_entry)
+                        logs.append(self.blobs.rehydrate(json.loads(log.read(length))))
                     except json.JSONDecodeError:
                         continue
-        return logs
\ No newline at end of file
+        return logs
+
+    def get_session_page(self, session_id: str, offset: int = 0, limit: int = 50,
+                         newest_first: bool = False) -> Tuple[List[Dict[str, Any]], int, int]:
+        """One page of a session's logs, the session's total entry count and how many of the page's
+        entries could not be read back (the page is that much shorter); only the page is rehydrated"""
+        self.flush()
+        segments, log = self._snapshot()
+        # Sealed entries come parsed from their segment; active ones stay (offset, length) until paged in
+        refs: List[Any] = list(self.segments.scan(segments, session_id=session_id))
+        if log is None:
+            total = len(refs)
+            page = refs[::-1] if newest_first else refs
+            return [self.blobs.rehydrate(entry) for entry in page[offset:offset + limit]], total, 0
+        with log:
+            refs.extend(self._session_offsets(log, session_id))
+            total = len(refs)
+            if newest_first:
+                refs.reverse()
+            logs, skipped = [], 0
+            for ref in refs[offset:offset + limit]:
+                if isinstance(ref, tuple):
+                    log.seek(ref[0])
+                    try:
+                        ref = json.loads(log.read(ref[1]))
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        # Indexed when it parsed, so the log changed underneath (e.g. truncated); reported, not hidden
+                        skipped += 1
+                        continue
+                logs.append(self.blobs.rehydrate(ref))
+        return logs, total, skipped
+
+    def query(self, start: Union[str, datetime] = None, end: Union[str, datetime] = None, agent: str = None,
+              action_type: str = None, session_id: str = None) -> Iterator[Dict[str, Any]]:
+        """Entries matching every given filter, oldest first; start/end bound the timestamp inclusively.
+
+        A string `end` is inclusive at the precision given: "2024-02-15" covers that
+        whole day, "2024-02-15T10" the whole hour. Sealed segments whose manifest
+        summary rules out a match are not opened.
+        """
+        start = start.isoformat() if isinstance(start, datetime) else start
+        if isinstance(end, datetime):
+            end = end.isoformat(timespec='microseconds')
+        elif end:
+            # Sorts after every character of an ISO timestamp, so every entry with this prefix is <= end
+            end += "~"
+        self.flush()
+        segments, log = self._snapshot()
+        for entry in self.segments.scan(segments, start, end, agent, action_type, session_id):
+            yield self.blobs.rehydrate(entry)
+        if log is None:
+            return
+        with log:
+            if session_id is not None:
+                lines = []
+                for offset, length in self._session_offsets(log, session_id):
+                    log.seek(offset)
+                    lines.append(log.read(length))
+            else:
+                log.seek(0)
+                lines = log
+            for raw in lines:
+                try:
+                    entry = json.loads(raw)
+                except json.JSONDecodeError:
+                    continue
+                if entry_matches(entry, start, end, agent, action_type, session_id):
+                    yield self.blobs.rehydrate(entry)
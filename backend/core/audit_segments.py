@@ -0,0 +1,309 @@
+import gzip
+import hashlib
+import io
+import json
+import math
+import os
+import threading
+import weakref
+from typing import Dict, Iterator, List, Any, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; segment rolls are then only safe within one process
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Sealed segments are compressed with zstd when the zstandard package is installed, gzip otherwise
+COMPRESSED_SUFFIX = ".jsonl.zst" if zstandard is not None else ".jsonl.gz"
+
+
+def _open_compressed(path: str):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"{path} is zstd-compressed but the zstandard package is not installed")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _write_compressed(source: str, target: str):
+    with open(source, 'rb') as src:
+        if target.endswith(".zst"):
+            with open(target, 'wb') as dst:
+                zstandard.ZstdCompressor(level=10).copy_stream(src, dst)
+        else:
+            with gzip.open(target, 'wb', compresslevel=6) as dst:
+                while True:
+                    chunk = src.read(1 << 20)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+
+
+class SessionFilter:
+    """Bloom filter of the session ids in one sealed segment (about 1% false positives).
+
+    Stored as a sidecar file next to the segment so the manifest stays small however
+    many sessions the log has seen; `bits` and `hashes` are recorded in the manifest.
+    """
+
+    BITS_PER_ITEM = 10
+    HASHES = 7
+
+    def __init__(self, bits: int, hashes: int = HASHES, data: bytes = None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+
+    @classmethod
+    def for_items(cls, count: int) -> "SessionFilter":
+        bits = max(1024, int(math.ceil(count * cls.BITS_PER_ITEM / 8)) * 8)
+        return cls(bits)
+
+    def _positions(self, item: str) -> Iterator[int]:
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.data[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.data[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def _overlaps(segment: Dict[str, Any], start: Optional[str], end: Optional[str]) -> bool:
+    if segment.get("start") is None:
+        return True  # Not summarized yet
+    return (end is None or segment["start"] <= end) and (start is None or segment["end"] >= start)
+
+
+def _may_contain(segment: Dict[str, Any], field: str, value: Optional[str]) -> bool:
+    return value is None or segment.get(field) is None or value in segment[field]
+
+
+class AuditSegments:
+    """Sealed segments of an audit log plus the manifest that summarizes them.
+
+    The active log is renamed into `segments_dir` when it is rolled, then
+    compressed in the background. manifest.json lists segments in log order
+    with their time range, entry count and the agents and action types they
+    contain; the sessions of each are in a SessionFilter sidecar file. Queries
+    open only segments that can match.
+    """
+
+    def __init__(self, segments_dir: str):
+        self.segments_dir = segments_dir
+        self.manifest_file = os.path.join(segments_dir, "manifest.json")
+        self._lock_file = os.path.join(segments_dir, "manifest.lock")
+        self._local_lock = threading.Lock()
+        self._sealer: Optional[threading.Thread] = None
+        self._cache = None  # (manifest stat signature, parsed segments)
+        self._filters: Dict[str, Optional[SessionFilter]] = {}  # sidecar file -> filter (None if unreadable)
+        # A fork can happen while another thread holds the lock; the child must not inherit that
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: ref() and ref()._after_fork())
+
+    def _after_fork(self):
+        self._local_lock = threading.Lock()
+        self._sealer = None
+
+    def _read(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.manifest_file, 'r') as f:
+                return json.load(f)["segments"]
+        except FileNotFoundError:
+            return []
+
+    def load(self) -> List[Dict[str, Any]]:
+        """Current segments, parsed once per manifest change; treat as read-only"""
+        try:
+            st = os.stat(self.manifest_file)
+        except FileNotFoundError:
+            return []
+        signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        cached = self._cache
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        segments = self._read()
+        for segment in segments:
+            for field in ("sessions", "agents", "action_types"):
+                if field in segment:
+                    segment[field] = frozenset(segment[field])
+        self._cache = (signature, segments)
+        return segments
+
+    def _save(self, segments: List[Dict[str, Any]]):
+        temp = f"{self.manifest_file}.{os.getpid()}.tmp"
+        with open(temp, 'w') as f:
+            json.dump({"segments": segments}, f)
+        os.replace(temp, self.manifest_file)
+
+    def _update(self, change):
+        """Apply change(segments) to the manifest under its lock (threads and processes)"""
+        os.makedirs(self.segments_dir, exist_ok=True)
+        with self._local_lock, open(self._lock_file, 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                segments = self._read()
+                result = change(segments)
+                self._save(segments)
+                return result
+            finally:
+                # Unlock explicitly: a child forked meanwhile shares this descriptor, so closing ours would not
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def add(self, log_path: str) -> Dict[str, Any]:
+        """Move the active log into the segment directory; the caller holds the log's exclusive lock"""
+        def change(segments):
+            seq = segments[-1]["seq"] + 1 if segments else 1
+            name = f"audit-{seq:06d}.jsonl"
+            os.rename(log_path, os.path.join(self.segments_dir, name))
+            segment = {"seq": seq, "file": name, "status": "sealing"}
+            segments.append(segment)
+            return segment
+        return self._update(change)
+
+    def seal_pending(self):
+        """Summarize and compress every segment still in "sealing" state, on a background thread"""
+        if self._sealer is None or not self._sealer.is_alive():
+            self._sealer = threading.Thread(target=self._seal_all, name="audit-sealer", daemon=True)
+            self._sealer.start()
+
+    def _seal_all(self):
+        attempted = set()
+        while True:
+            # Segments rolled while this runs are picked up by the next pass
+            pending = [segment for segment in self._read()
+                       if segment["status"] == "sealing" and segment["seq"] not in attempted]
+            if not pending:
+                return
+            for segment in pending:
+                attempted.add(segment["seq"])
+                try:
+                    self._seal(segment)
+                except FileNotFoundError:
+                    pass  # Sealed by another process meanwhile
+                except (OSError, ValueError) as e:
+                    print(f"Sealing audit segment {segment['file']} failed: {e}")
+
+    def _seal(self, segment: Dict[str, Any]):
+        raw = os.path.join(self.segments_dir, segment["file"])
+        if not os.path.exists(raw):
+            return  # Another process sealed it
+        summary = {"start": None, "end": None, "entries": 0, "bytes": os.path.getsize(raw)}
+        sessions: Set[str] = set()
+        agents, action_types = set(), set()
+        with open(raw, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                timestamp = entry.get("timestamp")
+                if timestamp:
+                    summary["start"] = min(summary["start"] or timestamp, timestamp)
+                    summary["end"] = max(summary["end"] or timestamp, timestamp)
+                summary["entries"] += 1
+                if entry.get("session_id") is not None:
+                    sessions.add(str(entry["session_id"]))
+                agents.add(entry.get("agent"))
+                action_types.add(entry.get("action_type"))
+
+        session_filter = SessionFilter.for_items(len(sessions))
+        for session_id in sessions:
+            session_filter.add(session_id)
+        filter_name = segment["file"][:-len(".jsonl")] + ".sessions"
+        temp = os.path.join(self.segments_dir, f"{filter_name}.{os.getpid()}.tmp")
+        with open(temp, 'wb') as f:
+            f.write(session_filter.data)
+        os.replace(temp, os.path.join(self.segments_dir, filter_name))
+
+        name = segment["file"][:-len(".jsonl")] + COMPRESSED_SUFFIX
+        temp = os.path.join(self.segments_dir, f"{name}.{os.getpid()}.tmp")
+        _write_compressed(raw, temp)
+        os.replace(temp, os.path.join(self.segments_dir, name))
+
+        def change(segments):
+            for entry in segments:
+                if entry["seq"] == segment["seq"]:
+                    entry.update(summary, file=name, status="sealed",
+                                 session_filter={"file": filter_name, "bits": session_filter.bits,
+                                                 "hashes": session_filter.hashes},
+                                 agents=sorted(a for a in agents if a is not None),
+                                 action_types=sorted(a for a in action_types if a is not None))
+        self._update(change)
+        try:
+            os.remove(raw)
+        except FileNotFoundError:
+            pass
+
+    def _may_contain_session(self, segment: Dict[str, Any], session_id: Optional[str]) -> bool:
+        if session_id is None:
+            return True
+        if "sessions" in segment:
+            return session_id in segment["sessions"]  # Sealed before session filters existed
+        spec = segment.get("session_filter")
+        if spec is None:
+            return True  # Not summarized yet
+        if spec["file"] not in self._filters:
+            try:
+                with open(os.path.join(self.segments_dir, spec["file"]), 'rb') as f:
+                    self._filters[spec["file"]] = SessionFilter(spec["bits"], spec["hashes"], f.read())
+            except OSError:
+                self._filters[spec["file"]] = None
+        session_filter = self._filters[spec["file"]]
+        return session_filter is None or str(session_id) in session_filter
+
+    def _open(self, segment: Dict[str, Any]):
+        try:
+            return _open_compressed(os.path.join(self.segments_dir, segment["file"]))
+        except FileNotFoundError:
+            # Sealed (and the raw file removed) since the manifest was read
+            for current in self._read():
+                if current["seq"] == segment["seq"]:
+                    return _open_compressed(os.path.join(self.segments_dir, current["file"]))
+            raise
+
+    def scan(self, segments: List[Dict[str, Any]], start: str = None, end: str = None, agent: str = None,
+             action_type: str = None, session_id: str = None) -> Iterator[Dict[str, Any]]:
+        """Entries of the given segments that match, opening only segments whose summary allows a match"""
+        for segment in segments:
+            if not (_overlaps(segment, start, end)
+                    and self._may_contain_session(segment, session_id)
+                    and _may_contain(segment, "agents", agent)
+                    and _may_contain(segment, "action_types", action_type)):
+                continue
+            with self._open(segment) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if entry_matches(entry, start, end, agent, action_type, session_id):
+                        yield entry
+
+    def get_stats(self) -> Dict[str, Any]:
+        segments = self.load()
+        return {"segments": len(segments),
+                "sealing": sum(1 for s in segments if s["status"] == "sealing"),
+                "entries": sum(s.get("entries", 0) for s in segments),
+                "raw_bytes": sum(s.get("bytes", 0) for s in segments)}
+
+
+def entry_matches(entry: Dict[str, Any], start: str = None, end: str = None, agent: str = None,
+                  action_type: str = None, session_id: str = None) -> bool:
+    timestamp = entry.get("timestamp", "")
+    return ((start is None or timestamp >= start) and (end is None or timestamp <= end)
+            and (agent is None or entry.get("agent") == agent)
+            and (action_type is None or entry.get("action_type") == action_type)
+            and (session_id is None or entry.get("session_id") == session_id))
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+# Keys the retriever adds to its copies of stored documents; kept inline so those copies share one blob
+OVERLAY_KEYS = ("source_type", "source_file", "relevance_score")
+
+BLOB_KEY = "$blob"
+
+
+class BlobStore:
+    """Content-addressed store for the large objects repeated across audit entries.
+
+    `dedupe` replaces every nested dict whose JSON is at least `min_bytes` with
+    {"$blob": <hash>} (plus any overlay keys, see OVERLAY_KEYS) and collects the
+    blobs not stored yet; `store` writes them to sqlite (the audit writer thread
+    does, before the entries that reference them); `rehydrate` reverses it. Blobs
+    may themselves hold references, so a document embedded in several results is
+    stored once.
+    """
+
+    def __init__(self, db_path: str, min_bytes: int = None, cache_entries: int = 4096):
+        self.db_path = db_path
+        self.min_bytes = min_bytes or int(os.getenv('AUDIT_BLOB_MIN_BYTES', 256))
+        self.cache_entries = cache_entries
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()  # hash -> parsed blob, also marks it as stored
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {"blobs_written": 0, "blob_refs": 0, "bytes_written": 0, "bytes_deduplicated": 0}
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread (and per process, since connections must not cross a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, body TEXT NOT NULL)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _remember(self, digest: str, value: Any):
+        with self._lock:
+            self._cache[digest] = value
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    def dedupe(self, value: Any, pending: Dict[str, str]) -> Any:
+        """value with its large nested dicts replaced by blob references (value itself stays inline).
+
+        Blobs this process has not stored yet are added to `pending` (hash -> JSON
+        body); pass them to `store` before anything that references them is read.
+        Until then they are served from memory.
+        """
+        if isinstance(value, dict):
+            return {key: self._reduce(item, pending) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._reduce(item, pending) for item in value]
+        return value
+
+    def _reduce(self, value: Any, pending: Dict[str, str]) -> Any:
+        if isinstance(value, list):
+            return [self._reduce(item, pending) for item in value]
+        if not isinstance(value, dict):
+            return value
+        overlay = {key: value[key] for key in OVERLAY_KEYS if key in value}
+        base = {key: self._reduce(item, pending) for key, item in value.items() if key not in overlay}
+        # Key order is part of the content: copies of one stored document serialize identically
+        body = json.dumps(base, separators=(',', ':'), default=str)
+        if len(body) < self.min_bytes:
+            base.update(overlay)
+            return base
+        digest = hashlib.blake2b(body.encode('utf-8'), digest_size=16).hexdigest()
+        with self._lock:
+            known = digest in self._cache
+            if known:
+                self._cache.move_to_end(digest)
+            self.stats["blob_refs"] += 1
+            self.stats["bytes_deduplicated" if known or digest in pending else "bytes_written"] += len(body)
+        if not known:
+            pending[digest] = body
+            # Marks it as known right away, so entries queued before it is stored do not carry it again
+            self._remember(digest, base)
+        return dict({BLOB_KEY: digest}, **overlay)
+
+    def store(self, pending: Dict[str, str]):
+        """Write blobs collected by dedupe in one transaction; on failure they are forgotten and re-sent later"""
+        if not pending:
+            return
+        try:
+            db = self._db()
+            with db:
+                inserted = db.executemany("INSERT OR IGNORE INTO blobs VALUES (?, ?)", pending.items()).rowcount
+        except sqlite3.Error:
+            with self._lock:
+                for digest in pending:
+                    self._cache.pop(digest, None)
+            raise
+        with self._lock:
+            self.stats["blobs_written"] += max(0, inserted)
+
+    def _load(self, digest: str) -> Optional[Any]:
+        with self._lock:
+            if digest in self._cache:
+                self._cache.move_to_end(digest)
+                return self._cache[digest]
+        row = self._db().execute("SELECT body FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        value = json.loads(row[0])
+        self._remember(digest, value)
+        return value
+
+    def rehydrate(self, value: Any) -> Any:
+        """A copy of value with every blob reference replaced by its content"""
+        if isinstance(value, list):
+            return [self.rehydrate(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        digest = value.get(BLOB_KEY)
+        if digest is None:
+            return {key: self.rehydrate(item) for key, item in value.items()}
+        content = self._load(digest)
+        if content is None:
+            return value  # Blob missing (e.g. blob database removed); leave the reference visible
+        restored = self.rehydrate(content)
+        restored.update((key, item) for key, item in value.items() if key != BLOB_KEY)
+        return restored
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats, cached=len(self._cache))
+        total = stats["bytes_written"] + stats["bytes_deduplicated"]
+        stats["dedup_ratio"] = round(total / stats["bytes_written"], 2) if stats["bytes_written"] else 0.0
+        return stats
@@ -0,0 +1,442 @@
+import bisect
+import json
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Any, Optional, Sequence, Set, Tuple
+from core.search_index import BM25Index
+from core.vector_index import HashingEncoder, VectorIndex
+from core.record_file import RecordFile, iter_json_array
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; appends are then only serialized within one process
+    fcntl = None
+
+# Fields that identify a document on their own (invoice/PO/GR ids)
+PRIMARY_KEYS = ("id", "invoice_id", "po_id")
+# Fields that many documents can share and that we look documents up by
+SECONDARY_KEYS = ("po_reference", "vendor")
+
+# Data files larger than this are served from an mmap'd byte-offset index instead of being loaded
+DEFAULT_MMAP_THRESHOLD = int(os.getenv('DOC_STORE_MMAP_THRESHOLD', 64 * 1024 * 1024))
+
+# (old version, new version) of a document; None on either side for additions/removals
+DocumentChange = Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+
+class DocumentCollection:
+    """One document type (invoices, purchase_orders, ...) with hash indexes.
+
+    `documents` is either a list or a RecordFile; only the indexes are always in memory.
+    A document whose id was seen before supersedes the earlier version: that
+    position leaves every index and is skipped by `iter_documents`.
+    """
+
+    def __init__(self, name: str, file_path: str, signature: Tuple[int, int],
+                 documents: List[Dict[str, Any]], index_dir: str = None, encoder=None):
+        self.name = name
+        self.file_path = file_path
+        self.signature = signature
+        self.documents = documents
+        self.index_dir = index_dir
+        self.encoder = encoder or HashingEncoder()
+        self.primary_index: Dict[str, int] = {}
+        self.secondary_indexes: Dict[str, Dict[str, List[int]]] = {key: {} for key in SECONDARY_KEYS}
+        self.superseded: Set[int] = set()
+        self._search_index: Optional[BM25Index] = None
+        self._search_lock = threading.RLock()
+        self._vector_index: Optional[VectorIndex] = None
+
+        for position, doc in enumerate(documents):
+            self._index_document(position, doc)
+
+    def _index_document(self, position: int, doc: Dict[str, Any]) -> List[Tuple[int, Dict[str, Any]]]:
+        """Index a document; returns the (position, document) versions it supersedes"""
+        replaced = []
+        for key in PRIMARY_KEYS:
+            value = doc.get(key)
+            previous = self.primary_index.get(str(value)) if value is not None else None
+            if previous is not None and previous not in self.superseded:
+                replaced.append((previous, self._unindex(previous)))
+        for key in PRIMARY_KEYS:
+            value = doc.get(key)
+            if value is not None:
+                self.primary_index[str(value)] = position
+        for key in SECONDARY_KEYS:
+            value = doc.get(key)
+            if value is not None:
+                self.secondary_indexes[key].setdefault(str(value), []).append(position)
+        return replaced
+
+    def _unindex(self, position: int) -> Dict[str, Any]:
+        """Take a superseded version out of the hash indexes; returns it"""
+        doc = self.documents[position]
+        self.superseded.add(position)
+        for key in PRIMARY_KEYS:
+            value = doc.get(key)
+            if value is not None and self.primary_index.get(str(value)) == position:
+                del self.primary_index[str(value)]
+        for key in SECONDARY_KEYS:
+            value = doc.get(key)
+            positions = self.secondary_indexes[key].get(str(value)) if value is not None else None
+            if positions:
+                # Positions are appended in increasing order, so each list is sorted
+                at = bisect.bisect_left(positions, position)
+                if at < len(positions) and positions[at] == position:
+                    del positions[at]
+                if not positions:
+                    del self.secondary_indexes[key][str(value)]
+        return doc
+
+    def add_document(self, doc: Dict[str, Any]) -> int:
+        """Append a document and update every index built so far"""
+        position = len(self.documents)
+        self.documents.append(doc)
+        self._index_new([doc], position)
+        return position
+
+    def add_file_records(self, docs: List[Dict[str, Any]], starts: List[int], ends: List[int],
+                         signature: Tuple[int, int]):
+        """Index records just appended to this collection's file at the given byte ranges,
+        and take the file's new signature so the append does not trigger a reload"""
+        position = len(self.documents)
+        if isinstance(self.documents, RecordFile):
+            self.documents.extend_indexed(docs, starts, ends)
+        else:
+            self.documents.extend(docs)
+        self._index_new(docs, position)
+        self.signature = signature
+
+    def _index_new(self, docs: List[Dict[str, Any]], position: int):
+        replaced = []
+        for offset, doc in enumerate(docs):
+            replaced.extend(self._index_document(position + offset, doc))
+        with self._search_lock:
+            # Added first, then removed: a batch can supersede its own earlier documents
+            if self._search_index is not None:
+                for offset, doc in enumerate(docs):
+                    self._search_index.add_document(position + offset, doc)
+                for old_position, old_doc in replaced:
+                    self._search_index.remove_document(old_position, old_doc)
+            if self._vector_index is not None:
+                self._vector_index.add(docs)
+                self._vector_index.remove(old_position for old_position, _ in replaced)
+
+    def search_index(self) -> BM25Index:
+        """The BM25 index, built on first use and kept for the collection's lifetime"""
+        if self._search_index is None:
+            with self._search_lock:
+                if self._search_index is None:
+                    index = BM25Index()
+                    for position, doc in enumerate(self.documents):
+                        if position not in self.superseded:
+                            index.add_document(position, doc)
+                    self._search_index = index
+        return self._search_index
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+        """Top-k documents for a free-text query as (score, document), best first"""
+        index = self.search_index()
+        with self._search_lock:
+            hits = index.search(query, k)
+        return [(score, self.documents[position]) for score, position in hits]
+
+    def vector_index(self) -> VectorIndex:
+        """Dense vectors for the collection, loaded (memory-mapped) from disk when a saved
+        index matches this file version, otherwise embedded once and saved for other workers"""
+        if self._vector_index is None:
+            with self._search_lock:
+                if self._vector_index is None:
+                    path = os.path.join(self.index_dir, self.name) if self.index_dir else None
+                    index = VectorIndex.load(path, self.encoder, self.signature) if path else None
+                    if index is None or len(index) != len(self.documents):
+                        index = VectorIndex(self.encoder)
+                        index.build(self.documents)
+                        if path:
+                            try:
+                                index.save(path, self.signature)
+                            except OSError:
+                                pass  # Read-only data dir: keep the in-memory index
+                    # Saved with every row of the file; superseded versions are dropped per process
+                    index.remove(self.superseded)
+                    self._vector_index = index
+        return self._vector_index
+
+    def semantic_search(self, query: str, k: int = 5,
+                        min_similarity: float = 0.2) -> List[Tuple[float, Dict[str, Any]]]:
+        """Top-k documents by cosine similarity as (similarity, document), best first"""
+        index = self.vector_index()
+        with self._search_lock:
+            hits = index.search([query], k, min_similarity)[0]
+        return [(score, self.documents[position]) for score, position in hits]
+
+    def hybrid_search(self, query: str, k: int = 5,
+                      rrf_k: int = 60) -> List[Tuple[float, Dict[str, Any]]]:
+        """BM25 and dense rankings merged by reciprocal-rank fusion, as (fused score, document)"""
+        keyword_index, vector_index = self.search_index(), self.vector_index()
+        with self._search_lock:
+            rankings = [keyword_index.search(query, k * 2),
+                        vector_index.search([query], k * 2, min_similarity=0.2)[0]]
+
+        fused: Dict[int, float] = {}
+        for hits in rankings:
+            for rank, (_, position) in enumerate(hits):
+                fused[position] = fused.get(position, 0.0) + 1.0 / (rrf_k + rank + 1)
+
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(score, self.documents[position]) for position, score in ranked]
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """O(1) lookup by id / invoice_id / po_id"""
+        position = self.primary_index.get(doc_id)
+        return self.documents[position] if position is not None else None
+
+    def find_by(self, field: str, value: str) -> List[Dict[str, Any]]:
+        """O(1) lookup on a secondary index (po_reference, vendor)"""
+        if field not in self.secondary_indexes:
+            raise KeyError(f"No index on field '{field}'")
+        positions = self.secondary_indexes[field].get(value, [])
+        return [self.documents[p] for p in positions]
+
+    def iter_documents(self) -> Iterable[Dict[str, Any]]:
+        """Current documents in file order, without versions superseded by a later one"""
+        if not self.superseded:
+            return self.documents
+        return (doc for position, doc in enumerate(self.documents) if position not in self.superseded)
+
+    def __len__(self) -> int:
+        return len(self.documents) - len(self.superseded)
+
+    def close(self):
+        """Release the mmap behind a RecordFile-backed collection"""
+        if isinstance(self.documents, RecordFile):
+            self.documents.close()
+
+
+class DocumentStore:
+    """Loads each data/<doc_type>.json[l] once and reloads it when the file changes on disk.
+
+    Files above `mmap_threshold` bytes are streamed once to build the indexes and
+    then read record-by-record through an mmap.
+    """
+
+    def __init__(self, data_path: str = "data/", encoder=None,
+                 mmap_threshold: int = DEFAULT_MMAP_THRESHOLD):
+        self.data_path = data_path
+        self.mmap_threshold = mmap_threshold
+        self.index_dir = os.path.join(data_path, ".index")
+        self.encoder = encoder or HashingEncoder()
+        self._collections: Dict[str, DocumentCollection] = {}
+        self._listeners: List[Callable[[str, List[DocumentChange]], None]] = []
+        self._lock = threading.Lock()
+        self._append_lock = threading.Lock()
+
+    def file_path(self, doc_type: str) -> str:
+        """data/<doc_type>.jsonl if present, otherwise data/<doc_type>.json"""
+        jsonl_path = os.path.join(self.data_path, f"{doc_type}.jsonl")
+        if os.path.exists(jsonl_path):
+            return jsonl_path
+        return os.path.join(self.data_path, f"{doc_type}.json")
+
+    def exists(self, doc_type: str) -> bool:
+        return os.path.exists(self.file_path(doc_type))
+
+    def collection(self, doc_type: str) -> Optional[DocumentCollection]:
+        """Return the indexed collection, reloading it if the file's mtime/size changed"""
+        file_path = self.file_path(doc_type)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            removed = self._collections.pop(doc_type, None)
+            if removed is not None:
+                removed.close()
+            return None
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        current = self._collections.get(doc_type)
+        if current is not None and current.signature == signature:
+            return current
+
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            current = self._collections.get(doc_type)
+            if current is not None and current.signature == signature:
+                return current
+            previous = current
+            current = self._load(doc_type, file_path, signature)
+            self._collections[doc_type] = current
+        # Listeners run without the lock, so they may read the store themselves
+        if previous is not None:
+            if self._listeners:
+                self._notify(doc_type, self._diff(previous, current))
+            previous.close()
+        return current
+
+    def subscribe(self, callback: Callable[[str, List[DocumentChange]], None]):
+        """Call callback(doc_type, changes) whenever documents change on reload or are added"""
+        self._listeners.append(callback)
+
+    def _notify(self, doc_type: str, changes: List[DocumentChange]):
+        if changes:
+            for callback in self._listeners:
+                callback(doc_type, changes)
+
+    @staticmethod
+    def _diff(old: DocumentCollection, new: DocumentCollection) -> List[DocumentChange]:
+        """Documents that were added, removed or modified between two versions of a collection.
+
+        File-backed versions are compared by their stored bytes, so only records
+        that differ are decoded.
+        """
+        changes = []
+        seen = set()
+        raw = isinstance(old.documents, RecordFile) and isinstance(new.documents, RecordFile)
+        for key in old.primary_index.keys() | new.primary_index.keys():
+            positions = (old.primary_index.get(key), new.primary_index.get(key))
+            if positions in seen:
+                continue  # Same document reached through another of its ids
+            seen.add(positions)
+            if raw and None not in positions:
+                before_bytes = old.documents.raw(positions[0])
+                if before_bytes is not None and before_bytes == new.documents.raw(positions[1]):
+                    continue
+            before = old.documents[positions[0]] if positions[0] is not None else None
+            after = new.documents[positions[1]] if positions[1] is not None else None
+            if before != after:
+                changes.append((before, after))
+        return changes
+
+    def _load(self, doc_type: str, file_path: str, signature: Tuple[int, int]) -> DocumentCollection:
+        if signature[1] > self.mmap_threshold:
+            documents = RecordFile(file_path)
+        elif file_path.endswith(".jsonl"):
+            documents = list(RecordFile(file_path))
+        else:
+            with open(file_path, 'r') as f:
+                documents = json.load(f)
+        return DocumentCollection(doc_type, file_path, signature, documents,
+                                  index_dir=self.index_dir, encoder=self.encoder)
+
+    def get(self, doc_type: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Get a document by its id"""
+        collection = self.collection(doc_type)
+        return collection.get(doc_id) if collection else None
+
+    def find_by(self, doc_type: str, field: str, value: str) -> List[Dict[str, Any]]:
+        """Get all documents whose indexed field equals value"""
+        collection = self.collection(doc_type)
+        return collection.find_by(field, value) if collection else []
+
+    def search(self, doc_type: str, query: str, k: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+        """BM25-ranked documents of a type for a free-text query"""
+        collection = self.collection(doc_type)
+        return collection.search(query, k) if collection else []
+
+    def semantic_search(self, doc_type: str, query: str, k: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+        """Dense-vector (cosine) ranked documents of a type for a free-text query"""
+        collection = self.collection(doc_type)
+        return collection.semantic_search(query, k) if collection else []
+
+    def hybrid_search(self, doc_type: str, query: str, k: int = 5,
+                      rrf_k: int = 60) -> List[Tuple[float, Dict[str, Any]]]:
+        """Keyword and semantic rankings of a type merged by reciprocal-rank fusion"""
+        collection = self.collection(doc_type)
+        return collection.hybrid_search(query, k, rrf_k) if collection else []
+
+    def add_documents(self, doc_type: str, documents: List[Dict[str, Any]]):
+        """Add documents to a loaded collection without rebuilding its indexes"""
+        collection = self.collection(doc_type)
+        if collection is None:
+            raise KeyError(f"Unknown document type '{doc_type}'")
+        changes = []
+        for doc in documents:
+            previous = next((collection.get(str(doc[key])) for key in PRIMARY_KEYS if doc.get(key) is not None), None)
+            collection.add_document(doc)
+            changes.append((previous, doc))
+        self._notify(doc_type, changes)
+
+    def preload(self, doc_types: Sequence[str]) -> Dict[str, int]:
+        """Load each collection and build its search and vector indexes now rather than on first use;
+        returns the document count per type"""
+        counts = {}
+        for doc_type in doc_types:
+            collection = self.collection(doc_type)
+            if collection is not None:
+                collection.search_index()
+                collection.vector_index()
+                counts[doc_type] = len(collection)
+        return counts
+
+    def append_documents(self, doc_type: str, documents: List[Dict[str, Any]], fsync: bool = True) -> int:
+        """Durably append documents to the type's data file and index them without a reload.
+
+        The batch goes to disk in one append under an exclusive file lock; a failed
+        write is truncated away, so the file holds the whole batch or none of it.
+        A JSON-array file is converted to JSONL first, since only JSONL can be
+        appended to. Returns the number of documents appended.
+
+        Appending is an upsert: a document whose id is already stored supersedes the
+        stored version (lookups return the newest one and listeners see the pair as
+        a modification), while the old line stays in the file.
+        """
+        if not documents:
+            return 0
+        with self._append_lock:
+            file_path = self.file_path(doc_type)
+            if file_path.endswith(".json"):
+                # A new type starts out as JSONL
+                file_path = self._convert_to_jsonl(file_path) if os.path.exists(file_path) else file_path + "l"
+            collection = self.collection(doc_type)
+
+            lines = [(json.dumps(doc, separators=(',', ':'), default=str) + '\n').encode('utf-8')
+                     for doc in documents]
+            fd = os.open(file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                size = os.fstat(fd).st_size
+                try:
+                    payload = memoryview(b"".join(lines))
+                    while payload:
+                        payload = payload[os.write(fd, payload):]
+                    if fsync:
+                        os.fsync(fd)
+                except BaseException:
+                    os.ftruncate(fd, size)
+                    raise
+                stat = os.fstat(fd)
+            finally:
+                os.close(fd)  # Also releases the lock: the descriptor is not shared with any child
+
+            previous = [next((collection.get(str(doc[key])) for key in PRIMARY_KEYS if doc.get(key) is not None),
+                             None) if collection is not None else None for doc in documents]
+            if collection is not None and collection.signature[1] == size:
+                starts, ends = [], []
+                offset = size
+                for line in lines:
+                    starts.append(offset)
+                    ends.append(offset + len(line) - 1)  # Without the newline
+                    offset += len(line)
+                with self._lock:
+                    collection.add_file_records(documents, starts, ends, (stat.st_mtime_ns, stat.st_size))
+                self._notify(doc_type, list(zip(previous, documents)))
+            # Otherwise the file changed under us (or is new): the next access reloads it and diffs
+        return len(documents)
+
+    def _convert_to_jsonl(self, json_path: str) -> str:
+        """Rewrite data/<type>.json as data/<type>.jsonl (atomically) and remove the JSON file"""
+        jsonl_path = json_path[:-len(".json")] + ".jsonl"
+        temp = f"{jsonl_path}.{os.getpid()}.tmp"
+        with open(temp, 'w', encoding='utf-8') as f:
+            for record, _, _ in iter_json_array(json_path):
+                f.write(json.dumps(record, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, jsonl_path)
+        os.remove(json_path)
+        return jsonl_path
+
+    def documents(self, doc_type: str) -> Iterable[Dict[str, Any]]:
+        """All current documents of a type, in file order (a RecordFile for large files without upserts)"""
+        collection = self.collection(doc_type)
+        return collection.iter_documents() if collection else []
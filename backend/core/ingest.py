@@ -0,0 +1,220 @@
+import csv
+import io
+import json
+import os
+import time
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Tuple
+from core.document_store import DocumentStore
+
+# What the matcher reads from each document type: id fields (any one), required fields, items field,
+# item keys (any one: line alignment goes by SKU, else by description) and required item fields
+SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "invoices": {
+        "ids": ("invoice_id", "id"),
+        "fields": {"vendor": str, "po_reference": str, "total_amount": float},
+        "items": "line_items",
+        "item_keys": ("sku", "description"),
+        "item_fields": {"quantity": float, "unit_price": float},
+    },
+    "purchase_orders": {
+        "ids": ("po_id", "id"),
+        "fields": {"vendor": str, "total_amount": float},
+        "items": "line_items",
+        "item_keys": ("sku", "description"),
+        "item_fields": {"quantity": float, "unit_price": float},
+    },
+    "goods_receipts": {
+        "ids": ("id",),
+        "fields": {"po_reference": str},
+        "items": "received_items",
+        "item_keys": ("sku", "description"),
+        "item_fields": {"quantity_received": float},
+    },
+}
+
+# Optional fields that are still numbers when they come in as CSV text
+NUMERIC_FIELDS = {"total_amount", "quantity", "unit_price", "total", "quantity_received", "quantity_ordered"}
+
+FORMATS = ("jsonl", "csv")
+
+
+def _number(value: Any) -> Any:
+    """value as an int or float when it is numeric text; otherwise unchanged"""
+    if isinstance(value, str):
+        text = value.strip().replace(",", "")
+        try:
+            return int(text)
+        except ValueError:
+            try:
+                return float(text)
+            except ValueError:
+                return value
+    return value
+
+
+def _check(record: Dict[str, Any], fields: Dict[str, type], where: str, errors: List[str]):
+    for field, kind in fields.items():
+        value = record.get(field)
+        if type(value) is kind or kind is float and type(value) is int:
+            continue  # The common case, checked first: this runs for every field of every record
+        if value is None or value == "":
+            errors.append(f"{where}missing {field}")
+        elif kind is float:
+            value = record[field] = _number(value)
+            if type(value) not in (int, float):
+                errors.append(f"{where}{field} is not a number")
+        elif not isinstance(value, kind):
+            errors.append(f"{where}{field} must be a {kind.__name__}")
+
+
+def _coerce_numbers(record: Dict[str, Any]):
+    for field in NUMERIC_FIELDS:
+        if type(record.get(field)) is str:
+            record[field] = _number(record[field])
+
+
+def validate_record(doc_type: str, record: Any) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """(normalized record, []) when it satisfies the doc type's schema, else (None, errors).
+
+    Numeric text becomes numbers and every id field the store indexes is filled in
+    from whichever one the record has (e.g. an invoice's id and invoice_id).
+    """
+    if not isinstance(record, dict):
+        return None, ["record is not an object"]
+    schema = SCHEMAS[doc_type]
+    errors: List[str] = []
+    doc_id = next((record[key] for key in schema["ids"] if record.get(key) not in (None, "")), None)
+    if doc_id is None:
+        errors.append(f"missing {' or '.join(schema['ids'])}")
+    _check(record, schema["fields"], "", errors)
+
+    items = record.get(schema["items"])
+    if not isinstance(items, list) or not items:
+        errors.append(f"{schema['items']} must be a non-empty list")
+    else:
+        for position, item in enumerate(items, start=1):
+            if not isinstance(item, dict):
+                errors.append(f"{schema['items']}[{position}] is not an object")
+                continue
+            where = f"{schema['items']}[{position}]: "
+            if not any(isinstance(item.get(key), str) and item[key] for key in schema["item_keys"]):
+                errors.append(f"{where}missing {' or '.join(schema['item_keys'])}")
+            _check(item, schema["item_fields"], where, errors)
+            _coerce_numbers(item)
+    if errors:
+        return None, errors
+
+    for key in schema["ids"]:
+        record.setdefault(key, str(doc_id))
+    _coerce_numbers(record)
+    return record, []
+
+
+def read_records(stream: io.TextIOBase, fmt: str) -> Iterator[Tuple[int, Any]]:
+    """(line number, record) for each record of a JSONL or CSV text stream, read incrementally.
+
+    A line that is not valid JSON yields its decode error message instead of a
+    record. CSV cells are strings; list fields (line_items, received_items) hold JSON.
+    """
+    if fmt == "jsonl":
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, f"invalid JSON: {e}"
+    elif fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            record = {}
+            for key, value in row.items():
+                if key is None or value is None or value == "":
+                    continue  # Extra cells without a header, or empty ones
+                if value[:1] in "[{":
+                    try:
+                        value = json.loads(value)
+                    except json.JSONDecodeError:
+                        pass
+                record[key] = value
+            yield reader.line_num, record
+    else:
+        raise ValueError(f"Unknown format '{fmt}'; expected one of {FORMATS}")
+
+
+def format_for(filename: str = None, content_type: str = None) -> Optional[str]:
+    """The upload format implied by a file name or content type, if any"""
+    name = (filename or "").lower()
+    if name.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    if name.endswith(".csv"):
+        return "csv"
+    kind = (content_type or "").split(";")[0].strip().lower()
+    if kind in ("application/x-ndjson", "application/jsonl", "application/x-jsonlines"):
+        return "jsonl"
+    if kind in ("text/csv", "application/csv"):
+        return "csv"
+    return None
+
+
+class DocumentIngester:
+    """Validates streamed records and appends them to the document store in bounded batches.
+
+    Each batch of valid records is appended to the data file in one atomic write
+    and indexed incrementally (see DocumentStore.append_documents), so memory
+    use is bounded by the batch size and a failure keeps every earlier batch.
+    Rejected records are counted; the first `max_errors` are reported by line.
+    A record whose id is already stored replaces it (see append_documents);
+    those are counted as `replaced`.
+    """
+
+    def __init__(self, store: DocumentStore, batch_size: int = None, fsync: bool = True, max_errors: int = 100):
+        self.store = store
+        self.batch_size = batch_size or int(os.getenv('INGEST_BATCH_SIZE', 10000))
+        self.fsync = fsync
+        self.max_errors = max_errors
+
+    def ingest(self, doc_type: str, records: Iterable[Tuple[int, Any]]) -> Dict[str, Any]:
+        """Ingest (line number, record) pairs as produced by read_records"""
+        if doc_type not in SCHEMAS:
+            raise ValueError(f"Unknown document type '{doc_type}'; expected one of {sorted(SCHEMAS)}")
+        started = time.perf_counter()
+        report = {"doc_type": doc_type, "received": 0, "ingested": 0, "replaced": 0, "rejected": 0, "batches": 0,
+                  "errors": []}
+        batch: List[Dict[str, Any]] = []
+        id_key = SCHEMAS[doc_type]["ids"][0]  # validate_record fills in every id field
+
+        def flush():
+            collection = self.store.collection(doc_type)
+            stored = collection.primary_index if collection is not None else {}
+            batch_ids = set()
+            for document in batch:
+                doc_id = str(document[id_key])
+                if doc_id in stored or doc_id in batch_ids:
+                    report["replaced"] += 1
+                batch_ids.add(doc_id)
+            report["ingested"] += self.store.append_documents(doc_type, batch, fsync=self.fsync)
+            report["batches"] += 1
+            batch.clear()
+
+        for line_no, record in records:
+            report["received"] += 1
+            if isinstance(record, str):
+                document, errors = None, [record]
+            else:
+                document, errors = validate_record(doc_type, record)
+            if errors:
+                report["rejected"] += 1
+                if len(report["errors"]) < self.max_errors:
+                    report["errors"].append({"line": line_no, "errors": errors})
+                continue
+            batch.append(document)
+            if len(batch) >= self.batch_size:
+                flush()
+        if batch:
+            flush()
+
+        elapsed = time.perf_counter() - started
+        report["elapsed_seconds"] = round(elapsed, 3)
+        report["records_per_second"] = round(report["received"] / elapsed) if elapsed else 0
+        return report
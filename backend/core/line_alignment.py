@@ -0,0 +1,143 @@
+import heapq
+import re
+from collections import defaultdict, deque
+from difflib import SequenceMatcher
+from typing import Dict, List, Any, Optional
+
+SKU_FIELDS = ("sku", "item_code", "part_number")
+# Fuzzy matching only looks at candidates sharing one of a line's rarest description words
+FUZZY_PROBE_TOKENS = 3
+FUZZY_MAX_CANDIDATES = 8
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_description(text: Any) -> str:
+    return _NON_ALNUM.sub(" ", str(text or "").lower()).strip()
+
+
+def line_key(line: Dict[str, Any]) -> str:
+    """SKU when the line has one, otherwise its normalized description"""
+    for field in SKU_FIELDS:
+        if line.get(field):
+            return f"sku:{str(line[field]).strip().lower()}"
+    return f"desc:{normalize_description(line.get('description'))}"
+
+
+def line_keys(line: Dict[str, Any]) -> List[str]:
+    """Every key a line can be matched by: its SKU key first (if any), then its description key"""
+    keys = [f"sku:{str(line[field]).strip().lower()}" for field in SKU_FIELDS if line.get(field)][:1]
+    if line.get("description") or not keys:
+        keys.append(f"desc:{normalize_description(line.get('description'))}")
+    return keys
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _delta(invoice_value: Any, po_value: Any) -> Optional[float]:
+    a, b = _number(invoice_value), _number(po_value)
+    return round(a - b, 4) if a is not None and b is not None else None
+
+
+def align_lines(invoice_lines: List[Dict[str, Any]], po_lines: List[Dict[str, Any]],
+                fuzzy_threshold: float = 0.6) -> List[Dict[str, Any]]:
+    """Pair invoice lines with PO lines: exact SKU/description hash first, fuzzy description after.
+
+    Returns one row per invoice line, in invoice order, followed by the PO lines
+    nothing was matched to. Each row carries 1-based line numbers (None when
+    unmatched), how it was matched and the quantity/unit price/total deltas.
+    """
+    po_by_key = defaultdict(deque)
+    for j, po_line in enumerate(po_lines):
+        po_by_key[line_key(po_line)].append(j)
+
+    pairs: Dict[int, tuple] = {}  # invoice index -> (po index, match type, similarity)
+    used_po = set()
+    leftover_invoice = []
+    for i, inv_line in enumerate(invoice_lines):
+        candidates = po_by_key.get(line_key(inv_line))
+        if candidates:
+            j = candidates.popleft()
+            pairs[i] = (j, "exact", 1.0)
+            used_po.add(j)
+        else:
+            leftover_invoice.append(i)
+
+    if leftover_invoice:
+        _fuzzy_pair(invoice_lines, po_lines, leftover_invoice, used_po, pairs, fuzzy_threshold)
+
+    rows = []
+    for i, inv_line in enumerate(invoice_lines):
+        if i in pairs:
+            j, match, similarity = pairs[i]
+            po_line = po_lines[j]
+            rows.append({
+                "invoice_line": i + 1,
+                "po_line": j + 1,
+                "description": inv_line.get("description"),
+                "match": match,
+                "similarity": round(similarity, 3),
+                "quantity_delta": _delta(inv_line.get("quantity"), po_line.get("quantity")),
+                "unit_price_delta": _delta(inv_line.get("unit_price"), po_line.get("unit_price")),
+                "total_delta": _delta(inv_line.get("total"), po_line.get("total")),
+            })
+        else:
+            rows.append({"invoice_line": i + 1, "po_line": None,
+                         "description": inv_line.get("description"), "match": "unmatched_invoice"})
+    for j, po_line in enumerate(po_lines):
+        if j not in used_po:
+            rows.append({"invoice_line": None, "po_line": j + 1,
+                         "description": po_line.get("description"), "match": "unmatched_po"})
+    return rows
+
+
+def _fuzzy_pair(invoice_lines, po_lines, leftover_invoice, used_po, pairs, threshold):
+    """Greedy best-first fuzzy matching over an inverted index of PO description words"""
+    word_index = defaultdict(list)
+    descriptions = {}
+    for j, po_line in enumerate(po_lines):
+        if j in used_po:
+            continue
+        descriptions[j] = normalize_description(po_line.get("description"))
+        for word in set(descriptions[j].split()):
+            word_index[word].append(j)
+
+    for i in leftover_invoice:
+        description = normalize_description(invoice_lines[i].get("description"))
+        # Rarest shared words first; words no PO line has cannot find candidates, so they are not probes
+        words = sorted((w for w in set(description.split()) if w in word_index),
+                       key=lambda w: (len(word_index[w]), w))
+        shared = defaultdict(int)
+        for word in words[:FUZZY_PROBE_TOKENS]:
+            for j in word_index.get(word, ()):
+                if j not in used_po:
+                    shared[j] += 1
+
+        best = None
+        for j in heapq.nlargest(FUZZY_MAX_CANDIDATES, shared, key=shared.get):
+            similarity = SequenceMatcher(None, description, descriptions[j]).ratio()
+            if similarity >= threshold and (best is None or similarity > best[1]):
+                best = (j, similarity)
+        if best:
+            pairs[i] = (best[0], "fuzzy", best[1])
+            used_po.add(best[0])
+
+
+def received_quantities(received_items: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Total quantity received per line key from a goods receipt.
+
+    Items are counted under both their SKU and description keys (see line_keys),
+    so a SKU-keyed invoice line still finds a receipt that only has descriptions.
+    """
+    received: Dict[str, float] = defaultdict(float)
+    for item in received_items or []:
+        quantity = _number(item.get("quantity_received"))
+        if quantity is not None:
+            for key in line_keys(item):
+                received[key] += quantity
+    return received
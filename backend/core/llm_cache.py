@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional
+
+
+class LLMResponseCache:
+    """Content-addressed cache of chat completions: in-memory LRU in front of a sqlite table.
+
+    Entries expire after `ttl_seconds`; the sqlite tier is trimmed to `max_disk_bytes`
+    by least-recent use. Pass db_path="" to keep the cache in memory only.
+    """
+
+    def __init__(self, db_path: str = None, memory_entries: int = 1024,
+                 ttl_seconds: float = None, max_disk_bytes: int = None):
+        self.db_path = os.getenv('LLM_CACHE_PATH', 'llm_cache.sqlite') if db_path is None else db_path
+        self.memory_entries = memory_entries
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv('LLM_CACHE_TTL', 24 * 3600))
+        self.max_disk_bytes = max_disk_bytes or int(os.getenv('LLM_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes_since_trim = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+        payload = json.dumps([model, messages, temperature, max_tokens], sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        if not self.db_path:
+            return None
+        # One connection per thread (and per process, since connections must not cross a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "last_access REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+        value = None
+        try:
+            db = self._db()
+            if db is not None:
+                row = db.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[1] > now:
+                    value = row[0]
+                    with db:
+                        db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                    self._remember(key, value, row[1])
+        except sqlite3.Error:
+            pass  # A broken disk tier degrades to memory-only caching
+
+        with self._lock:
+            self.stats["disk_hits" if value is not None else "misses"] += 1
+        return value
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        self._remember(key, value, expires_at)
+        with self._lock:
+            self.stats["stores"] += 1
+            self._writes_since_trim += 1
+            trim = self._writes_since_trim >= 100
+            if trim:
+                self._writes_since_trim = 0
+        try:
+            db = self._db()
+            if db is not None:
+                with db:
+                    db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                               (key, value, expires_at, now, len(value.encode('utf-8'))))
+                if trim:
+                    self._trim(db, now)
+        except sqlite3.Error:
+            pass
+
+    def _remember(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def _trim(self, db: sqlite3.Connection, now: float):
+        """Drop expired rows, then least recently used rows until under the size budget"""
+        with db:
+            evicted = db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,)).rowcount
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_disk_bytes:
+                excess = total - self.max_disk_bytes
+                victims, freed = [], 0
+                for key, size in db.execute("SELECT key, size FROM responses ORDER BY last_access"):
+                    victims.append((key,))
+                    freed += size
+                    if freed >= excess:
+                        break
+                db.executemany("DELETE FROM responses WHERE key = ?", victims)
+                evicted += len(victims)
+        with self._lock:
+            self.stats["evictions"] += evicted
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats, memory_entries=len(self._memory))
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
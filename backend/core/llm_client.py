@@ -1,60 +1,323 @@
+import asyncio
 import openai
 import os
-from typing import List, Dict, Any
+import queue
+import random
+import threading
+import time
+import weakref
+import json
+from typing import Iterator, List, Dict, Any, Optional, Tuple
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from core.llm_cache import LLMResponseCache
+from core.singleflight import SingleFlight
 
 load_dotenv()
 
+# Status codes worth retrying: rate limits, timeouts and transient server errors
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None,
+                  base: float = 0.5, cap: float = 20.0) -> float:
+    """Seconds to wait before retry `attempt`: the server's Retry-After if given, else full-jitter exponential"""
+    if retry_after:
+        try:
+            return min(cap, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
 class LLMClient:
-    def __init__(self):
+    def __init__(self, cache: LLMResponseCache = None):
         # Set the API key globally first
         openai.api_key = os.getenv('OPENAI_API_KEY')
         
+        self.base_url = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
+        self.timeout = float(os.getenv('LLM_TIMEOUT', 30))
+        self.max_retries = int(os.getenv('LLM_MAX_RETRIES', 3))
+        # Upper bound on LLM calls in flight, per process (sync) and per event loop (async)
+        self.max_concurrency = int(os.getenv('LLM_MAX_CONCURRENCY', 16))
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._session: Optional[requests.Session] = None
+        self._session_pid = None
+        self._async_resources: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        
         # Try the new client initialization
         try:
-            self.client = openai.OpenAI()
+            self.client = openai.OpenAI(timeout=self.timeout, max_retries=self.max_retries)
         except Exception as e:
             print(f"Failed to initialize OpenAI client: {e}")
             # Fallback to older initialization if needed
             self.client = None
             
         self.model = "gpt-3.5-turbo"
+        self.cache = cache if cache is not None else LLMResponseCache()
+        # Identical requests already in flight are shared instead of sent again
+        self.inflight = SingleFlight()
+    
+    def chat_completion(self, messages: List[Dict[str, str]], temperature: float = 0.1,
+                        max_tokens: int = 1500) -> str:
+        """Get completion from OpenAI API, served from the response cache when possible"""
+        key = self._request_key(messages, temperature, max_tokens)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        
+        def complete() -> str:
+            content = self._request_completion(messages, temperature, max_tokens)
+            self._store(key, content)
+            return content
+        
+        return self.inflight.do(key, complete)
+    
+    def stream_chat_completion(self, messages: List[Dict[str, str]], temperature: float = 0.1,
+                               max_tokens: int = 1500) -> Iterator[str]:
+        """chat_completion delivered as content deltas while the model generates them.
+
+        A cached reply arrives as one delta. Streams are not coalesced with identical
+        requests in flight; a completed stream is cached like any other reply. On
+        failure the last delta is an "Error: ..." string, as chat_completion returns.
+        
+        The response is read on its own thread into a queue, so a concurrency slot is
+        held only while the model is generating, not while a slow consumer catches up.
+        Closing the iterator early stops the read and closes the connection.
+        """
+        key = self._request_key(messages, temperature, max_tokens)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        
+        deltas = queue.Queue()
+        abandoned = threading.Event()
+        
+        def read():
+            try:
+                with self._semaphore:
+                    for delta in self._stream_deltas(messages, temperature, max_tokens, abandoned):
+                        if delta:
+                            deltas.put(delta)
+            except Exception as e:
+                deltas.put(e)
+            finally:
+                deltas.put(None)
+        
+        threading.Thread(target=read, name="llm-stream", daemon=True).start()
+        parts = []
+        try:
+            while True:
+                delta = deltas.get()
+                if delta is None:
+                    break
+                if isinstance(delta, Exception):
+                    yield f"Error: {str(delta)}"
+                    return  # A partial reply is never cached
+                parts.append(delta)
+                yield delta
+        finally:
+            abandoned.set()
+        self._store(key, "".join(parts))
+    
+    def _stream_deltas(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int,
+                       abandoned: threading.Event) -> Iterator[str]:
+        """Content deltas of a streamed completion until it ends or `abandoned` is set"""
+        if self.client:
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            )
+            close = stream.response.close
+            deltas = (chunk.choices[0].delta.content for chunk in stream if chunk.choices)
+        else:
+            deltas = self._post_completion_stream(self._payload(messages, temperature, max_tokens))
+            close = deltas.close
+        try:
+            for delta in deltas:
+                if abandoned.is_set():
+                    return
+                yield delta
+        finally:
+            close()
+    
+    def _request_key(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+        """Cache/coalescing key; whitespace-only differences in prompts map to the same request"""
+        normalized = [dict(m, content=" ".join(str(m.get('content', '')).split())) for m in messages]
+        return self.cache.make_key(self.model, normalized, temperature, max_tokens)
+    
+    def _store(self, key: str, content: str):
+        # Failures are returned as "Error: ..." strings and must never be replayed from cache
+        if content and not content.startswith("Error:"):
+            self.cache.set(key, content)
     
-    def chat_completion(self, messages: List[Dict[str, str]], temperature: float = 0.1) -> str:
-        """Get completion from OpenAI API"""
+    def _request_completion(self, messages: List[Dict[str, str]], temperature: float,
+                            max_tokens: int) -> str:
+        """Call the OpenAI API"""
         try:
-            if self.client:
-                # Use new client
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=1500
+            with self._semaphore:
+                if self.client:
+                    # Use new client
+                    response = self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens
+                    )
+                    return response.choices[0].message.content
+                else:
+                    # Fallback to direct API call over a pooled keep-alive session
+                    return self._post_completion(self._payload(messages, temperature, max_tokens))
+        except Exception as e:
+            return f"Error: {str(e)}"
+    
+    def _payload(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> Dict[str, Any]:
+        return {
+            'model': self.model,
+            'messages': messages,
+            'temperature': temperature,
+            'max_tokens': max_tokens
+        }
+    
+    def _headers(self) -> Dict[str, str]:
+        headers = {'Content-Type': 'application/json'}
+        api_key = os.getenv('OPENAI_API_KEY')
+        if api_key:
+            headers['Authorization'] = f'Bearer {api_key}'
+        return headers
+    
+    def _http_session(self) -> requests.Session:
+        # Pooled connections must not be shared with a forked child
+        if self._session is None or self._session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session, self._session_pid = session, os.getpid()
+        return self._session
+    
+    def _post_completion(self, data: Dict[str, Any]) -> str:
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self._http_session().post(
+                    f'{self.base_url}/chat/completions',
+                    headers=self._headers(),
+                    json=data,
+                    timeout=self.timeout
                 )
-                return response.choices[0].message.content
-            else:
-                # Fallback to direct API call
-                import requests
-                api_key = os.getenv('OPENAI_API_KEY')
-                headers = {
-                    'Authorization': f'Bearer {api_key}',
-                    'Content-Type': 'application/json'
-                }
-                data = {
-                    'model': self.model,
-                    'messages': messages,
-                    'temperature': temperature,
-                    'max_tokens': 1500
-                }
-                response = requests.post(
-                    'https://api.openai.com/v1/chat/completions',
-                    headers=headers,
-                    json=data
+            except (requests.ConnectionError, requests.Timeout):
+                if last_attempt:
+                    raise
+                time.sleep(backoff_delay(attempt))
+                continue
+            if response.status_code in RETRYABLE_STATUS and not last_attempt:
+                time.sleep(backoff_delay(attempt, response.headers.get('Retry-After')))
+                continue
+            response.raise_for_status()  # Report the HTTP error, not a missing 'choices' key
+            return response.json()['choices'][0]['message']['content']
+    
+    def _post_completion_stream(self, data: Dict[str, Any]) -> Iterator[str]:
+        """Content deltas of a streamed completion (server-sent events); retries only before the first byte"""
+        data = dict(data, stream=True)
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self._http_session().post(
+                    f'{self.base_url}/chat/completions',
+                    headers=self._headers(),
+                    json=data,
+                    timeout=self.timeout,
+                    stream=True
                 )
+            except (requests.ConnectionError, requests.Timeout):
+                if last_attempt:
+                    raise
+                time.sleep(backoff_delay(attempt))
+                continue
+            if response.status_code in RETRYABLE_STATUS and not last_attempt:
+                response.close()
+                time.sleep(backoff_delay(attempt, response.headers.get('Retry-After')))
+                continue
+            response.raise_for_status()
+            response.encoding = 'utf-8'  # text/event-stream is UTF-8 whatever the headers say
+            with response:
+                for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                    if not line or not line.startswith('data:'):
+                        continue
+                    payload = line[len('data:'):].strip()
+                    if payload == '[DONE]':
+                        return
+                    choices = json.loads(payload).get('choices') or [{}]
+                    yield choices[0].get('delta', {}).get('content') or ''
+            return
+    
+    async def achat_completion(self, messages: List[Dict[str, str]], temperature: float = 0.1,
+                               max_tokens: int = 1500) -> str:
+        """Async chat_completion: pooled HTTP/1.1 keep-alive, bounded concurrency, jittered retries"""
+        key = self._request_key(messages, temperature, max_tokens)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        
+        async def complete() -> str:
+            content = await self._arequest_completion(messages, temperature, max_tokens)
+            self._store(key, content)
+            return content
+        
+        return await self.inflight.ado(key, complete)
+    
+    def _loop_resources(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        # httpx clients and asyncio semaphores are bound to the loop that created them
+        loop = asyncio.get_running_loop()
+        resources = self._async_resources.get(loop)
+        if resources is None:
+            limits = httpx.Limits(max_connections=self.max_concurrency,
+                                  max_keepalive_connections=self.max_concurrency)
+            client = httpx.AsyncClient(timeout=httpx.Timeout(self.timeout), limits=limits)
+            resources = (client, asyncio.Semaphore(self.max_concurrency))
+            self._async_resources[loop] = resources
+        return resources
+    
+    async def _arequest_completion(self, messages: List[Dict[str, str]], temperature: float,
+                                   max_tokens: int) -> str:
+        client, semaphore = self._loop_resources()
+        data = self._payload(messages, temperature, max_tokens)
+        try:
+            for attempt in range(self.max_retries + 1):
+                last_attempt = attempt == self.max_retries
+                # Hold a concurrency slot only while the request is on the wire, not while backing off
+                async with semaphore:
+                    try:
+                        response = await client.post(f'{self.base_url}/chat/completions',
+                                                     headers=self._headers(), json=data)
+                    except httpx.TransportError:
+                        if last_attempt:
+                            raise
+                        response = None
+                if response is None:
+                    await asyncio.sleep(backoff_delay(attempt))
+                    continue
+                if response.status_code in RETRYABLE_STATUS and not last_attempt:
+                    await asyncio.sleep(backoff_delay(attempt, response.headers.get('Retry-After')))
+                    continue
+                response.raise_for_status()  # Report the HTTP error, not a missing 'choices' key
                 return response.json()['choices'][0]['message']['content']
         except Exception as e:
             return f"Error: {str(e)}"
     
+    async def aclose(self):
+        """Close the pooled async connections of the running event loop"""
+        resources = self._async_resources.pop(asyncio.get_running_loop(), None)
+        if resources is not None:
+            await resources[0].aclose()
+    
     def extract_structured_data(self, prompt: str, data: str) -> Dict[str, Any]:
         """Extract structured data using LLM"""
         messages = [
@@ -1,42 +1,360 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
+from collections import OrderedDict
 from datetime import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
 import uuid
 
+# Response fields kept in memory; everything else is only in the session's spill file
+_KEPT_RESPONSE_FIELDS = ("explanation", "match_score", "verifier_confidence", "requires_human_review")
+_EXPLANATION_CHARS = 200
+_INTERACTION_OVERHEAD = 200  # Rough per-interaction cost of the dict and strings beyond their JSON size
+
+
+def _compact_response(response: Dict[str, Any]) -> Dict[str, Any]:
+    compact = {key: response[key] for key in _KEPT_RESPONSE_FIELDS if key in response}
+    if isinstance(compact.get("explanation"), str):
+        compact["explanation"] = compact["explanation"][:_EXPLANATION_CHARS]
+    return compact
+
+
+def _format_context(history: List[Dict[str, Any]], context_window: int) -> str:
+    recent = history[-context_window:] if len(history) > context_window else history
+
+    context = ""
+    for interaction in recent:
+        context += f"Previous Query: {interaction['query']}\n"
+        if 'explanation' in interaction['response']:
+            context += f"Previous Response: {interaction['response']['explanation'][:200]}...\n"
+
+    return context
+
+
 class ConversationMemory:
-    def __init__(self):
-        self.conversations: Dict[str, List[Dict[str, Any]]] = {}
-    
+    """Per-session conversation history, bounded by session count, idle time and approximate bytes.
+
+    Sessions are kept in LRU order. A session idle for longer than `idle_ttl_seconds`
+    expires; beyond `max_sessions` or `max_bytes` the least recently used go first.
+    Interactions keep only what get_context needs; the full response is appended
+    to the session's spill file. A spill file that reaches `spill_file_bytes` is
+    rolled to a new one, and files no kept interaction refers to any more are
+    removed, as are all of a session's files when it is evicted. Spill I/O
+    happens outside the store-wide lock.
+    """
+
+    def __init__(self, max_sessions: int = None, idle_ttl_seconds: float = None, max_bytes: int = None,
+                 max_interactions: int = 50, spill_dir: str = None, spill_file_bytes: int = None):
+        self.max_sessions = max_sessions or int(os.getenv('MEMORY_MAX_SESSIONS', 10000))
+        self.idle_ttl_seconds = idle_ttl_seconds or float(os.getenv('MEMORY_IDLE_TTL', 4 * 3600))
+        self.max_bytes = max_bytes or int(os.getenv('MEMORY_MAX_BYTES', 64 * 1024 * 1024))
+        self.max_interactions = max_interactions
+        self.spill_dir = spill_dir if spill_dir is not None else os.getenv('MEMORY_SPILL_DIR', 'sessions')
+        self.spill_file_bytes = spill_file_bytes or int(os.getenv('MEMORY_SPILL_FILE_BYTES', 1024 * 1024))
+        self.conversations: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._last_seen: Dict[str, float] = {}
+        self._session_bytes: Dict[str, int] = {}
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+        # Appends to one session's spill files are serialized by one of these, picked by session id
+        self._spill_locks = [threading.Lock() for _ in range(64)]
+        self._unreferenced: List[str] = []  # Spill files to remove once the lock is released
+        self.stats = {"evicted_idle": 0, "evicted_lru": 0, "evicted_bytes": 0, "spilled_bytes": 0,
+                      "spill_rolls": 0}
+
     def create_session(self) -> str:
         """Create new conversation session"""
         session_id = str(uuid.uuid4())
-        self.conversations[session_id] = []
+        with self._lock:
+            self._touch(session_id)
+            self._evict()
+        self._remove_unreferenced()
         return session_id
-    
+
+    def _touch(self, session_id: str, now: float = None) -> List[Dict[str, Any]]:
+        """The session's interactions, created if missing and marked most recently used (lock held)"""
+        history = self.conversations.get(session_id)
+        if history is None:
+            history = self.conversations[session_id] = []
+            self._session_bytes[session_id] = 0
+        self.conversations.move_to_end(session_id)
+        self._last_seen[session_id] = now or time.time()
+        return history
+
+    def _drop(self, session_id: str, reason: str):
+        """Remove a session; its spill files are removed by the next _remove_unreferenced (lock held)"""
+        history = self.conversations.pop(session_id)
+        del self._last_seen[session_id]
+        self.total_bytes -= self._session_bytes.pop(session_id)
+        self.stats[reason] += 1
+        if self.spill_dir:
+            generations = {interaction.get("spill_file", 0) for interaction in history} or {0}
+            self._unreferenced.extend(self._spill_path(session_id, generation) for generation in generations)
+
+    def _remove_unreferenced(self):
+        """Remove the spill files dropped sessions and trimmed histories left behind (lock not held)"""
+        if not self._unreferenced:
+            return
+        with self._lock:
+            paths, self._unreferenced = self._unreferenced, []
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        """Expire idle sessions, then drop least recently used ones until within bounds (lock held)"""
+        cutoff = time.time() - self.idle_ttl_seconds
+        # LRU order is last-access order, so idle sessions are all at the front
+        while self.conversations:
+            oldest = next(iter(self.conversations))
+            if self._last_seen[oldest] >= cutoff:
+                break
+            self._drop(oldest, "evicted_idle")
+        while len(self.conversations) > self.max_sessions:
+            self._drop(next(iter(self.conversations)), "evicted_lru")
+        while self.total_bytes > self.max_bytes and len(self.conversations) > 1:
+            self._drop(next(iter(self.conversations)), "evicted_bytes")
+
+    def _expired(self, session_id: str) -> bool:
+        last_seen = self._last_seen.get(session_id)
+        return last_seen is not None and last_seen < time.time() - self.idle_ttl_seconds
+
+    def _spill_path(self, session_id: str, generation: int = 0) -> str:
+        # Session ids come from clients: never use them as file names directly
+        name = hashlib.sha256(session_id.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.spill_dir, f"{name}.{generation}.jsonl" if generation else f"{name}.jsonl")
+
+    def _spill(self, session_id: str, generation: int, payload: bytes) -> Tuple[int, int]:
+        """Append a serialized response to the session's current spill file, rolling to the next
+        generation when it is full; returns (generation, offset) of the response"""
+        os.makedirs(self.spill_dir, exist_ok=True)
+        with self._spill_locks[hash(session_id) % len(self._spill_locks)]:
+            path = self._spill_path(session_id, generation)
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                size = 0
+            if size and size + len(payload) > self.spill_file_bytes:
+                generation += 1
+                path = self._spill_path(session_id, generation)
+                with self._lock:
+                    self.stats["spill_rolls"] += 1
+            with open(path, 'ab') as f:
+                offset = f.tell()
+                f.write(payload)
+        with self._lock:
+            self.stats["spilled_bytes"] += len(payload)
+        return generation, offset
+
     def add_interaction(self, session_id: str, query: str, response: Dict[str, Any]):
         """Add interaction to session memory"""
-        if session_id not in self.conversations:
-            self.conversations[session_id] = []
-        
         interaction = {
             "timestamp": datetime.now().isoformat(),
             "query": query,
-            "response": response
+            "response": _compact_response(response)
         }
-        self.conversations[session_id].append(interaction)
-    
+        # Serialization and the spill append happen before the store-wide lock is taken
+        payload = (json.dumps(response, default=str) + '\n').encode('utf-8') if self.spill_dir else None
+
+        with self._lock:
+            if self._expired(session_id):
+                self._drop(session_id, "evicted_idle")
+            history = self.conversations.get(session_id)
+            generation = history[-1].get("spill_file", 0) if history else 0
+        self._remove_unreferenced()
+        if payload is not None:
+            interaction["spill_file"], interaction["spill_offset"] = self._spill(session_id, generation, payload)
+        else:
+            interaction["spill_offset"] = None
+        size = len(json.dumps(interaction, default=str)) + _INTERACTION_OVERHEAD
+
+        with self._lock:
+            history = self._touch(session_id)
+            history.append(interaction)
+            self._session_bytes[session_id] += size
+            self.total_bytes += size
+            while len(history) > self.max_interactions:
+                dropped = history.pop(0)
+                dropped_size = len(json.dumps(dropped, default=str)) + _INTERACTION_OVERHEAD
+                self._session_bytes[session_id] -= dropped_size
+                self.total_bytes -= dropped_size
+                dropped_generation = dropped.get("spill_file", 0)
+                if self.spill_dir and dropped_generation < history[0].get("spill_file", 0):
+                    # No kept interaction is in that file any more
+                    self._unreferenced.append(self._spill_path(session_id, dropped_generation))
+            self._evict()
+        self._remove_unreferenced()
+
+    def get_session_history(self, session_id: str) -> List[Dict[str, Any]]:
+        """Get conversation history for session"""
+        with self._lock:
+            if session_id not in self.conversations:
+                return []
+            if self._expired(session_id):
+                self._drop(session_id, "evicted_idle")
+                history = []
+            else:
+                history = list(self._touch(session_id))
+        self._remove_unreferenced()
+        return history
+
+    def get_full_response(self, session_id: str, interaction: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The complete response of an interaction from get_session_history, read back from its spill file"""
+        offset = interaction.get("spill_offset")
+        if offset is None:
+            return None
+        try:
+            with open(self._spill_path(session_id, interaction.get("spill_file", 0)), 'rb') as f:
+                f.seek(offset)
+                return json.loads(f.readline())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def get_context(self, session_id: str, context_window: int = 3) -> str:
+        """Get recent conversation context"""
+        return _format_context(self.get_session_history(session_id), context_window)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, backend="memory", sessions=len(self.conversations), bytes=self.total_bytes,
+                        max_bytes=self.max_bytes,
+                        interactions=sum(len(history) for history in self.conversations.values()))
+
+
+class SQLiteConversationMemory:
+    """ConversationMemory kept in a sqlite database (WAL mode), shared by every worker process.
+
+    Any process can serve any session. Bounds match ConversationMemory except the
+    byte ceiling: full responses live on disk next to the compact interactions, so
+    disk use is bounded by `max_sessions` x `max_interactions`. Idle and excess
+    sessions are swept at most every `sweep_seconds` per process.
+    """
+
+    def __init__(self, db_path: str = None, max_sessions: int = None, idle_ttl_seconds: float = None,
+                 max_interactions: int = 50, sweep_seconds: float = 60.0):
+        self.db_path = db_path or os.getenv('MEMORY_DB_PATH', 'sessions.sqlite')
+        self.max_sessions = max_sessions or int(os.getenv('MEMORY_MAX_SESSIONS', 10000))
+        self.idle_ttl_seconds = idle_ttl_seconds or float(os.getenv('MEMORY_IDLE_TTL', 4 * 3600))
+        self.max_interactions = max_interactions
+        self.sweep_seconds = sweep_seconds
+        self._next_sweep = 0.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = {"evicted_idle": 0, "evicted_lru": 0}
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread (and per process, since connections must not cross a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY, last_seen REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen);
+                CREATE TABLE IF NOT EXISTS interactions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, timestamp TEXT NOT NULL,
+                    query TEXT NOT NULL, response TEXT NOT NULL, full_response TEXT NOT NULL);
+                CREATE INDEX IF NOT EXISTS interactions_session ON interactions (session_id, id);
+            """)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def create_session(self) -> str:
+        """Create new conversation session"""
+        session_id = str(uuid.uuid4())
+        self._db().execute("INSERT OR REPLACE INTO sessions VALUES (?, ?)", (session_id, time.time()))
+        self._maybe_sweep()
+        return session_id
+
+    def _delete_sessions(self, db: sqlite3.Connection, where: str, params: tuple) -> int:
+        """Delete the sessions selected by `where` and their interactions (transaction held)"""
+        db.execute(f"DELETE FROM interactions WHERE session_id IN (SELECT session_id FROM sessions WHERE {where})",
+                   params)
+        return db.execute(f"DELETE FROM sessions WHERE {where}", params).rowcount
+
+    def _maybe_sweep(self):
+        now = time.time()
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + self.sweep_seconds
+        db = self._db()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            idle = self._delete_sessions(db, "last_seen < ?", (now - self.idle_ttl_seconds,))
+            excess = self._delete_sessions(
+                db, "session_id IN (SELECT session_id FROM sessions ORDER BY last_seen DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,))
+        with self._lock:
+            self.stats["evicted_idle"] += idle
+            self.stats["evicted_lru"] += excess
+
+    def add_interaction(self, session_id: str, query: str, response: Dict[str, Any]):
+        """Add interaction to session memory"""
+        now = time.time()
+        db = self._db()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT last_seen FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is not None and row[0] < now - self.idle_ttl_seconds:
+                self._delete_sessions(db, "session_id = ?", (session_id,))
+                with self._lock:
+                    self.stats["evicted_idle"] += 1
+            db.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?)", (session_id, now))
+            db.execute("INSERT INTO interactions (session_id, timestamp, query, response, full_response) "
+                       "VALUES (?, ?, ?, ?, ?)",
+                       (session_id, datetime.now().isoformat(), query,
+                        json.dumps(_compact_response(response), default=str), json.dumps(response, default=str)))
+            db.execute("DELETE FROM interactions WHERE session_id = ? AND id IN "
+                       "(SELECT id FROM interactions WHERE session_id = ? ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                       (session_id, session_id, self.max_interactions))
+        self._maybe_sweep()
+
     def get_session_history(self, session_id: str) -> List[Dict[str, Any]]:
         """Get conversation history for session"""
-        return self.conversations.get(session_id, [])
-    
+        db = self._db()
+        row = db.execute("SELECT last_seen FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None or row[0] < time.time() - self.idle_ttl_seconds:
+            return []  # Unknown or expired; an expired session is removed by the next write or sweep
+        db.execute("UPDATE sessions SET last_seen = ? WHERE session_id = ?", (time.time(), session_id))
+        rows = db.execute("SELECT id, timestamp, query, response FROM interactions WHERE session_id = ? ORDER BY id",
+                          (session_id,)).fetchall()
+        return [{"timestamp": timestamp, "query": query, "response": json.loads(response), "interaction_id": row_id}
+                for row_id, timestamp, query, response in rows]
+
+    def get_full_response(self, session_id: str, interaction: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The complete response of an interaction from get_session_history"""
+        row = self._db().execute("SELECT full_response FROM interactions WHERE id = ? AND session_id = ?",
+                                 (interaction.get("interaction_id"), session_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
     def get_context(self, session_id: str, context_window: int = 3) -> str:
         """Get recent conversation context"""
-        history = self.get_session_history(session_id)
-        recent = history[-context_window:] if len(history) > context_window else history
-        
-        context = ""
-        for interaction in recent:
-            context += f"Previous Query: {interaction['query']}\n"
-            if 'explanation' in interaction['response']:
-                context += f"Previous Response: {interaction['response']['explanation'][:200]}...\n"
-        
-        return context
\ No newline at end of file
+        return _format_context(self.get_session_history(session_id), context_window)
+
+    def get_stats(self) -> Dict[str, Any]:
+        db = self._db()
+        with self._lock:
+            stats = dict(self.stats)
+        stats["sessions"] = db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        stats["interactions"] = db.execute("SELECT COUNT(*) FROM interactions").fetchone()[0]
+        stats["backend"] = "sqlite"
+        return stats
+
+
+def create_memory():
+    """The session store selected by MEMORY_BACKEND: "memory" (this process only, the default) or "sqlite"
+    (shared by every worker process, see serve.py)"""
+    backend = os.getenv('MEMORY_BACKEND', 'memory')
+    if backend == 'sqlite':
+        return SQLiteConversationMemory()
+    if backend != 'memory':
+        raise ValueError(f"Unknown MEMORY_BACKEND {backend!r}; expected 'memory' or 'sqlite'")
+    return ConversationMemory()
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Any, Callable, Optional, Sequence, Tuple
+
+
+class AgentTask:
+    """One agent call in a plan.
+
+    `run` receives the results of the tasks finished so far (keyed by result_key)
+    and returns this task's result, or None when it has nothing to contribute.
+    """
+
+    def __init__(self, name: str, result_key: str, run: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]],
+                 depends_on: Sequence[str] = (), timeout: float = None):
+        self.name = name
+        self.result_key = result_key
+        self.run = run
+        self.depends_on = tuple(depends_on)
+        self.timeout = timeout
+
+
+class PlanExecutor:
+    """Runs a plan's agent tasks as a dependency graph on a shared thread pool.
+
+    Tasks start as soon as the tasks they depend on have finished, so wall-clock
+    time follows the critical path. A task that raises or runs past its timeout
+    becomes an {"error": ...} result; its dependents still run on what is
+    available. A timed-out call cannot be interrupted, it finishes in the
+    background and its result is discarded.
+    """
+
+    def __init__(self, max_workers: int = None, default_timeout: float = None,
+                 timeouts: Dict[str, float] = None):
+        self.max_workers = max_workers or int(os.getenv('PLAN_MAX_WORKERS', 16))
+        self.default_timeout = default_timeout or float(os.getenv('PLAN_AGENT_TIMEOUT', 30))
+        self.timeouts = timeouts or {}
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        # Pool threads do not survive a fork, so each process gets its own pool
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="plan")
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _timeout(self, task: AgentTask) -> float:
+        if task.timeout is not None:
+            return task.timeout
+        return self.timeouts.get(task.name, self.default_timeout)
+
+    def run(self, tasks: List[AgentTask],
+            on_finish: Callable[[AgentTask, Dict[str, Any], Any], None] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Execute tasks; returns (results in task order, per-task execution report).
+
+        on_finish(task, report entry, result) is called on this thread as each task completes.
+        """
+        started = time.perf_counter()
+        names = {task.name for task in tasks}
+        # Dependencies on agents that are not part of this plan are already satisfied
+        waiting = {task.name: {dep for dep in task.depends_on if dep in names} for task in tasks}
+        by_name = {task.name: task for task in tasks}
+        results: Dict[str, Any] = {}
+        report: Dict[str, Dict[str, Any]] = {}
+        running: Dict[Future, Tuple[AgentTask, float]] = {}
+        pool = self._executor()
+
+        def finish(task: AgentTask, status: str, result: Any, began: float):
+            if result is not None:
+                results[task.result_key] = result
+            report[task.name] = {"status": status,
+                                 "started_ms": round((began - started) * 1000, 1),
+                                 "elapsed_ms": round((time.perf_counter() - began) * 1000, 1)}
+            for deps in waiting.values():
+                deps.discard(task.name)
+            if on_finish is not None:
+                on_finish(task, report[task.name], result)
+
+        while waiting or running:
+            for name in [name for name, deps in waiting.items() if not deps]:
+                del waiting[name]
+                task = by_name[name]
+                # Each task sees a snapshot, so later finishers cannot change its inputs mid-run
+                running[pool.submit(task.run, dict(results))] = (task, time.perf_counter())
+
+            if not running:
+                break  # Only a dependency cycle can leave tasks waiting with nothing running
+
+            now = time.perf_counter()
+            next_deadline = min(began + self._timeout(task) for task, began in running.values())
+            done, _ = wait(list(running), timeout=max(0.0, next_deadline - now), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                task, began = running.pop(future)
+                try:
+                    result = future.result()
+                    finish(task, "ok" if result is not None else "skipped", result, began)
+                except Exception as e:
+                    finish(task, "error", {"error": f"{task.name} failed: {e}"}, began)
+
+            now = time.perf_counter()
+            for future, (task, began) in list(running.items()):
+                if now - began >= self._timeout(task):
+                    del running[future]
+                    finish(task, "timeout",
+                           {"error": f"{task.name} timed out after {self._timeout(task):g}s"}, began)
+
+        for name in waiting:
+            report[name] = {"status": "unresolved_dependencies"}
+
+        ordered = {task.result_key: results[task.result_key] for task in tasks if task.result_key in results}
+        execution = {task.name: report[task.name] for task in tasks}
+        execution["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return ordered, execution
@@ -0,0 +1,142 @@
+import json
+import re
+from typing import Dict, List, Any, Tuple
+
+# Rough BPE approximation: punctuation is one token, words about one token per 4 characters
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+# Per-agent token budgets for the verifier prompt
+DEFAULT_BUDGETS = {
+    "po_matching": 600,
+    "retrieval": 400,
+    "web_search": 200,
+}
+DEFAULT_BUDGET = 300
+
+_DOC_FIELDS = ("id", "source_type", "vendor", "po_reference", "total_amount", "status", "flag_reason")
+_VENDOR_FIELDS = ("status", "risk_level", "compliance_score", "last_audit", "issues")
+
+
+def count_tokens(text: str) -> int:
+    """Local token estimate, close enough to tiktoken's cl100k for budgeting"""
+    return sum(1 if not piece[0].isalnum() else (len(piece) + 3) // 4 for piece in _PIECES.findall(text))
+
+
+def to_prompt_json(value: Any) -> str:
+    return json.dumps(value, separators=(',', ':'), default=str)
+
+
+def truncate_to_budget(text: str, budget: int, keep: str = "tail") -> str:
+    """Cut text to roughly `budget` tokens, keeping its start or (by default) its end"""
+    if count_tokens(text) <= budget:
+        return text
+    # Characters-per-token ratio of this text, so one slice gets close to the budget
+    chars = int(len(text) * budget / max(1, count_tokens(text)))
+    return text[-chars:] if keep == "tail" else text[:chars]
+
+
+def _doc_id(doc: Dict[str, Any]) -> Any:
+    return doc.get("id") or doc.get("invoice_id") or doc.get("po_id")
+
+
+def _project_po_matching(result: Dict[str, Any]) -> Dict[str, Any]:
+    if "error" in result:
+        return {"error": result["error"]}
+    invoice = result.get("invoice") or {}
+    po = result.get("purchase_order") or {}
+    gr = result.get("goods_receipt") or {}
+    line_issues = [row for row in result.get("line_item_analysis", [])
+                   if row.get("match") != "exact" or row.get("quantity_delta") or row.get("unit_price_delta")]
+    return {
+        "invoice_id": _doc_id(invoice) if invoice else None,
+        "po_id": _doc_id(po) if po else None,
+        "goods_receipt_id": gr.get("id"),
+        "match_score": result.get("match_score"),
+        "flag_reason": result.get("flag_reason"),
+        "discrepancies": result.get("discrepancies", []),
+        "evidence": result.get("evidence", {}),
+        "invoice_status": invoice.get("status"),
+        "invoice_flag_reason": invoice.get("flag_reason"),
+        "line_item_issues": line_issues,
+    }
+
+
+def _project_retrieval(result: Dict[str, Any], seen: set) -> Dict[str, Any]:
+    documents, duplicates = [], 0
+    for doc in result.get("documents", []):
+        doc_id = _doc_id(doc)
+        if doc_id in seen:
+            duplicates += 1  # Already in the PO-matching result or earlier in this list
+            continue
+        seen.add(doc_id)
+        documents.append({k: doc[k] for k in _DOC_FIELDS if doc.get(k) is not None})
+    return {"documents": documents, "duplicates_removed": duplicates}
+
+
+def _project_web_search(result: Dict[str, Any]) -> Dict[str, Any]:
+    data = result.get("data") or {}
+    return dict({"vendor": result.get("vendor"), "found": result.get("found")},
+                **{k: data[k] for k in _VENDOR_FIELDS if k in data})
+
+
+def _largest_list(value: Any) -> List:
+    """The longest list anywhere inside value (None when there is nothing left to shrink)"""
+    best = None
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            if len(item) > 1 and (best is None or len(item) > len(best)):
+                best = item
+            stack.extend(item)
+    return best
+
+
+def _fit(section: Dict[str, Any], budget: int) -> int:
+    """Halve the longest lists in section until it fits the budget; returns items dropped"""
+    dropped = 0
+    while count_tokens(to_prompt_json(section)) > budget:
+        longest = _largest_list(section)
+        if longest is None:
+            break
+        keep = len(longest) // 2
+        dropped += len(longest) - keep
+        del longest[keep:]
+    return dropped
+
+
+def compact_agent_results(agent_results: Dict[str, Any],
+                          budgets: Dict[str, int] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Project agent outputs down to decision-relevant fields within per-agent token budgets.
+
+    Returns the compact results and a size report (token estimates before/after, per agent).
+    """
+    budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+    compact: Dict[str, Any] = {}
+    seen: set = set()
+
+    po_result = agent_results.get("po_matching")
+    if po_result is not None:
+        compact["po_matching"] = _project_po_matching(po_result)
+        seen |= {compact["po_matching"].get(k) for k in ("invoice_id", "po_id", "goods_receipt_id")}
+    if "retrieval" in agent_results:
+        compact["retrieval"] = _project_retrieval(agent_results["retrieval"], seen)
+    if "web_search" in agent_results:
+        compact["web_search"] = _project_web_search(agent_results["web_search"])
+    for name, result in agent_results.items():
+        compact.setdefault(name, result)
+    # Detach from the agents' (possibly cached) objects before lists get trimmed in place
+    compact = json.loads(to_prompt_json(compact))
+
+    report = {"agents": {}}
+    for name, section in compact.items():
+        before = count_tokens(to_prompt_json(agent_results[name]))
+        dropped = _fit(section, budgets.get(name, DEFAULT_BUDGET)) if isinstance(section, dict) else 0
+        report["agents"][name] = {"before_tokens": before,
+                                  "after_tokens": count_tokens(to_prompt_json(section)),
+                                  "items_dropped": dropped}
+    report["before_tokens"] = sum(a["before_tokens"] for a in report["agents"].values())
+    report["after_tokens"] = sum(a["after_tokens"] for a in report["agents"].values())
+    return compact, report
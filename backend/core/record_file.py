@@ -0,0 +1,181 @@
+import json
+import mmap
+import os
+from array import array
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+
+CHUNK_SIZE = 1 << 20  # Characters read per step while streaming a JSON array
+
+
+def _byte_length(text: str) -> int:
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+def iter_json_array(file_path: str) -> Iterator[Tuple[Dict[str, Any], int, int]]:
+    """Stream the objects of one or more top-level JSON arrays as (record, byte start, byte end).
+
+    Only one chunk plus the record being decoded is held in memory at a time.
+    """
+    decoder = json.JSONDecoder()
+    # newline='' keeps \r\n as two characters, so character counts stay byte counts
+    with open(file_path, 'r', encoding='utf-8', newline='') as f:
+        buf = ""
+        pos = 0          # Position in buf
+        byte_pos = 0     # File byte offset of buf[pos]
+        eof = False
+        while True:
+            start = pos
+            while pos < len(buf) and buf[pos] in " \t\r\n,[]":
+                pos += 1
+            byte_pos += pos - start  # Separators are ASCII
+
+            if pos >= len(buf) or not eof and len(buf) - pos < CHUNK_SIZE // 2:
+                if eof:
+                    if pos >= len(buf):
+                        return
+                else:
+                    chunk = f.read(CHUNK_SIZE)
+                    eof = not chunk
+                    buf = buf[pos:] + chunk
+                    pos = 0
+                    continue
+
+            try:
+                record, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Record straddles the chunk boundary: read more and retry
+                chunk = f.read(CHUNK_SIZE)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+
+            length = _byte_length(buf[pos:end])
+            yield record, byte_pos, byte_pos + length
+            byte_pos += length
+            pos = end
+
+
+def iter_json_lines(file_path: str) -> Iterator[Tuple[Dict[str, Any], int, int]]:
+    """Stream the records of a JSONL file as (record, byte start, byte end)"""
+    with open(file_path, 'rb') as f:
+        offset = 0
+        for line in f:
+            stripped = line.strip()
+            if stripped:
+                start = offset + line.index(stripped[:1])
+                yield json.loads(stripped), start, start + len(stripped)
+            offset += len(line)
+
+
+class RecordFile:
+    """Read-only sequence view of a JSON-array or JSONL file backed by a byte-offset index.
+
+    The first full iteration streams the file once and records where each record
+    starts and ends; after that any record is decoded straight from an mmap of
+    the file without touching the rest of it.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.is_jsonl = file_path.endswith(".jsonl")
+        self._starts = array('q')
+        self._ends = array('q')
+        self._indexed = False
+        self._mmap = None
+        self._inode = None  # Of the file the offsets describe
+        # Records added after the file was indexed (e.g. by ingestion) live in memory
+        self._extra: List[Dict[str, Any]] = []
+
+    def _scan(self) -> Iterator[Dict[str, Any]]:
+        stream = iter_json_lines if self.is_jsonl else iter_json_array
+        starts, ends = array('q'), array('q')
+        for record, start, end in stream(self.file_path):
+            starts.append(start)
+            ends.append(end)
+            yield record
+        self._starts, self._ends = starts, ends
+        if starts:
+            self._map()
+        self._indexed = True
+
+    def _map(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        with open(self.file_path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._inode = os.fstat(f.fileno()).st_ino
+
+    def build_index(self):
+        for _ in self._scan():
+            pass
+
+    def raw(self, index: int) -> Optional[bytes]:
+        """The record's JSON bytes as stored, or None for records that live only in memory"""
+        if index >= len(self._starts):
+            return None
+        return self._bytes(index)
+
+    def _read(self, index: int) -> Dict[str, Any]:
+        if index >= len(self._starts):
+            return self._extra[index - len(self._starts)]
+        return json.loads(self._bytes(index))
+
+    def _bytes(self, index: int) -> bytes:
+        start, end = self._starts[index], self._ends[index]
+        mapped = self._mmap
+        if mapped is not None and not mapped.closed:
+            return mapped[start:end]
+        # Closed by a reload while a reader still held this version: the indexed bytes are still
+        # valid as long as the file was only appended to, not replaced
+        with open(self.file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_ino != self._inode:
+                raise RuntimeError(f"{self.file_path} was replaced after this view of it was closed")
+            f.seek(start)
+            return f.read(end - start)
+
+    def __len__(self) -> int:
+        if not self._indexed:
+            self.build_index()
+        return len(self._starts) + len(self._extra)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("record index out of range")
+        return self._read(index)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        if not self._indexed:
+            yield from self._scan()
+        else:
+            for index in range(len(self._starts)):
+                yield self._read(index)
+        yield from list(self._extra)
+
+    def append(self, record: Dict[str, Any]):
+        self._extra.append(record)
+
+    def extend_indexed(self, records: List[Dict[str, Any]], starts: List[int], ends: List[int]):
+        """Take records just appended to the file at the given byte ranges, without keeping them in memory"""
+        if not self._indexed:
+            self.build_index()  # Streams the whole file, appended records included
+            return
+        if self._extra:
+            # Positions must stay in order: once records live in memory, later ones follow them there
+            self._extra.extend(records)
+            return
+        self._starts.extend(starts)
+        self._ends.extend(ends)
+        self._map()
+
+    def close(self):
+        """Unmap the file; later reads (from a thread still holding this view) go through a plain file read"""
+        if self._mmap is not None:
+            self._mmap.close()
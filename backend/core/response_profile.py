@@ -0,0 +1,75 @@
+from typing import Dict, Iterable, List, Any, Optional, Union
+from core.document_store import PRIMARY_KEYS
+
+# Top-level response fields per profile; None keeps every field
+PROFILES: Dict[str, Optional[tuple]] = {
+    "minimal": ("session_id", "explanation", "match_score", "verifier_confidence", "requires_human_review"),
+    "standard": ("session_id", "explanation", "match_score", "verifier_confidence", "requires_human_review",
+                 "invoice_id", "query_type", "evidence", "recommendations", "audit_url"),
+    "debug": None,
+}
+
+DEFAULT_PROFILE = "standard"
+
+
+def parse_fields(fields: Union[str, Iterable[str], None]) -> List[str]:
+    """Field paths from "a,b.c" or a list; dots select nested keys"""
+    if not fields:
+        return []
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    return [field.strip() for field in fields if field and field.strip()]
+
+
+def _select_path(source: Dict[str, Any], target: Dict[str, Any], path: List[str]):
+    key = path[0]
+    if not isinstance(source, dict) or key not in source:
+        return
+    if len(path) == 1:
+        target[key] = source[key]
+        return
+    child = target.get(key)
+    if not isinstance(child, dict):
+        child = target[key] = {}
+    _select_path(source[key], child, path[1:])
+
+
+def select_fields(response: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """Only the given field paths of response, nested as in response; unknown paths are skipped"""
+    selected: Dict[str, Any] = {}
+    for field in fields:
+        _select_path(response, selected, field.split("."))
+    return selected
+
+
+def shape_response(response: Dict[str, Any], profile: str = None, fields: List[str] = None) -> Dict[str, Any]:
+    """The response as the client asked for it: explicit fields win over the profile's field set"""
+    if fields:
+        selected = select_fields(response, fields)
+        selected.setdefault("session_id", response.get("session_id"))
+        return selected
+    keep = PROFILES[profile or DEFAULT_PROFILE]
+    if keep is None:
+        return response
+    return {key: response[key] for key in keep if key in response}
+
+
+def stage_summary(result_key: str, result: Any) -> Dict[str, Any]:
+    """The highlights of one agent's result, for a streamed stage event"""
+    if not isinstance(result, dict):
+        return {}
+    if "error" in result and result_key != "web_search":
+        return {"error": result["error"]}
+    if result_key == "retrieval":
+        documents = result.get("documents", [])
+        return {"documents": len(documents),
+                "top": [next((doc[key] for key in PRIMARY_KEYS if doc.get(key)), None) for doc in documents[:3]]}
+    if result_key == "po_matching":
+        return {"invoice_id": (result.get("invoice") or {}).get("invoice_id"),
+                "match_score": result.get("match_score"),
+                "discrepancies": result.get("discrepancies", [])}
+    if result_key == "web_search":
+        data = result.get("data") or {}
+        return {"vendor": result.get("vendor"), "found": result.get("found"), "error": result.get("error"),
+                "risk_level": data.get("risk_level"), "compliance_score": data.get("compliance_score")}
+    return {}
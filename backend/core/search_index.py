@@ -0,0 +1,163 @@
+import heapq
+import math
+import re
+from typing import Dict, List, Any, Tuple, Iterator
+
+# Keeps identifiers like INV-123 / PO-456 and decimals like 1500.50 as single tokens
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-.][a-z0-9]+)*")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "i", "in",
+    "is", "it", "me", "my", "of", "on", "or", "show", "that", "the", "this", "to",
+    "was", "were", "what", "when", "which", "who", "why", "with", "all", "any",
+}
+
+# Matches in identifying fields count for more than matches in free text
+FIELD_WEIGHTS = {
+    "id": 3.0,
+    "invoice_id": 3.0,
+    "po_id": 3.0,
+    "po_reference": 2.0,
+    "vendor": 2.0,
+    "status": 1.5,
+    "description": 1.5,
+    "flag_reason": 1.0,
+}
+DEFAULT_FIELD_WEIGHT = 0.5
+
+MIN_COMMON_DF = 1000
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, split into terms, drop stopwords; compound ids also yield their numeric part"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if '-' in token:
+            # "inv-123" is also findable as "123"; the shared "inv" prefix would match everything
+            tokens.extend(part for part in token.split('-') if part.isdigit())
+    return tokens
+
+
+def _field_values(doc: Any, field: str = "") -> Iterator[Tuple[str, str]]:
+    """Flatten a (nested) document into (field name, text) pairs"""
+    if isinstance(doc, dict):
+        for key, value in doc.items():
+            yield from _field_values(value, key)
+    elif isinstance(doc, list):
+        for item in doc:
+            yield from _field_values(item, field)
+    elif isinstance(doc, bool) or doc is None:
+        return
+    elif isinstance(doc, float) and doc.is_integer():
+        yield field, str(int(doc))
+    else:
+        yield field, str(doc)
+
+
+def document_text(doc: Dict[str, Any]) -> str:
+    """All searchable text of a document as one string"""
+    return " ".join(text for _, text in _field_values(doc))
+
+
+class BM25Index:
+    """Field-weighted BM25 over an inverted index of document positions"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, field_weights: Dict[str, float] = None,
+                 common_term_ratio: float = 0.05):
+        self.k1 = k1
+        self.b = b
+        self.field_weights = field_weights or FIELD_WEIGHTS
+        # Terms in more than this share of documents (and over MIN_COMMON_DF) only
+        # re-score candidates found by rarer terms instead of scanning their postings
+        self.common_term_ratio = common_term_ratio
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.doc_lengths: Dict[int, float] = {}
+        self.total_length = 0.0
+        # term -> [(score contribution, position)] best first; dropped whenever the corpus changes
+        self._impacts: Dict[str, List[Tuple[float, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add_document(self, position: int, doc: Dict[str, Any]):
+        """Index (or re-index) one document; cost is proportional to its size only"""
+        if position in self.doc_lengths:
+            self.remove_document(position)
+
+        term_weights = self._term_weights(doc)
+        for token, weight in term_weights.items():
+            self.postings.setdefault(token, {})[position] = weight
+        length = sum(term_weights.values())
+        self.doc_lengths[position] = length
+        self.total_length += length
+        self._impacts.clear()
+
+    def _term_weights(self, doc: Dict[str, Any]) -> Dict[str, float]:
+        term_weights: Dict[str, float] = {}
+        for field, text in _field_values(doc):
+            weight = self.field_weights.get(field, DEFAULT_FIELD_WEIGHT)
+            for token in tokenize(text):
+                term_weights[token] = term_weights.get(token, 0.0) + weight
+        return term_weights
+
+    def remove_document(self, position: int, doc: Dict[str, Any] = None):
+        """Drop a position; given the document indexed there, only its own terms are visited"""
+        length = self.doc_lengths.pop(position, None)
+        if length is None:
+            return
+        self.total_length -= length
+        self._impacts.clear()
+        tokens = self._term_weights(doc) if doc is not None else self.postings
+        for token in [t for t in tokens if position in self.postings.get(t, ())]:
+            del self.postings[token][position]
+            if not self.postings[token]:
+                del self.postings[token]
+
+    def _idf(self, token: str) -> float:
+        df = len(self.postings[token])
+        return math.log(1 + (len(self.doc_lengths) - df + 0.5) / (df + 0.5))
+
+    def _term_score(self, tf: float, position: int, avg_length: float) -> float:
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[position] / avg_length)
+        return tf * (self.k1 + 1) / (tf + norm)
+
+    def _term_impacts(self, token: str, avg_length: float) -> List[Tuple[float, int]]:
+        impacts = self._impacts.get(token)
+        if impacts is None:
+            idf = self._idf(token)
+            impacts = sorted(((idf * self._term_score(tf, position, avg_length), position)
+                              for position, tf in self.postings[token].items()), reverse=True)
+            self._impacts[token] = impacts
+        return impacts
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[float, int]]:
+        """Top-k (score, position) pairs, best first"""
+        n_docs = len(self.doc_lengths)
+        terms = sorted((t for t in set(tokenize(query)) if t in self.postings),
+                       key=lambda t: len(self.postings[t]))
+        if n_docs == 0 or not terms:
+            return []
+
+        avg_length = self.total_length / n_docs or 1.0
+        if len(terms) == 1:
+            return self._term_impacts(terms[0], avg_length)[:k]
+
+        # Rarest terms first; once rarer terms found candidates, common terms only refine them
+        scores: Dict[int, float] = {}
+        common_df = max(self.common_term_ratio * n_docs, MIN_COMMON_DF)
+        for token in terms:
+            docs = self.postings[token]
+            if scores and len(docs) > common_df:
+                idf = self._idf(token)
+                for position in scores:
+                    tf = docs.get(position)
+                    if tf:
+                        scores[position] += idf * self._term_score(tf, position, avg_length)
+            else:
+                for impact, position in self._term_impacts(token, avg_length):
+                    scores[position] = scores.get(position, 0.0) + impact
+
+        return heapq.nlargest(k, ((score, position) for position, score in scores.items()))
@@ -0,0 +1,136 @@
+import json
+import os
+import zlib
+from typing import Dict, Iterable, List, Any, Optional, Tuple
+
+import numpy as np
+
+from core.search_index import tokenize, document_text
+
+
+class HashingEncoder:
+    """Offline text encoder: signed feature hashing of words and character trigrams.
+
+    Needs no model files or network. Any object with the same `name`, `dim` and
+    `encode(texts) -> float32 array` interface can be plugged in instead.
+    """
+
+    def __init__(self, dim: int = 256, trigram_weight: float = 0.5):
+        self.dim = dim
+        self.trigram_weight = trigram_weight
+        self.name = f"hashing-{dim}-{trigram_weight}"
+
+    def _features(self, text: str) -> Dict[str, float]:
+        features: Dict[str, float] = {}
+        for token in tokenize(text):
+            features[token] = features.get(token, 0.0) + 1.0
+            padded = f"#{token}#"
+            for i in range(len(padded) - 2):
+                gram = "3:" + padded[i:i + 3]
+                features[gram] = features.get(gram, 0.0) + self.trigram_weight
+        return features
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                # crc32 is stable across processes, unlike hash()
+                h = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if h & 0x80000000 else -1.0
+                vectors[row, h % self.dim] += sign * (1.0 + np.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class VectorIndex:
+    """Unit-normalized document vectors in one contiguous float32 matrix (row = document position)"""
+
+    def __init__(self, encoder, matrix: Optional[np.ndarray] = None):
+        self.encoder = encoder
+        self._matrix = matrix if matrix is not None else np.empty((0, encoder.dim), dtype=np.float32)
+        self._size = len(self._matrix)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._matrix[:self._size]
+
+    def build(self, documents: List[Dict[str, Any]], batch_size: int = 1024):
+        """Embed a whole collection in batches into a preallocated matrix"""
+        matrix = np.empty((len(documents), self.encoder.dim), dtype=np.float32)
+        for start in range(0, len(documents), batch_size):
+            batch = documents[start:start + batch_size]
+            matrix[start:start + len(batch)] = self.encoder.encode([document_text(d) for d in batch])
+        self._matrix = matrix
+        self._size = len(matrix)
+
+    def add(self, documents: List[Dict[str, Any]]):
+        """Append vectors for new documents (positions continue from the current size)"""
+        if not documents:
+            return
+        vectors = self.encoder.encode([document_text(d) for d in documents])
+        needed = self._size + len(vectors)
+        if needed > len(self._matrix) or not self._matrix.flags.writeable:
+            # Grow geometrically so repeated appends stay amortized O(1) per row
+            grown = np.empty((max(needed, 2 * len(self._matrix)), self.encoder.dim), dtype=np.float32)
+            grown[:self._size] = self.matrix
+            self._matrix = grown
+        self._matrix[self._size:needed] = vectors
+        self._size = needed
+
+    def remove(self, positions: Iterable[int]):
+        """Zero the vectors at these positions, so they never clear a non-negative min_similarity"""
+        rows = [position for position in positions if position < self._size]
+        if not rows:
+            return
+        if not self._matrix.flags.writeable:
+            self._matrix = np.array(self._matrix)  # Loaded read-only (mmap): take a private copy
+        self._matrix[rows] = 0.0
+
+    def search(self, queries: List[str], k: int = 5,
+               min_similarity: float = 0.0) -> List[List[Tuple[float, int]]]:
+        """Batched cosine top-k: one list of (similarity, position), best first, per query"""
+        if self._size == 0 or not queries:
+            return [[] for _ in queries]
+
+        similarities = self.encoder.encode(queries) @ self.matrix.T
+        k = min(k, self._size)
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+
+        results = []
+        for row, candidates in enumerate(top):
+            scores = similarities[row, candidates]
+            order = np.argsort(-scores)
+            results.append([(float(scores[i]), int(candidates[i])) for i in order
+                            if scores[i] > min_similarity])
+        return results
+
+    def save(self, path: str, signature: Any):
+        """Write <path>.npy and <path>.meta.json; the metadata ties the vectors to a data file version"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npy"
+        np.save(tmp_path, self.matrix)
+        os.replace(tmp_path, f"{path}.npy")
+        meta = {"encoder": self.encoder.name, "dim": self.encoder.dim,
+                "size": self._size, "signature": list(signature)}
+        with open(f"{path}.meta.json.tmp", 'w') as f:
+            json.dump(meta, f)
+        os.replace(f"{path}.meta.json.tmp", f"{path}.meta.json")
+
+    @classmethod
+    def load(cls, path: str, encoder, signature: Any, mmap: bool = True) -> Optional["VectorIndex"]:
+        """Load a saved index if it was built by the same encoder for the same data file version"""
+        try:
+            with open(f"{path}.meta.json", 'r') as f:
+                meta = json.load(f)
+            if meta["encoder"] != encoder.name or meta["signature"] != list(signature):
+                return None
+            matrix = np.load(f"{path}.npy", mmap_mode='r' if mmap else None)
+        except (OSError, ValueError, KeyError):
+            return None
+        if matrix.shape != (meta["size"], encoder.dim):
+            return None
+        return cls(encoder, matrix)
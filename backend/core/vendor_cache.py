@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Any, Optional
+from core.singleflight import SingleFlight
+
+# Sentinel stored for vendors the backend does not know, so misses are not refetched every time
+_NOT_FOUND = object()
+
+
+class VendorRiskCache:
+    """Vendor risk lookups with per-entry TTL, stale-while-revalidate and negative caching.
+
+    A fresh entry is served as is. Past `ttl_seconds` it is still served for up
+    to `stale_seconds` more while a background refresh replaces it; after that
+    the caller waits for the backend. Vendors the backend does not know are
+    remembered for `negative_ttl_seconds`. If a refresh fails, the stale value
+    keeps being served. `backend` is any callable vendor -> data dict, or None
+    when the vendor is unknown; `clock` gives the current time in seconds.
+    """
+
+    def __init__(self, backend: Callable[[str], Optional[Dict[str, Any]]], ttl_seconds: float = None,
+                 stale_seconds: float = None, negative_ttl_seconds: float = None,
+                 max_entries: int = 10000, refresh_workers: int = 4, clock: Callable[[], float] = time.time):
+        self.backend = backend
+        self.clock = clock
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv('VENDOR_CACHE_TTL', 6 * 3600))
+        self.stale_seconds = (stale_seconds if stale_seconds is not None
+                              else float(os.getenv('VENDOR_CACHE_STALE', 18 * 3600)))
+        self.negative_ttl_seconds = (negative_ttl_seconds if negative_ttl_seconds is not None
+                                     else float(os.getenv('VENDOR_CACHE_NEGATIVE_TTL', 15 * 60)))
+        self.max_entries = max_entries
+        self.refresh_workers = refresh_workers
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (fetched_at, data)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._fetches = SingleFlight()
+        self._pool = None
+        self._pool_pid = None
+        self._scheduler = None
+        self.stats = {"hits": 0, "stale_hits": 0, "negative_hits": 0, "misses": 0,
+                      "refreshes": 0, "errors": 0, "prefetched": 0}
+
+    @staticmethod
+    def _key(vendor: str) -> str:
+        return " ".join(vendor.split()).casefold()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        # Refresh threads do not survive a fork, so each process gets its own pool
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.refresh_workers, thread_name_prefix="vendor")
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def get(self, vendor: str) -> Optional[Dict[str, Any]]:
+        """Risk data for vendor, or None when the backend does not know it"""
+        key = self._key(vendor)
+        now = self.clock()
+        revalidate = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                fetched_at, data = entry
+                age = now - fetched_at
+                self._entries.move_to_end(key)
+                if data is _NOT_FOUND:
+                    if age < self.negative_ttl_seconds:
+                        self.stats["negative_hits"] += 1
+                        return None
+                elif age < self.ttl_seconds:
+                    self.stats["hits"] += 1
+                    return data
+                elif age < self.ttl_seconds + self.stale_seconds:
+                    self.stats["stale_hits"] += 1
+                    revalidate = key not in self._refreshing
+                    if revalidate:
+                        self._refreshing.add(key)
+                else:
+                    entry = None
+            if entry is None or entry[1] is _NOT_FOUND:
+                self.stats["misses"] += 1
+
+        if entry is not None and entry[1] is not _NOT_FOUND:
+            if revalidate:
+                self._executor().submit(self._refresh, vendor, key)
+            return entry[1]
+        return self._fetches.do(key, lambda: self._fetch(vendor, key))
+
+    def _fetch(self, vendor: str, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            data = self.backend(vendor)
+        except Exception:
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+        self._put(key, data)
+        return data
+
+    def _refresh(self, vendor: str, key: str):
+        try:
+            self._fetches.do(key, lambda: self._fetch(vendor, key))
+            with self._lock:
+                self.stats["refreshes"] += 1
+        except Exception:
+            pass  # Keep serving the stale entry; the next stale read retries
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _put(self, key: str, data: Optional[Dict[str, Any]]):
+        with self._lock:
+            self._entries[key] = (self.clock(), _NOT_FOUND if data is None else data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def prefetch(self, vendors: Iterable[str]) -> Dict[str, Any]:
+        """Fetch every distinct vendor from the backend concurrently, replacing cached entries"""
+        started = time.perf_counter()
+        distinct: Dict[str, str] = {}
+        for vendor in vendors:
+            if vendor:
+                distinct.setdefault(self._key(vendor), vendor)  # First spelling seen is the one fetched
+        pool = self._executor()
+        futures = [pool.submit(self._fetches.do, key, lambda v=vendor, k=key: self._fetch(v, k))
+                   for key, vendor in distinct.items()]
+        found = failed = 0
+        for future in futures:
+            try:
+                found += future.result() is not None
+            except Exception:
+                failed += 1
+        with self._lock:
+            self.stats["prefetched"] += len(distinct) - failed
+        return {"vendors": len(distinct), "found": found, "failed": failed,
+                "elapsed_seconds": round(time.perf_counter() - started, 3)}
+
+    def schedule_prefetch(self, vendor_source: Callable[[], Iterable[str]], at: str = "06:00",
+                          run_now: bool = True):
+        """Warm the cache now (unless run_now is False) and then daily at local time `at` (HH:MM),
+        on a daemon thread"""
+        hour, minute = (int(part) for part in at.split(":"))
+
+        def run():
+            due = run_now
+            while True:
+                if due:
+                    try:
+                        self.prefetch(vendor_source())
+                    except Exception as e:
+                        print(f"Vendor prefetch failed: {e}")
+                due = True
+                now = datetime.now()
+                next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+                if next_run <= now:
+                    next_run += timedelta(days=1)
+                time.sleep((next_run - now).total_seconds())
+
+        if self._scheduler is None or not self._scheduler.is_alive():
+            self._scheduler = threading.Thread(target=run, name="vendor-prefetch", daemon=True)
+            self._scheduler.start()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats, entries=len(self._entries), refreshing=len(self._refreshing))
+        lookups = stats["hits"] + stats["stale_hits"] + stats["negative_hits"] + stats["misses"]
+        served = stats["hits"] + stats["stale_hits"] + stats["negative_hits"]
+        stats["hit_rate"] = round(served / lookups, 3) if lookups else 0.0
+        return stats
@@ -0,0 +1,106 @@
+"""Production serving mode: a pre-fork pool of worker processes sharing one listening socket.
+
+    python serve.py --workers 4 --port 5000
+
+The parent loads documents, indexes, match results and vendor risk data once,
+then forks; workers share that memory copy-on-write and accept connections from
+the same socket. Conversation memory defaults to the shared sqlite backend
+(MEMORY_BACKEND=sqlite), so any worker can serve any session. Workers that exit
+unexpectedly are replaced; SIGINT/SIGTERM stop them all.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+# Read by app at import time: shared session state, and no background threads in the parent
+os.environ.setdefault('MEMORY_BACKEND', 'sqlite')
+os.environ['APP_PREFORK'] = '1'
+
+import app as application
+from werkzeug.serving import make_server
+
+
+def run_worker(listener: socket.socket, host: str, port: int, threads: bool):
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # The parent already built everything; only restart the threads the fork did not carry over
+    application.start_background_tasks(warm=False)
+    server = make_server(host, port, application.app, threaded=threads, fd=listener.fileno())
+    server.serve_forever()
+
+
+def spawn(listener: socket.socket, args) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(listener, args.host, args.port, not args.no_threads)
+        except Exception as e:
+            print(f"Worker {os.getpid()} failed: {e}", file=sys.stderr)
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default=os.getenv('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--backlog', type=int, default=1024)
+    parser.add_argument('--no-threads', action='store_true',
+                        help="one request at a time per worker (default: a thread per request)")
+    parser.add_argument('--access-log', action='store_true', help="log every request (werkzeug's format)")
+    args = parser.parse_args()
+
+    if not args.access_log:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    started = time.perf_counter()
+    counts = application.preload()
+    print(f"Preloaded {counts} in {time.perf_counter() - started:.2f}s")
+
+    listener = socket.create_server((args.host, args.port), backlog=args.backlog)
+    # Keep the preloaded objects out of the collector's reach, so its passes do not dirty shared pages
+    gc.freeze()
+
+    workers = {spawn(listener, args) for _ in range(args.workers)}
+    print(f"Serving on http://{args.host}:{args.port} with {len(workers)} workers (pids {sorted(workers)})")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}; restarting")
+            time.sleep(0.5)  # Do not spin if workers die right away
+            workers.add(spawn(listener, args))
+    listener.close()
+
+
+if __name__ == '__main__':
+    main()
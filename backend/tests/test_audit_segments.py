@@ -0,0 +1,70 @@
+import json
+
+from core.audit_logger import AuditLogger
+from core.audit_segments import SessionFilter
+
+
+def test_session_filter_has_no_false_negatives():
+    session_filter = SessionFilter.for_items(1000)
+    sessions = [f"session-{i}" for i in range(1000)]
+    for session_id in sessions:
+        session_filter.add(session_id)
+    assert all(session_id in session_filter for session_id in sessions)
+    false_positives = sum(f"other-{i}" in session_filter for i in range(10000))
+    assert false_positives < 300
+
+
+def log_entries(logger, count, session_prefix="s"):
+    for i in range(count):
+        logger.log_action(f"{session_prefix}{i % 5}", "po_matching", "po_matcher", {"i": i}, {"ok": True})
+
+
+def test_sealed_segments_keep_sessions_out_of_the_manifest(tmp_path):
+    logger = AuditLogger(log_file=str(tmp_path / "audit.jsonl"), segment_bytes=2000)
+    log_entries(logger, 60)
+    logger.flush()
+    logger.segments._sealer.join()
+    with open(logger.segments.manifest_file) as f:
+        segments = json.load(f)["segments"]
+    assert segments and all("sessions" not in segment for segment in segments)
+    assert all(segment["session_filter"]["bits"] >= 1024 for segment in segments if segment["status"] == "sealed")
+    assert len(logger.get_session_logs("s3")) == 12
+    assert logger.get_session_logs("missing") == []
+    logger.close()
+
+
+def test_date_only_end_covers_the_whole_day(tmp_path):
+    logger = AuditLogger(log_file=str(tmp_path / "audit.jsonl"))
+    log_entries(logger, 3)
+    day = next(logger.query())["timestamp"][:10]
+    assert len(list(logger.query(start=day, end=day))) == 3
+    logger.close()
+
+
+def test_session_page_reports_unreadable_entries(tmp_path):
+    logger = AuditLogger(log_file=str(tmp_path / "audit.jsonl"))
+    log_entries(logger, 10)
+    entries, total, skipped = logger.get_session_page("s0", 0, 50)
+    assert (len(entries), total, skipped) == (2, 2, 0)
+    logger.close()
+
+    # Damage the first s0 entry in place: it stays indexed but no longer parses
+    with open(tmp_path / "audit.jsonl", 'r+b') as f:
+        f.write(b"#")
+    entries, total, skipped = AuditLogger(log_file=str(tmp_path / "audit.jsonl")).get_session_page("s0", 0, 50)
+    assert (len(entries), total, skipped) == (1, 2, 1)
+
+
+def test_writer_survives_a_failed_roll(tmp_path, monkeypatch):
+    logger = AuditLogger(log_file=str(tmp_path / "audit.jsonl"), segment_bytes=500, queue_size=4)
+
+    def corrupt_manifest(log_file):
+        raise ValueError("corrupt manifest")
+    monkeypatch.setattr(logger.segments, "add", corrupt_manifest)
+    log_entries(logger, 20)  # Blocks forever once the queue is full if the writer died
+    assert logger.flush(timeout=5)
+    assert logger._writer.is_alive()
+    assert logger.stats["write_errors"] >= 1
+    assert logger.stats["entries"] == 20
+    assert len(logger.get_session_logs("s0")) == 4
+    logger.close()
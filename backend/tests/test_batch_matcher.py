@@ -0,0 +1,28 @@
+from agents import batch_matcher
+from agents.batch_matcher import BatchMatchingEngine
+from agents.retriever import DocumentRetriever
+from tools.generate_data import generate_corpus
+
+
+class AuditLog:
+    def __init__(self):
+        self.actions = []
+
+    def log_action(self, **action):
+        self.actions.append(action)
+
+
+def test_batches_share_one_process_pool(tmp_path, monkeypatch):
+    manifest = generate_corpus(str(tmp_path), invoices=60, discrepancy_rate=0.5, seed=3)
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    audit_log = AuditLog()
+    engine = BatchMatchingEngine(DocumentRetriever(None, audit_log), audit_log, max_workers=2, chunk_size=10)
+
+    first = list(engine.run("s1", statuses=["pending", "flagged"]))
+    pool = batch_matcher._pool
+    second = list(engine.run("s2", statuses=["flagged"]))
+    assert pool is not None and batch_matcher._pool is pool
+
+    assert first[-1]["summary"]["matched"] == 60
+    assert second[-1]["summary"]["matched"] == 60 - manifest["discrepancies"]["clean"]
+    assert sorted(r["invoice_id"] for r in first[:-1]) == [f"INV-{i:07d}" for i in range(1, 61)]
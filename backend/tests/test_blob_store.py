@@ -0,0 +1,31 @@
+import os
+
+from core.audit_logger import AuditLogger
+from core.blob_store import BLOB_KEY, BlobStore
+
+DOCUMENT = {"id": "INV-1", "vendor": "Acme Corp", "line_items": [{"description": "Office Supplies " * 20}]}
+
+
+def test_dedupe_collects_blobs_without_writing(tmp_path):
+    blobs = BlobStore(str(tmp_path / "blobs.sqlite"), min_bytes=64)
+    pending = {}
+    reduced = blobs.dedupe({"invoice": DOCUMENT}, pending)
+    assert BLOB_KEY in reduced["invoice"] and len(pending) == 2  # The document and its long line item
+    assert not os.path.exists(tmp_path / "blobs.sqlite")
+    # Known once collected, so a second entry does not carry it again
+    again = {}
+    blobs.dedupe({"invoice": DOCUMENT}, again)
+    assert again == {}
+    assert blobs.rehydrate(reduced) == {"invoice": DOCUMENT}
+
+    blobs.store(pending)
+    fresh = BlobStore(str(tmp_path / "blobs.sqlite"), min_bytes=64)
+    assert fresh.rehydrate(reduced) == {"invoice": DOCUMENT}
+
+
+def test_audit_writer_stores_blobs_with_entries(tmp_path):
+    logger = AuditLogger(log_file=str(tmp_path / "audit.jsonl"))
+    logger.log_action("s1", "po_matching", "po_matcher", {"invoice_id": "INV-1"}, {"invoice": DOCUMENT})
+    logger.close()
+    reader = AuditLogger(log_file=str(tmp_path / "audit.jsonl"))
+    assert reader.get_session_logs("s1")[0]["output"] == {"invoice": DOCUMENT}
@@ -0,0 +1,87 @@
+import json
+import os
+import shutil
+
+from agents.batch_matcher import BatchMatchingEngine
+from agents.retriever import DocumentRetriever
+from core.document_store import DocumentStore
+from core.ingest import DocumentIngester
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+
+def write_jsonl(path, docs, mtime_ns):
+    # Replaced, not rewritten in place, so the previous version's mmap stays readable
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(doc) + "\n" for doc in docs)
+    os.utime(temp_path, ns=(mtime_ns, mtime_ns))
+    os.replace(temp_path, path)
+
+
+class AuditLog:
+    def log_action(self, **action):
+        pass
+
+
+def test_reload_reports_only_changed_records(tmp_path):
+    path = tmp_path / "invoices.jsonl"
+    docs = [{"id": f"INV-{i}", "total_amount": i} for i in range(5)]
+    write_jsonl(path, docs, mtime_ns=1_000_000_000)
+    store = DocumentStore(str(tmp_path), mmap_threshold=0)
+    store.collection("invoices")
+
+    seen = []
+
+    def listener(doc_type, changes):
+        # Listeners run after the store lock is released
+        assert store._lock.acquire(blocking=False)
+        store._lock.release()
+        seen.append(changes)
+    store.subscribe(listener)
+
+    changed = dict(docs[2], total_amount=99)
+    write_jsonl(path, docs[:2] + [changed] + docs[3:4] + [{"id": "INV-9"}], mtime_ns=2_000_000_000)
+    assert store.get("invoices", "INV-2") == changed
+    assert len(seen) == 1
+    assert sorted(seen[0], key=lambda change: str(change)) == sorted(
+        [(docs[2], changed), (docs[4], None), (None, {"id": "INV-9"})], key=lambda change: str(change))
+
+
+def test_upsert_replaces_the_stored_version_everywhere(tmp_path, monkeypatch):
+    for name in ("invoices", "purchase_orders", "goods_receipts"):
+        shutil.copy(os.path.join(DATA_DIR, f"{name}.json"), tmp_path)
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    retriever = DocumentRetriever(None, None)
+    store = retriever.store
+    invoice = dict(store.get("invoices", "INV-123"))
+    receipt = dict(store.get("goods_receipts", "GR-789"))
+    store.search("goods_receipts", "Office Supplies")  # Built before the upsert, so it is updated in place
+
+    receipt["received_items"] = [dict(receipt["received_items"][0], quantity_received=10)]
+    ingester = DocumentIngester(store, fsync=False)
+    assert ingester.ingest("goods_receipts", [(1, receipt)])["replaced"] == 1
+    assert ingester.ingest("invoices", [(1, dict(invoice, status="approved"))])["replaced"] == 1
+
+    def check(store):
+        receipts = store.find_by("goods_receipts", "po_reference", "PO-456")
+        assert [r["received_items"][0]["quantity_received"] for r in receipts] == [10]
+        assert retriever.get_specific_document("PO-456", "goods_receipts")["received_items"][0][
+            "quantity_received"] == 10
+        assert [r["id"] for r in store.documents("invoices")].count("INV-123") == 1
+        assert [r["status"] for r in store.find_by("invoices", "vendor", invoice["vendor"])
+                if r["id"] == "INV-123"] == ["approved"]
+        hits = [doc["id"] for _, doc in store.search("goods_receipts", "GR-789 Office Supplies", k=10)]
+        assert hits.count("GR-789") == 1
+        hits = [doc["id"] for _, doc in store.semantic_search("goods_receipts", "GR-789 Office Supplies", k=10)]
+        assert hits.count("GR-789") == 1
+
+        engine = BatchMatchingEngine(retriever, AuditLog(), max_workers=1)
+        results = list(engine.run("s", vendor=invoice["vendor"], statuses=["approved", "flagged", "pending"]))
+        assert [r["invoice_id"] for r in results[:-1]].count("INV-123") == 1
+
+    check(store)
+    # A fresh load of the file, which now holds both versions, must agree
+    for threshold in (64 * 1024 * 1024, 0):
+        retriever.store = DocumentStore(str(tmp_path), mmap_threshold=threshold)
+        check(retriever.store)
@@ -0,0 +1,56 @@
+import io
+import json
+
+from core.document_store import DocumentStore
+from core.ingest import DocumentIngester, read_records, validate_record
+
+
+def invoice(**overrides):
+    record = {"invoice_id": "INV-1", "vendor": "Acme Corp", "po_reference": "PO-1", "total_amount": "1,800.00",
+              "line_items": [{"sku": "SKU-003", "quantity": "2", "unit_price": 900}]}
+    record.update(overrides)
+    return record
+
+
+def test_validate_normalizes_ids_and_numbers():
+    record, errors = validate_record("invoices", invoice())
+    assert errors == []
+    assert record["id"] == "INV-1"
+    assert record["total_amount"] == 1800.0
+    assert record["line_items"][0]["quantity"] == 2
+
+
+def test_line_items_need_a_sku_or_a_description():
+    assert validate_record("invoices", invoice(line_items=[
+        {"description": "Laptop Computer", "quantity": 2, "unit_price": 900}]))[1] == []
+    record, errors = validate_record("invoices", invoice(line_items=[{"quantity": 2, "unit_price": "x"}]))
+    assert record is None
+    assert errors == ["line_items[1]: missing sku or description", "line_items[1]: unit_price is not a number"]
+    assert validate_record("goods_receipts", {"id": "GR-1", "po_reference": "PO-1", "received_items": [
+        {"sku": "", "quantity_received": 1}]})[1] == ["received_items[1]: missing sku or description"]
+
+
+def test_read_records_jsonl_and_csv():
+    jsonl = io.StringIO('{"id": "GR-1"}\n\nnot json\n')
+    records = list(read_records(jsonl, "jsonl"))
+    assert records[0] == (1, {"id": "GR-1"})
+    assert records[1][0] == 3 and records[1][1].startswith("invalid JSON")
+
+    csv_text = 'id,po_reference,received_items\nGR-1,PO-1,"[{""sku"": ""SKU-1"", ""quantity_received"": 3}]"\n'
+    assert list(read_records(io.StringIO(csv_text), "csv")) == [
+        (2, {"id": "GR-1", "po_reference": "PO-1", "received_items": [{"sku": "SKU-1", "quantity_received": 3}]})]
+
+
+def test_ingest_counts_replaced_ids(tmp_path):
+    store = DocumentStore(str(tmp_path))
+    ingester = DocumentIngester(store, batch_size=2, fsync=False)
+    first = ingester.ingest("invoices", enumerate([invoice(), invoice(invoice_id="INV-2")], start=1))
+    assert (first["ingested"], first["replaced"]) == (2, 0)
+
+    second = ingester.ingest("invoices", enumerate([invoice(total_amount=5), invoice(invoice_id="INV-3"),
+                                                    invoice(invoice_id="INV-3", vendor="Globex")], start=1))
+    assert (second["ingested"], second["replaced"]) == (3, 2)
+    assert store.get("invoices", "INV-1")["total_amount"] == 5
+    assert store.get("invoices", "INV-3")["vendor"] == "Globex"
+    with open(tmp_path / "invoices.jsonl") as f:
+        assert len([json.loads(line) for line in f]) == 5
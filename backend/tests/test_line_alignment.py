@@ -0,0 +1,35 @@
+from agents.po_matcher import POMatchingAgent
+from core.line_alignment import align_lines, received_quantities
+
+
+def test_exact_pairs_by_sku_then_description():
+    rows = align_lines([{"sku": "A1", "description": "Widget", "quantity": 2},
+                        {"description": "Office Supplies", "quantity": 1}],
+                       [{"description": "office supplies", "quantity": 1},
+                        {"sku": "a1", "description": "Gadget", "quantity": 3}])
+    assert [(r["invoice_line"], r["po_line"], r["match"]) for r in rows] == [(1, 2, "exact"), (2, 1, "exact")]
+    assert rows[0]["quantity_delta"] == -1
+
+
+def test_fuzzy_probes_skip_words_no_po_line_has():
+    rows = align_lines([{"description": "Ergonomic office chair mesh back X2 grey large"}],
+                       [{"description": "Ergonomic office chair mesh back"}, {"description": "Standing desk"}])
+    assert rows[0]["match"] == "fuzzy" and rows[0]["po_line"] == 1
+
+
+def test_unmatched_lines_on_both_sides():
+    rows = align_lines([{"description": "Projector"}], [{"description": "Coffee machine"}])
+    assert [r["match"] for r in rows] == ["unmatched_invoice", "unmatched_po"]
+
+
+def test_received_quantities_by_sku_and_description():
+    received = received_quantities([{"sku": "A1", "description": "Widget", "quantity_received": 2},
+                                    {"description": "Widget", "quantity_received": 3}])
+    assert received["sku:a1"] == 2 and received["desc:widget"] == 5
+
+
+def test_sku_invoice_line_matches_description_only_receipt():
+    matcher = POMatchingAgent(None, None, None)
+    line = {"sku": "A1", "description": "Widget", "quantity": 2, "unit_price": 5.0, "total": 10.0}
+    issues, _ = matcher._check_line_items([line], [dict(line)], [{"description": "Widget", "quantity_received": 2}])
+    assert issues == []
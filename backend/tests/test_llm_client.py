@@ -0,0 +1,67 @@
+import asyncio
+import threading
+
+from core.llm_cache import LLMResponseCache
+from core.llm_client import LLMClient
+from tools.llm_stub_server import start_stub_server
+
+
+def stream_client(monkeypatch, **server_options):
+    server = start_stub_server(**server_options)
+    monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY", "1")
+    client = LLMClient(cache=LLMResponseCache(db_path=""))
+    client.client = None  # Always the pooled HTTP path, never the OpenAI SDK
+    return client, server
+
+
+def test_slow_consumer_does_not_hold_the_concurrency_slot(monkeypatch):
+    client, server = stream_client(monkeypatch)
+    first = client.stream_chat_completion([{"role": "user", "content": "one two three"}])
+    assert next(first) == "stub "
+
+    # With one slot, a second stream only completes if the paused first one gave it up
+    second = []
+    reader = threading.Thread(target=lambda: second.extend(
+        client.stream_chat_completion([{"role": "user", "content": "four"}])))
+    reader.start()
+    reader.join(timeout=5)
+    assert not reader.is_alive()
+    assert "".join(second) == "stub response to: four"
+    assert "".join(first) == "response to: one two three"
+    server.shutdown()
+
+
+def test_closed_stream_is_not_cached(monkeypatch):
+    client, server = stream_client(monkeypatch, token_latency=0.01)
+    messages = [{"role": "user", "content": "a b c d e f"}]
+    deltas = client.stream_chat_completion(messages)
+    next(deltas)
+    deltas.close()
+    assert "".join(client.stream_chat_completion(messages)) == "stub response to: a b c d e f"
+    assert server.requests_served == 2
+    server.shutdown()
+
+
+def test_http_errors_are_reported_by_status(monkeypatch):
+    monkeypatch.setenv("LLM_MAX_RETRIES", "0")
+    client, server = stream_client(monkeypatch, rate_limit_every=1)  # Every request gets a 429
+    messages = [{"role": "user", "content": "hello"}]
+    for reply in (client.chat_completion(messages), asyncio.run(client.achat_completion(messages))):
+        assert reply.startswith("Error: ") and "429" in reply and "choices" not in reply
+    server.shutdown()
+
+
+def test_concurrent_identical_completions_share_one_request(monkeypatch):
+    client, server = stream_client(monkeypatch, latency=0.2)
+    monkeypatch.setattr(client, "_semaphore", threading.BoundedSemaphore(8))
+    messages = [{"role": "user", "content": "same question"}]
+    replies = []
+    threads = [threading.Thread(target=lambda: replies.append(client.chat_completion(messages))) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert replies == ["stub response to: same question"] * 6
+    assert server.requests_served == 1
+    server.shutdown()
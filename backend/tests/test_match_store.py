@@ -0,0 +1,32 @@
+import json
+
+from agents.match_store import MatchResultStore
+from agents.po_matcher import POMatchingAgent
+from agents.retriever import DocumentRetriever
+
+
+def write_jsonl(path, docs):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(doc) + "\n" for doc in docs)
+
+
+def test_results_keep_ids_not_documents(tmp_path, monkeypatch):
+    line = {"description": "Laptop Computer", "quantity": 2, "unit_price": 900, "total": 1800}
+    write_jsonl(tmp_path / "invoices.jsonl", [{"id": "INV-1", "po_reference": "PO-1", "total_amount": 1800,
+                                               "vendor": "Acme Corp", "line_items": [line]}])
+    write_jsonl(tmp_path / "purchase_orders.jsonl", [{"id": "PO-1", "total_amount": 1800, "vendor": "Acme Corp",
+                                                      "line_items": [line]}])
+    write_jsonl(tmp_path / "goods_receipts.jsonl", [{"id": "GR-1", "po_reference": "PO-1", "received_items": [
+        {"description": "Laptop Computer", "quantity_received": 2}]}])
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    store = MatchResultStore(POMatchingAgent(None, None, DocumentRetriever(None, None)))
+    store.build()
+
+    generation, compact, ids = store.results["INV-1"]
+    assert not {"invoice", "purchase_order", "goods_receipt"} & compact.keys()
+    assert ids == ("INV-1", "PO-1", "PO-1")
+    result = store.get("INV-1")
+    assert result["invoice"]["id"] == "INV-1"
+    assert result["purchase_order"]["id"] == "PO-1"
+    assert result["goods_receipt"]["id"] == "GR-1"
+    assert store.get_stats()["hits"] == 1
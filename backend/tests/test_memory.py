@@ -0,0 +1,35 @@
+import os
+
+from core.memory import ConversationMemory
+
+
+def response(i):
+    return {"explanation": f"answer {i}", "match_score": 0.5, "evidence": {"blob": "x" * 300}}
+
+
+def test_full_responses_round_trip_through_spill_files(tmp_path):
+    memory = ConversationMemory(spill_dir=str(tmp_path))
+    memory.add_interaction("s1", "q0", response(0))
+    [interaction] = memory.get_session_history("s1")
+    assert "evidence" not in interaction["response"]
+    assert memory.get_full_response("s1", interaction) == response(0)
+
+
+def test_spill_files_roll_and_unreferenced_ones_are_removed(tmp_path):
+    memory = ConversationMemory(spill_dir=str(tmp_path), max_interactions=4, spill_file_bytes=1000)
+    for i in range(40):
+        memory.add_interaction("s1", f"q{i}", response(i))
+    history = memory.get_session_history("s1")
+    assert [memory.get_full_response("s1", item) for item in history] == [response(i) for i in range(36, 40)]
+    # Only the files the four kept interactions live in remain
+    assert len(os.listdir(tmp_path)) == len({item["spill_file"] for item in history}) <= 4
+    assert memory.get_stats()["spill_rolls"] > 0
+
+
+def test_evicted_session_spill_files_are_removed(tmp_path):
+    memory = ConversationMemory(spill_dir=str(tmp_path), max_sessions=1, spill_file_bytes=1000)
+    for i in range(6):
+        memory.add_interaction("s1", f"q{i}", response(i))
+    memory.add_interaction("s2", "q", response(0))
+    assert memory.get_session_history("s1") == []
+    assert len(os.listdir(tmp_path)) == 1
@@ -0,0 +1,71 @@
+import threading
+import time
+
+from core.plan_executor import AgentTask, PlanExecutor
+
+
+def test_dependents_start_after_their_dependencies_with_their_results():
+    order = []
+
+    def step(name, value):
+        def run(results):
+            order.append(name)
+            return {"value": value, "seen": sorted(results)}
+        return run
+
+    tasks = [
+        AgentTask("web_search", "web", step("web_search", 3), depends_on=["po_matcher"]),
+        AgentTask("retriever", "retrieval", step("retriever", 1)),
+        AgentTask("po_matcher", "po", step("po_matcher", 2), depends_on=["retriever"]),
+    ]
+    results, execution = PlanExecutor(max_workers=4).run(tasks)
+
+    assert order == ["retriever", "po_matcher", "web_search"]
+    assert list(results) == ["web", "retrieval", "po"]  # Task order, not completion order
+    assert results["po"]["seen"] == ["retrieval"]
+    assert results["web"]["seen"] == ["po", "retrieval"]
+    assert all(execution[task.name]["status"] == "ok" for task in tasks)
+
+
+def test_timed_out_step_yields_a_partial_result():
+    release = threading.Event()
+    tasks = [
+        AgentTask("retriever", "retrieval", lambda results: {"documents": ["INV-123"]}),
+        AgentTask("web_search", "web", lambda results: release.wait(5) and {"late": True}, timeout=0.05),
+        AgentTask("verifier", "verification", lambda results: {"inputs": sorted(results)},
+                  depends_on=["retriever", "web_search"]),
+    ]
+    started = time.perf_counter()
+    results, execution = PlanExecutor(max_workers=4).run(tasks)
+    release.set()
+
+    assert time.perf_counter() - started < 2
+    assert execution["web_search"]["status"] == "timeout"
+    assert results["web"] == {"error": "web_search timed out after 0.05s"}
+    assert results["retrieval"] == {"documents": ["INV-123"]}
+    # The dependent still runs, on the results that are available
+    assert execution["verifier"]["status"] == "ok"
+    assert results["verification"] == {"inputs": ["retrieval", "web"]}
+
+
+def test_failing_step_does_not_block_independent_steps():
+    def fail(results):
+        raise RuntimeError("matcher crashed")
+
+    tasks = [
+        AgentTask("po_matcher", "po", fail),
+        AgentTask("retriever", "retrieval", lambda results: {"documents": []}),
+        AgentTask("web_search", "web", lambda results: None),  # Nothing to contribute
+        AgentTask("stuck", "stuck", lambda results: {}, depends_on=["missing_dependency", "stuck_too"]),
+        AgentTask("stuck_too", "stuck_too", lambda results: {}, depends_on=["stuck"]),
+    ]
+    results, execution = PlanExecutor(max_workers=4).run(tasks)
+
+    assert results["po"] == {"error": "po_matcher failed: matcher crashed"}
+    assert execution["po_matcher"]["status"] == "error"
+    assert results["retrieval"] == {"documents": []}
+    assert execution["retriever"]["status"] == "ok"
+    assert execution["web_search"]["status"] == "skipped" and "web" not in results
+    # A dependency cycle is reported, not waited on forever
+    assert execution["stuck"] == {"status": "unresolved_dependencies"}
+    assert execution["stuck_too"] == {"status": "unresolved_dependencies"}
@@ -0,0 +1,66 @@
+from agents.planner import PlanTemplateCache, normalize_query
+
+
+def cached(cache, query, plan, context=None):
+    key, slots = normalize_query(query)
+    cache.put(key, slots, plan, context)
+    return key
+
+
+def lookup(cache, query, context=""):
+    key, slots = normalize_query(query)
+    return cache.get(key, slots, context)
+
+
+def test_slot_values_substituted_only_at_whole_string_values():
+    cache = PlanTemplateCache()
+    cached(cache, "Why is INV-123 billed for 5 units?",
+           {"parameters": {"invoice_id": "INV-123", "tolerance": 0.5, "year": 2025, "count": "5"}})
+    plan = lookup(cache, "Why is INV-77 billed for 9 units?")
+    assert plan == {"parameters": {"invoice_id": "INV-77", "tolerance": 0.5, "year": 2025, "count": "9"}}
+
+
+def test_amount_with_separators_round_trips():
+    cache = PlanTemplateCache()
+    cached(cache, "Approve INV-1 for $500", {"parameters": {"amount": "$500"}})
+    assert lookup(cache, "Approve INV-2 for $1,000") == {"parameters": {"amount": "$1,000"}}
+
+
+def test_plan_mentioning_slot_inside_text_is_not_cached():
+    cache = PlanTemplateCache()
+    cached(cache, "Why was INV-123 flagged?", {"reasoning": "Analyze INV-123 against its PO"})
+    assert len(cache) == 0
+
+
+def test_context_dependent_plans_are_keyed_by_context():
+    cache = PlanTemplateCache()
+    cached(cache, "what about it", {"query_type": "a"}, context="talking about vendors")
+    assert lookup(cache, "what about it", "talking about vendors") == {"query_type": "a"}
+    assert lookup(cache, "what about it", "talking about invoices") is None
+    assert lookup(cache, "what about it", "") is None
+
+    cached(cache, "show flagged invoices", {"query_type": "b"})  # Context-free, e.g. from the classifier
+    assert lookup(cache, "show flagged invoices", "anything") == {"query_type": "b"}
+
+
+def test_returned_plans_are_independent_copies():
+    cache = PlanTemplateCache()
+    cached(cache, "show flagged invoices", {"agents_to_call": ["retriever"]})
+    lookup(cache, "show flagged invoices")["agents_to_call"].append("verifier")
+    assert lookup(cache, "show flagged invoices") == {"agents_to_call": ["retriever"]}
+
+
+def test_numbers_taken_from_amounts_are_replayed_from_the_new_query():
+    cache = PlanTemplateCache()
+    cached(cache, "Flag invoices over $5,000 from last 30 days",
+           {"parameters": {"min_amount": 5000, "days": 30, "tolerance": 0.05}})
+    plan = lookup(cache, "Flag invoices over $12,500.50 from last 7 days")
+    assert plan == {"parameters": {"min_amount": 12500.5, "days": 7, "tolerance": 0.05}}
+    assert type(lookup(cache, "Flag invoices over $800 from last 7 days")["parameters"]["min_amount"]) is int
+
+
+def test_plan_with_unattributable_query_numbers_is_not_cached():
+    cache = PlanTemplateCache()
+    cached(cache, "Why was INV-123 flagged?", {"parameters": {"invoice_number": 123}})
+    cached(cache, "Compare 10 invoices with 10 receipts", {"parameters": {"limit": 10}})
+    assert len(cache) == 0
@@ -0,0 +1,51 @@
+import json
+
+from core.record_file import RecordFile, iter_json_array
+
+RECORDS = [{"id": "INV-1", "vendor": "Acme Corp"}, {"id": "INV-2", "vendor": "Société Générale"},
+           {"id": "INV-3", "note": "line\nbreak"}]
+
+
+def write(path, text):
+    with open(path, 'wb') as f:
+        f.write(text.encode('utf-8'))
+    return str(path)
+
+
+def test_crlf_pretty_printed_array_offsets(tmp_path):
+    path = write(tmp_path / "docs.json", json.dumps(RECORDS, indent=2, ensure_ascii=False).replace("\n", "\r\n"))
+    with open(path, 'rb') as f:
+        raw = f.read()
+    for record, start, end in iter_json_array(path):
+        assert json.loads(raw[start:end]) == record
+    records = RecordFile(path)
+    records.build_index()
+    assert [records[i] for i in range(len(records))] == RECORDS
+
+
+def test_jsonl_random_access_and_iteration(tmp_path):
+    path = write(tmp_path / "docs.jsonl", "".join(json.dumps(r, ensure_ascii=False) + "\r\n" for r in RECORDS))
+    records = RecordFile(path)
+    assert list(records) == RECORDS
+    assert records[-1] == RECORDS[-1]
+    assert records[0:2] == RECORDS[:2]
+
+
+def test_extend_indexed_reads_appended_bytes(tmp_path):
+    path = write(tmp_path / "docs.jsonl", json.dumps(RECORDS[0]) + "\n")
+    records = RecordFile(path)
+    records.build_index()
+    line = json.dumps(RECORDS[1]).encode('utf-8')
+    with open(path, 'ab') as f:
+        start = f.tell()
+        f.write(line + b"\n")
+    records.extend_indexed([RECORDS[1]], [start], [start + len(line)])
+    assert list(records) == RECORDS[:2]
+
+
+def test_reads_after_close_fall_back_to_the_file(tmp_path):
+    path = write(tmp_path / "docs.jsonl", "".join(json.dumps(r) + "\n" for r in RECORDS))
+    records = RecordFile(path)
+    records.build_index()
+    records.close()
+    assert records[1] == RECORDS[1]
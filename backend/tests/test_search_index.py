@@ -0,0 +1,65 @@
+from core import search_index
+from core.search_index import BM25Index, tokenize
+
+DOCS = [
+    {"id": "INV-123", "vendor": "Acme Corp", "status": "flagged", "flag_reason": "Amount mismatch"},
+    {"id": "INV-124", "vendor": "Globex Supply Co", "status": "pending"},
+    {"id": "INV-125", "vendor": "Acme Corp", "status": "pending", "notes": "flagged by the night batch"},
+]
+
+
+def build(docs=DOCS):
+    index = BM25Index()
+    for position, doc in enumerate(docs):
+        index.add_document(position, doc)
+    return index
+
+
+def test_tokenize_keeps_ids_and_their_numbers():
+    assert tokenize("Why was INV-123 flagged for $1500.50?") == ["inv-123", "123", "flagged", "1500.50"]
+
+
+def test_ranking_prefers_identifying_fields():
+    index = build()
+    assert [position for _, position in index.search("INV-124")] == [1]
+    # "flagged" as a status outweighs the same word in free-text notes
+    assert [position for _, position in index.search("flagged")] == [0, 2]
+    scores = index.search("acme flagged")
+    assert [position for _, position in scores] == [0, 2]
+    assert scores[0][0] > scores[1][0] > 0
+
+
+def test_incremental_add_and_reindex():
+    index = build()
+    index.add_document(3, {"id": "INV-200", "vendor": "Initech", "status": "flagged"})
+    assert [position for _, position in index.search("initech")] == [3]
+    assert {position for _, position in index.search("flagged", k=10)} == {0, 2, 3}
+
+    index.add_document(3, {"id": "INV-200", "vendor": "Initech", "status": "approved"})  # Same position again
+    assert {position for _, position in index.search("flagged", k=10)} == {0, 2}
+    assert len(index) == 4
+
+    index.remove_document(0, DOCS[0])
+    assert [position for _, position in index.search("mismatch")] == []
+    assert len(index) == 3
+
+
+def test_empty_and_unmatched_queries():
+    index = build()
+    assert index.search("") == []
+    assert index.search("the and of") == []  # Stopwords only
+    assert index.search("nonexistent") == []
+    assert BM25Index().search("acme") == []
+
+
+def test_common_terms_only_rescore_candidates(monkeypatch):
+    monkeypatch.setattr(search_index, "MIN_COMMON_DF", 10)
+    docs = [{"id": f"INV-{i}", "vendor": "Acme Corp", "status": "pending"} for i in range(50)]
+    docs.append({"id": "INV-999", "vendor": "Acme Corp", "status": "flagged"})
+    index = BM25Index(common_term_ratio=0.1)
+    for position, doc in enumerate(docs):
+        index.add_document(position, doc)
+    # "acme" is in every document: it adds to the rare term's candidates rather than adding candidates
+    hits = index.search("acme flagged", k=3)
+    assert [position for _, position in hits] == [50]
+    assert hits[0][0] > index.search("flagged")[0][0]
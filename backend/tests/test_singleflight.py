@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from core.singleflight import SingleFlight
+
+
+def run_concurrently(flight, key, fn, callers):
+    """Start `callers` threads calling flight.do(key, fn); release fn only once all of them joined"""
+    release = threading.Event()
+    outcomes = [None] * callers
+
+    def leader_fn():
+        release.wait(5)
+        return fn()
+
+    def call(i):
+        try:
+            outcomes[i] = ("ok", flight.do(key, leader_fn))
+        except Exception as e:
+            outcomes[i] = ("error", e)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while flight.get_stats()["coalesced"] < callers - 1 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+def test_concurrent_identical_calls_execute_once():
+    flight = SingleFlight()
+    executions = []
+    outcomes = run_concurrently(flight, "k", lambda: executions.append(1) or "reply", callers=8)
+    assert outcomes == [("ok", "reply")] * 8
+    assert len(executions) == 1
+    assert flight.get_stats() == {"executed": 1, "coalesced": 7, "in_flight": 0}
+
+
+def test_leader_error_reaches_every_waiter_but_not_later_calls():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("upstream down")
+    outcomes = run_concurrently(flight, "k", fail, callers=4)
+    errors = {id(error) for kind, error in outcomes if kind == "error"}
+    assert len(errors) == 1 and all(kind == "error" for kind, _ in outcomes)
+    assert str(outcomes[0][1]) == "upstream down"
+
+    # Nothing is remembered: the next call runs again and can succeed
+    assert flight.do("k", lambda: "recovered") == "recovered"
+    assert flight.get_stats()["executed"] == 2
+
+
+def test_async_callers_join_a_threads_call():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "shared"
+    thread_result = []
+    thread = threading.Thread(target=lambda: thread_result.append(flight.do("k", slow)))
+    thread.start()
+    started.wait(5)
+
+    async def follower():
+        async def never():
+            raise AssertionError("a follower must not execute")
+        return await flight.ado("k", never)
+
+    async def main():
+        task = asyncio.ensure_future(follower())
+        await asyncio.sleep(0.01)
+        release.set()
+        return await task
+
+    assert asyncio.run(main()) == "shared"
+    thread.join(5)
+    assert thread_result == ["shared"]
+
+
+def test_async_leader_error_propagates():
+    flight = SingleFlight()
+
+    async def fail():
+        raise KeyError("gone")
+    with pytest.raises(KeyError):
+        asyncio.run(flight.ado("k", fail))
+    assert flight.get_stats()["in_flight"] == 0
@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+from core.vendor_cache import VendorRiskCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Backend:
+    def __init__(self, known=("Acme Corp",)):
+        self.known = set(known)
+        self.calls = []
+        self.fail = False
+        self.gate = None  # An Event the next call waits on
+
+    def __call__(self, vendor):
+        self.calls.append(vendor)
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.fail:
+            raise ConnectionError("backend down")
+        if vendor not in self.known:
+            return None
+        return {"vendor": vendor, "risk_level": "low", "version": len(self.calls)}
+
+
+def make_cache(backend, clock):
+    # One refresh worker: a no-op submitted after a refresh only runs once the refresh is done
+    return VendorRiskCache(backend, ttl_seconds=60, stale_seconds=120, negative_ttl_seconds=30,
+                           refresh_workers=1, clock=clock)
+
+
+def wait_for_refreshes(cache):
+    cache._executor().submit(lambda: None).result(5)
+
+
+def test_fresh_entries_are_served_until_the_ttl():
+    clock, backend = Clock(), Backend()
+    cache = make_cache(backend, clock)
+    assert cache.get("Acme Corp")["version"] == 1
+    clock.now += 59
+    assert cache.get("  acme   CORP ")["version"] == 1  # Same key after normalization
+    assert backend.calls == ["Acme Corp"]
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_stale_entries_are_served_while_one_refresh_runs():
+    clock, backend = Clock(), Backend()
+    cache = make_cache(backend, clock)
+    cache.get("Acme Corp")
+    clock.now += 61
+    backend.gate = threading.Event()
+    assert cache.get("Acme Corp")["version"] == 1  # Stale, served without waiting for the backend
+    assert cache.get("Acme Corp")["version"] == 1  # No second refresh while one is in flight
+    backend.gate.set()
+    wait_for_refreshes(cache)
+    assert backend.calls == ["Acme Corp", "Acme Corp"]
+    assert cache.get("Acme Corp")["version"] == 2
+    stats = cache.get_stats()
+    assert (stats["stale_hits"], stats["refreshes"], stats["refreshing"]) == (2, 1, 0)
+
+
+def test_failed_refresh_keeps_the_stale_value_and_expired_entries_are_refetched():
+    clock, backend = Clock(), Backend()
+    cache = make_cache(backend, clock)
+    cache.get("Acme Corp")
+    clock.now += 61
+    backend.fail = True
+    assert cache.get("Acme Corp")["version"] == 1
+    wait_for_refreshes(cache)
+    assert cache.get("Acme Corp")["version"] == 1
+    wait_for_refreshes(cache)
+    assert cache.get_stats()["errors"] == 2
+
+    clock.now += 120  # Past ttl + stale: the caller waits for the backend
+    with pytest.raises(ConnectionError):
+        cache.get("Acme Corp")
+    backend.fail = False
+    assert cache.get("Acme Corp")["version"] == len(backend.calls)
+
+
+def test_unknown_vendors_are_cached_negatively():
+    clock, backend = Clock(), Backend()
+    cache = make_cache(backend, clock)
+    assert cache.get("Shell Co") is None
+    clock.now += 29
+    assert cache.get("Shell Co") is None
+    assert backend.calls == ["Shell Co"]
+    assert cache.get_stats()["negative_hits"] == 1
+
+    clock.now += 2  # Negative entries expire on their own, shorter TTL, with no stale period
+    backend.known.add("Shell Co")
+    assert cache.get("Shell Co")["vendor"] == "Shell Co"
+    assert backend.calls == ["Shell Co", "Shell Co"]
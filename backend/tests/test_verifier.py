@@ -0,0 +1,61 @@
+import json
+
+from agents.verifier import JSONFieldStream, ResultVerifier
+
+REPLY = json.dumps({"confidence": 0.8, "summary": 'Paid "twice" \\ tab\there, café 🧾 done', "risks": []})
+
+
+def feed_all(pieces):
+    stream = JSONFieldStream("summary")
+    return "".join(stream.feed(piece) for piece in pieces), stream
+
+
+def test_whole_reply():
+    text, stream = feed_all([REPLY])
+    assert text == json.loads(REPLY)["summary"]
+    assert stream.done
+
+
+def test_every_split_point_decodes_the_same():
+    # Escapes (including a surrogate pair for the emoji) may be cut anywhere
+    expected = json.loads(REPLY)["summary"]
+    for cut in range(1, len(REPLY)):
+        assert feed_all([REPLY[:cut], REPLY[cut:]])[0] == expected
+    assert feed_all(list(REPLY))[0] == expected
+
+
+def test_nothing_after_the_field_ends():
+    stream = JSONFieldStream("summary")
+    assert stream.feed('{"summary": "ok"') == "ok"
+    assert stream.feed(', "other": "x"}') == ""
+    assert JSONFieldStream("summary").feed('{"risks": ["a"]}') == ""
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def chat_completion(self, messages, max_tokens=None):
+        self.calls += 1
+        return json.dumps({"confidence": 0.9, "summary": "ok", "risks": [], "recommendations": [], "conflicts": []})
+
+
+class AuditLog:
+    def log_action(self, **action):
+        pass
+
+
+def test_retrieval_only_results_are_decided_by_the_rules():
+    llm = CountingLLM()
+    verifier = ResultVerifier(llm, AuditLog())
+    for documents in ([{"id": "INV-123", "vendor": "Acme Corp"}], []):
+        verification = verifier.verify_results({"retrieval": {"documents": documents}}, "s")
+        assert verification["tier"] == "rules"
+    assert llm.calls == 0
+
+
+def test_ambiguous_match_escalates_to_the_llm():
+    llm = CountingLLM()
+    verification = ResultVerifier(llm, AuditLog()).verify_results(
+        {"po_matching": {"match_score": 0.6, "discrepancies": ["Amount mismatch"]}}, "s")
+    assert (verification["tier"], verification["confidence"], llm.calls) == ("llm", 0.9, 1)
@@ -0,0 +1,320 @@
+"""End-to-end and micro benchmarks on a generated corpus with the fake LLM; results as JSON.
+
+    python -m tools.benchmark --invoices 10000 --duration 10 --output before.json
+    python -m tools.benchmark --invoices 10000 --duration 10 --output after.json --baseline before.json
+
+The corpus comes from tools.generate_data (seeded, so runs are comparable) or an
+existing --data-dir that has a manifest.json. serve.py runs on it against the
+stub LLM in fake mode (valid planner/verifier JSON after --latency seconds),
+with its own session database, audit log and LLM cache. Each endpoint scenario
+is driven by --clients client processes for --duration seconds and reports
+p50/p95/p99 latency, throughput and the server's RSS (parent plus workers)
+afterwards. Micro-benchmarks then time _search_documents,
+_analyze_three_way_match and get_session_logs in this process. With
+--baseline, each metric's change against an earlier result file is added.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+from tools.generate_data import VENDORS, CATALOG, generate_corpus
+from tools.llm_stub_server import fake_llm_response, start_stub_server
+from tools.llm_throughput import percentile
+from tools.load_test import BACKEND_DIR, free_port, wait_until_ready
+
+SCENARIOS = ("query_invoice", "query_approval", "query_general", "query_stream", "audit_page", "match_batch")
+
+# Metrics compared against a baseline, and whether a larger value is better
+COMPARED_METRICS = {"p50_ms": False, "p95_ms": False, "p99_ms": False, "throughput_rps": True,
+                    "rss_mb": False, "p50_us": False, "p95_us": False, "p99_us": False, "ops_per_sec": True}
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Resident memory of a process and its children, from /proc; None where /proc is unavailable"""
+    pids, total_kb = {pid}, 0
+    try:
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    with open(f'/proc/{entry}/stat') as f:
+                        # The ppid follows the parenthesized command name, which may itself hold spaces
+                        if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                            pids.add(int(entry))
+                except (OSError, IndexError, ValueError):
+                    continue
+        for child in pids:
+            try:
+                with open(f'/proc/{child}/status') as f:
+                    total_kb += next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+            except (OSError, StopIteration):
+                continue
+    except OSError:
+        return None
+    return round(total_kb / 1024, 1)
+
+
+def latency_summary(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def build_request(scenario: str, rng: random.Random, invoices: int, session_id: str) -> Tuple[str, str, Any]:
+    """(method, path, JSON body or None) for one request of a scenario"""
+    invoice_id = f"INV-{rng.randint(1, invoices):07d}"
+    if scenario == "query_invoice":
+        return 'POST', '/api/query', {"query": f"Why was invoice {invoice_id} flagged?", "session_id": session_id}
+    if scenario == "query_approval":
+        return 'POST', '/api/query', {"query": f"Approve invoice {invoice_id}", "session_id": session_id}
+    if scenario == "query_general":
+        topic = rng.choice([rng.choice(VENDORS), rng.choice(CATALOG)[0]])
+        return 'POST', '/api/query', {"query": f"Show me flagged invoices for {topic}", "session_id": session_id}
+    if scenario == "query_stream":
+        return 'POST', '/api/query/stream', {"query": f"Why was invoice {invoice_id} flagged?",
+                                             "session_id": session_id}
+    if scenario == "audit_page":
+        return 'GET', f'/api/audit/{session_id}?limit=50&order=desc', None
+    if scenario == "match_batch":
+        ids = [f"INV-{rng.randint(1, invoices):07d}" for _ in range(20)]
+        return 'POST', '/api/match/batch', {"invoice_ids": ids, "session_id": session_id}
+    raise ValueError(f"Unknown scenario '{scenario}'")
+
+
+def run_client(port: int, scenario: str, client_id: int, duration: float, invoices: int, seed: int
+               ) -> Dict[str, Any]:
+    """Send one scenario's requests back to back on a keep-alive connection until `duration` has elapsed"""
+    rng = random.Random(seed * 1000 + client_id)
+    # One session per client, shared by every scenario, so audit_page reads a real trail
+    session_id = f"bench-{seed}-{client_id}"
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        method, path, body = build_request(scenario, rng, invoices, session_id)
+        payload = json.dumps(body) if body is not None else None
+        started = time.perf_counter()
+        try:
+            conn.request(method, path, payload, {'Content-Type': 'application/json'} if payload else {})
+            response = conn.getresponse()
+            response.read()  # Streamed responses count until their last event
+            if response.status != 200:
+                errors += 1
+                continue
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+            continue
+        latencies.append(time.perf_counter() - started)
+    return {"latencies": latencies, "errors": errors}
+
+
+def run_endpoints(args, data_dir: str, invoices: int, stub_url: str, workdir: str) -> Dict[str, Any]:
+    port = free_port()
+    env = dict(os.environ,
+               DATA_DIR=data_dir,
+               OPENAI_BASE_URL=stub_url,
+               MEMORY_BACKEND='sqlite',
+               MEMORY_DB_PATH=os.path.join(workdir, "sessions.sqlite"),
+               AUDIT_LOG_FILE=os.path.join(workdir, "audit.jsonl"),
+               LLM_CACHE_PATH=os.path.join(workdir, "llm_cache.sqlite"))
+    env.pop('OPENAI_API_KEY', None)  # Force the HTTP path against the stub
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'serve.py', '--workers', str(args.workers), '--port', str(port)],
+                               cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+    results: Dict[str, Any] = {}
+    try:
+        wait_until_ready(port, process, timeout=args.startup_timeout)
+        server = {"workers": args.workers, "ready_seconds": round(time.perf_counter() - started, 2),
+                  "startup_rss_mb": rss_mb(process.pid)}
+        with multiprocessing.Pool(args.clients) as pool:
+            for scenario in args.scenarios:
+                scenario_started = time.perf_counter()
+                clients = pool.starmap(run_client, [(port, scenario, i, args.duration, invoices, args.seed)
+                                                    for i in range(args.clients)])
+                elapsed = time.perf_counter() - scenario_started
+                latencies = [latency for c in clients for latency in c["latencies"]]
+                results[scenario] = dict(latency_summary(latencies, sum(c["errors"] for c in clients), elapsed),
+                                         rss_mb=rss_mb(process.pid))
+        server["final_rss_mb"] = rss_mb(process.pid)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {"server": server, "endpoints": results}
+
+
+def time_calls(fn: Callable, calls: List[tuple]) -> Dict[str, Any]:
+    """Per-call timings of fn over each argument tuple"""
+    timings = []
+    for call_args in calls:
+        started = time.perf_counter()
+        fn(*call_args)
+        timings.append(time.perf_counter() - started)
+    total = sum(timings)
+    return {
+        "calls": len(timings),
+        "mean_us": round(total / len(timings) * 1e6, 1),
+        "p50_us": round(percentile(timings, 50) * 1e6, 1),
+        "p95_us": round(percentile(timings, 95) * 1e6, 1),
+        "p99_us": round(percentile(timings, 99) * 1e6, 1),
+        "ops_per_sec": round(len(timings) / total, 1) if total else 0.0,
+    }
+
+
+def run_micro(args, data_dir: str, invoices: int, workdir: str) -> Dict[str, Any]:
+    os.environ['DATA_DIR'] = data_dir  # Read by DocumentRetriever
+    from agents.po_matcher import POMatchingAgent
+    from agents.retriever import DocumentRetriever
+    from core.audit_logger import AuditLogger
+
+    rng = random.Random(args.seed)
+    audit_logger = AuditLogger(log_file=os.path.join(workdir, "micro_audit.jsonl"))
+    retriever = DocumentRetriever(None, audit_logger)
+    matcher = POMatchingAgent(None, audit_logger, retriever)
+    results: Dict[str, Any] = {}
+
+    queries = [rng.choice([f"invoice INV-{rng.randint(1, invoices):07d}", f"{rng.choice(VENDORS)} invoices",
+                           f"{rng.choice(CATALOG)[0]} purchase order", "flagged invoices amount mismatch"])
+               for _ in range(args.micro_calls)]
+    file_path = retriever.store.file_path("invoices")
+    started = time.perf_counter()
+    retriever._search_documents(file_path, queries[0], "invoices")  # Loads the collection and builds its indexes
+    results["search_index_build_seconds"] = round(time.perf_counter() - started, 3)
+    results["_search_documents"] = time_calls(retriever._search_documents,
+                                              [(file_path, query, "invoices") for query in queries])
+
+    # Documents are looked up beforehand: only the analysis itself is timed
+    triples = []
+    for _ in range(args.micro_calls):
+        invoice = retriever.get_specific_document(f"INV-{rng.randint(1, invoices):07d}", "invoices")
+        po_id = invoice.get('po_reference')
+        triples.append((invoice, retriever.get_specific_document(po_id, "purchase_orders"),
+                        retriever.get_specific_document(po_id, "goods_receipts")))
+    results["_analyze_three_way_match"] = time_calls(matcher._analyze_three_way_match, triples)
+
+    # An audit log shaped like real traffic: many sessions, each with a few queries' worth of entries
+    sessions = [f"micro-{i}" for i in range(args.audit_sessions)]
+    for i in range(args.audit_sessions * args.audit_entries):
+        session_id = sessions[i % len(sessions)]
+        invoice, po, gr = triples[i % len(triples)]
+        audit_logger.log_action(session_id=session_id, action_type="po_matching", agent="po_matcher",
+                                input_data={"invoice_id": invoice["invoice_id"]},
+                                output_data=matcher._analyze_three_way_match(invoice, po, gr))
+    audit_logger.flush()
+    results["get_session_logs"] = dict(
+        time_calls(audit_logger.get_session_logs, [(rng.choice(sessions),) for _ in range(args.micro_calls)]),
+        sessions=args.audit_sessions, entries_per_session=args.audit_entries)
+    audit_logger.close()
+    return results
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """Percent change of each compared metric present in both runs; "better" says which way it moved"""
+    changes: Dict[str, Any] = {}
+    for section in ("endpoints", "micro"):
+        for name, metrics in current.get(section, {}).items():
+            before = baseline.get(section, {}).get(name)
+            if not isinstance(metrics, dict) or not isinstance(before, dict):
+                continue
+            for metric, higher_is_better in COMPARED_METRICS.items():
+                new, old = metrics.get(metric), before.get(metric)
+                if not new or not old:
+                    continue
+                change = (new - old) / old * 100
+                changes.setdefault(section, {}).setdefault(name, {})[metric] = {
+                    "baseline": old, "current": new, "change_pct": round(change, 1),
+                    "better": change > 0 if higher_is_better else change < 0,
+                }
+    return changes
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', help="existing corpus with a manifest.json (default: generate one)")
+    parser.add_argument('--invoices', type=int, default=10000, help="corpus size when generating")
+    parser.add_argument('--discrepancy-rate', type=float, default=0.15)
+    parser.add_argument('--seed', type=int, default=42, help="corpus and request seed")
+    parser.add_argument('--latency', type=float, default=0.02, help="fake LLM seconds per completion")
+    parser.add_argument('--token-latency', type=float, default=0.0, help="fake LLM seconds per streamed chunk")
+    parser.add_argument('--workers', type=int, default=1, help="serve.py worker processes")
+    parser.add_argument('--clients', type=int, default=4, help="concurrent client processes")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds per endpoint scenario")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--startup-timeout', type=float, default=600.0)
+    parser.add_argument('--micro-calls', type=int, default=500, help="timed calls per micro-benchmark")
+    parser.add_argument('--audit-sessions', type=int, default=200)
+    parser.add_argument('--audit-entries', type=int, default=20, help="audit entries per session")
+    parser.add_argument('--skip-endpoints', action='store_true')
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--baseline', help="earlier result file to compare against")
+    parser.add_argument('--output', help="write the results here as well as to stdout")
+    args = parser.parse_args()
+
+    server = start_stub_server(latency=args.latency, respond=fake_llm_response, token_latency=args.token_latency)
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as workdir:
+        if args.data_dir:
+            data_dir = os.path.abspath(args.data_dir)
+            manifest_path = os.path.join(data_dir, "manifest.json")
+            if not os.path.exists(manifest_path):
+                parser.error(f"{manifest_path} not found; generate the corpus with tools.generate_data")
+            with open(manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        else:
+            data_dir = os.path.join(workdir, "data")
+            manifest = generate_corpus(data_dir, args.invoices, args.discrepancy_rate, args.seed)
+        invoices = manifest["invoices"]
+
+        results: Dict[str, Any] = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "git_revision": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "args": {key: value for key, value in vars(args).items() if key not in ("baseline", "output")},
+            },
+            "corpus": {key: value for key, value in manifest.items() if key != "sample_invoice_ids"},
+        }
+        if not args.skip_endpoints:
+            results.update(run_endpoints(args, data_dir, invoices, server.base_url, workdir))
+            results["llm_requests"] = server.requests_served
+        if not args.skip_micro:
+            results["micro"] = run_micro(args, data_dir, invoices, workdir)
+    server.shutdown()
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            results["comparison"] = compare(results, json.load(f))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""Generate a seeded synthetic invoice / purchase order / goods receipt corpus as JSONL.
+
+    python -m tools.generate_data /tmp/corpus --invoices 100000 --discrepancy-rate 0.15 --seed 7
+    DATA_DIR=/tmp/corpus python app.py
+
+Every invoice has a purchase order and (usually) a goods receipt. A fraction
+`--discrepancy-rate` of invoices gets exactly one injected discrepancy, of a
+kind drawn from DISCREPANCY_WEIGHTS; the rest match cleanly. The same seed and
+arguments always produce byte-identical JSONL files. manifest.json records the
+arguments, the counts per discrepancy kind and sample invoice ids of each kind.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from typing import Dict, List, Any, Optional, Tuple
+
+# Relative frequency of each injected discrepancy
+DISCREPANCY_WEIGHTS = {
+    "price_increase": 0.30,    # An invoice line billed above the PO unit price
+    "quantity_over": 0.20,     # An invoice line billed for more than was ordered
+    "short_receipt": 0.20,     # Fewer units received than invoiced
+    "missing_receipt": 0.15,   # No goods receipt for the PO
+    "vendor_mismatch": 0.05,   # Invoice vendor differs from the PO's
+    "extra_line": 0.05,        # An invoice line the PO does not have
+    "missing_po": 0.05,        # po_reference points at no purchase order
+}
+
+VENDORS = ["Acme Corp", "Suspicious Vendor LLC"] + [
+    f"{prefix} {suffix}"
+    for prefix in ("Northwind", "Globex", "Initech", "Umbrella", "Stark", "Wayne", "Contoso", "Fabrikam",
+                   "Tailspin", "Wingtip", "Litware", "Proseware", "Adatum", "Blue Yonder", "Coho", "Lucerne")
+    for suffix in ("Industries", "Supply Co", "Logistics")
+]
+
+# (description, unit price range)
+CATALOG: List[Tuple[str, Tuple[float, float]]] = [
+    ("Office Supplies", (5, 200)), ("Printer Paper A4 (box)", (20, 45)), ("Toner Cartridge Black", (60, 140)),
+    ("Laptop Computer", (700, 2400)), ("27in Monitor", (180, 650)), ("Docking Station", (120, 320)),
+    ("Wireless Keyboard", (25, 110)), ("Ergonomic Office Chair", (150, 900)), ("Standing Desk", (300, 1200)),
+    ("Network Switch 24-port", (150, 800)), ("Server Rack Unit", (900, 4000)), ("Cat6 Cable (100ft)", (15, 60)),
+    ("Cloud Storage Subscription", (50, 500)), ("Software License Seat", (40, 400)), ("Consulting Hours", (90, 250)),
+    ("Maintenance Contract", (500, 5000)), ("Safety Gloves (pack)", (8, 30)), ("Forklift Rental (day)", (150, 400)),
+    ("Pallet Wrap Roll", (12, 40)), ("Cleaning Services", (200, 1500)), ("Coffee Machine", (250, 1800)),
+    ("Projector", (400, 1600)), ("Conference Phone", (200, 900)), ("External SSD 2TB", (90, 260)),
+]
+
+SKU_RATE = 0.6  # Share of line items that carry a SKU (the rest align by description)
+
+
+def _round(value: float) -> float:
+    return round(value + 1e-9, 2)
+
+
+def _date(rng: random.Random, start_days: int) -> Tuple[str, int]:
+    day = start_days + rng.randint(0, 364)
+    return time.strftime("%Y-%m-%d", time.gmtime(day * 86400)), day
+
+
+def _after(day: int, rng: random.Random, max_days: int) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime((day + rng.randint(1, max_days)) * 86400))
+
+
+def _pick_discrepancy(rng: random.Random, rate: float) -> str:
+    if rng.random() >= rate:
+        return "clean"
+    return rng.choices(list(DISCREPANCY_WEIGHTS), weights=list(DISCREPANCY_WEIGHTS.values()))[0]
+
+
+def generate_documents(index: int, rng: random.Random, discrepancy_rate: float
+                       ) -> Tuple[Dict[str, Any], Dict[str, Any], Optional[Dict[str, Any]], str]:
+    """(invoice, purchase order, goods receipt or None, discrepancy kind) for the index-th invoice"""
+    invoice_id, po_id, gr_id = f"INV-{index + 1:07d}", f"PO-{index + 1:07d}", f"GR-{index + 1:07d}"
+    vendor = rng.choice(VENDORS)
+    kind = _pick_discrepancy(rng, discrepancy_rate)
+
+    po_lines = []
+    for position in rng.sample(range(len(CATALOG)), rng.randint(1, 4)):
+        description, (low, high) = CATALOG[position]
+        quantity = rng.randint(1, 50)
+        unit_price = _round(rng.uniform(low, high))
+        line = {"description": description, "quantity": quantity, "unit_price": unit_price,
+                "total": _round(quantity * unit_price)}
+        if rng.random() < SKU_RATE:
+            line = {"sku": f"SKU-{position:03d}", **line}
+        po_lines.append(line)
+
+    invoice_lines = [dict(line) for line in po_lines]
+    received = [{"description": line["description"], "quantity_received": line["quantity"],
+                 "quantity_ordered": line["quantity"], "condition": "good"} for line in po_lines]
+    for line, receipt in zip(po_lines, received):
+        if "sku" in line:
+            receipt["sku"] = line["sku"]
+    invoice_vendor = vendor
+    target = rng.randrange(len(invoice_lines))
+
+    if kind == "price_increase":
+        line = invoice_lines[target]
+        line["unit_price"] = _round(line["unit_price"] * rng.uniform(1.05, 1.3))
+        line["total"] = _round(line["quantity"] * line["unit_price"])
+    elif kind == "quantity_over":
+        line = invoice_lines[target]
+        line["quantity"] += rng.randint(1, 5)
+        line["total"] = _round(line["quantity"] * line["unit_price"])
+    elif kind == "short_receipt":
+        receipt = received[target]
+        receipt["quantity_received"] = rng.randint(0, receipt["quantity_ordered"] - 1)
+        receipt["condition"] = "partial"
+    elif kind == "vendor_mismatch":
+        invoice_vendor = rng.choice([name for name in VENDORS if name != vendor])
+    elif kind == "extra_line":
+        description, (low, high) = rng.choice(CATALOG)
+        unit_price = _round(rng.uniform(low, high))
+        invoice_lines.append({"description": f"{description} (additional)", "quantity": 1,
+                              "unit_price": unit_price, "total": unit_price})
+
+    po_date, po_day = _date(rng, 19723)  # 2024-01-01
+    invoice = {
+        "id": invoice_id, "invoice_id": invoice_id, "vendor": invoice_vendor,
+        "date": _after(po_day, rng, 30),
+        "po_reference": f"PO-X{index + 1:07d}" if kind == "missing_po" else po_id,
+        "total_amount": _round(sum(line["total"] for line in invoice_lines)),
+        "line_items": invoice_lines,
+        "status": "pending" if kind == "clean" else "flagged",
+    }
+    if kind != "clean":
+        invoice["flag_reason"] = kind.replace("_", " ").capitalize()
+    purchase_order = {
+        "id": po_id, "po_id": po_id, "vendor": vendor, "date": po_date,
+        "total_amount": _round(sum(line["total"] for line in po_lines)),
+        "line_items": po_lines, "status": "open",
+    }
+    goods_receipt = None
+    if kind != "missing_receipt":
+        goods_receipt = {"id": gr_id, "po_reference": po_id, "date": _after(po_day, rng, 20),
+                         "received_items": received}
+    return invoice, purchase_order, goods_receipt, kind
+
+
+def generate_corpus(out_dir: str, invoices: int = 1000, discrepancy_rate: float = 0.15, seed: int = 42,
+                    samples: int = 50) -> Dict[str, Any]:
+    """Write <out_dir>/{invoices,purchase_orders,goods_receipts}.jsonl and manifest.json; returns the manifest"""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    counts = {"invoices": 0, "purchase_orders": 0, "goods_receipts": 0}
+    kinds = {kind: 0 for kind in ["clean", *DISCREPANCY_WEIGHTS]}
+    sample_ids: Dict[str, List[str]] = {kind: [] for kind in kinds}
+    started = time.perf_counter()
+
+    paths = {doc_type: os.path.join(out_dir, f"{doc_type}.jsonl") for doc_type in counts}
+    files = {doc_type: open(path, 'w', encoding='utf-8') for doc_type, path in paths.items()}
+    try:
+        for index in range(invoices):
+            invoice, purchase_order, goods_receipt, kind = generate_documents(index, rng, discrepancy_rate)
+            for doc_type, doc in (("invoices", invoice), ("purchase_orders", purchase_order),
+                                  ("goods_receipts", goods_receipt)):
+                if doc is not None:
+                    files[doc_type].write(json.dumps(doc) + "\n")
+                    counts[doc_type] += 1
+            kinds[kind] += 1
+            if len(sample_ids[kind]) < samples:
+                sample_ids[kind].append(invoice["invoice_id"])
+    finally:
+        for f in files.values():
+            f.close()
+
+    manifest = {
+        "seed": seed,
+        "invoices": invoices,
+        "discrepancy_rate": discrepancy_rate,
+        "counts": counts,
+        "discrepancies": kinds,
+        "sample_invoice_ids": sample_ids,
+        "bytes": {doc_type: os.path.getsize(path) for doc_type, path in paths.items()},
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+    with open(os.path.join(out_dir, "manifest.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('out_dir', help="directory for the JSONL files (use it as DATA_DIR)")
+    parser.add_argument('--invoices', type=int, default=1000, help="invoices to generate (1k to 1M+)")
+    parser.add_argument('--discrepancy-rate', type=float, default=0.15, help="share of invoices with a discrepancy")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    if not 0 <= args.discrepancy_rate <= 1:
+        parser.error("--discrepancy-rate must be between 0 and 1")
+
+    manifest = generate_corpus(args.out_dir, args.invoices, args.discrepancy_rate, args.seed)
+    print(json.dumps({key: value for key, value in manifest.items() if key != "sample_invoice_ids"}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
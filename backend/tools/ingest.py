@@ -0,0 +1,56 @@
+"""Bulk-load invoices, purchase orders or goods receipts from CSV or JSONL files.
+
+    python -m tools.ingest invoices invoices.csv
+    python -m tools.ingest goods_receipts receipts.jsonl --url http://localhost:5000
+
+Without --url the records go straight into data/ (the running server picks the
+change up on its next read); with --url the file is streamed to the server's
+/api/ingest endpoint, which also updates its indexes in place.
+"""
+import argparse
+import json
+import os
+import sys
+
+from core.document_store import DocumentStore
+from core.ingest import SCHEMAS, DocumentIngester, format_for, read_records
+
+
+def ingest_local(args, fmt: str) -> dict:
+    ingester = DocumentIngester(DocumentStore(args.data_dir), batch_size=args.batch_size, fsync=not args.no_fsync)
+    with open(args.path, 'r', encoding='utf-8', newline='') as f:
+        return ingester.ingest(args.doc_type, read_records(f, fmt))
+
+
+def ingest_remote(args, fmt: str) -> dict:
+    import requests
+    with open(args.path, 'rb') as f:
+        # A file object is sent as it is read, not loaded first
+        response = requests.post(f"{args.url.rstrip('/')}/api/ingest/{args.doc_type}",
+                                 params={"format": fmt}, data=f, timeout=None)
+    response.raise_for_status()
+    return response.json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('doc_type', choices=sorted(SCHEMAS))
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=("csv", "jsonl"), help="default: from the file extension")
+    parser.add_argument('--url', help="server to upload to instead of writing data/ directly")
+    parser.add_argument('--data-dir', default=os.getenv('DATA_DIR', 'data/'))
+    parser.add_argument('--batch-size', type=int, default=None, help="records per atomic append (INGEST_BATCH_SIZE)")
+    parser.add_argument('--no-fsync', action='store_true', help="do not fsync each batch")
+    args = parser.parse_args()
+
+    fmt = args.format or format_for(args.path)
+    if fmt is None:
+        parser.error("cannot tell the format from the file name; pass --format csv or --format jsonl")
+    report = ingest_remote(args, fmt) if args.url else ingest_local(args, fmt)
+    print(json.dumps(report, indent=2))
+    if report["rejected"]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Local OpenAI-compatible /v1/chat/completions stub for offline tests and load measurements.
+
+    python -m tools.llm_stub_server --port 8765 --latency 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python app.py
+
+With --respond fake the stub answers planner and verifier prompts with valid,
+deterministic JSON (the same prompt always gets the same reply), so the LLM
+tiers of the pipeline run end to end; the default echo reply makes them fall back.
+"""
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Any, Tuple
+
+from agents.planner import PLAN_TEMPLATES
+
+_QUERY_LINE = re.compile(r'^\s*Query: (.*)$', re.MULTILINE)
+_MATCH_SCORE = re.compile(r'"match_score":\s*(-?\d+(?:\.\d+)?)')
+_DISCREPANCY_COUNT = re.compile(r'"discrepancies":\s*\[([^\]]*)\]')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so client connection pooling is exercised
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Dict[str, str] = None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        server = self.server
+        with server.lock:
+            server.requests_served += 1
+            count = server.requests_served
+        if server.rate_limit_every and count % server.rate_limit_every == 0:
+            self._send_json(429, {"error": {"message": "Rate limit reached"}}, {"Retry-After": "0.05"})
+            return
+
+        time.sleep(server.latency)
+        content = server.respond(request.get('messages', []))
+        if request.get('stream'):
+            self._send_stream(count, request, content)
+            return
+        self._send_json(200, {
+            "id": f"stub-{count}",
+            "object": "chat.completion",
+            "model": request.get('model', 'stub'),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    def _send_stream(self, count: int, request: Dict[str, Any], content: str):
+        """The completion as server-sent events, one per word, then [DONE]; chunked, like the real API"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def send_chunk(data: bytes):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        for token in re.findall(r'\S+\s*|\s+', content):
+            time.sleep(self.server.token_latency)
+            chunk = {"id": f"stub-{count}", "object": "chat.completion.chunk",
+                     "model": request.get('model', 'stub'),
+                     "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            send_chunk(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+        send_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def echo_response(messages: List[Dict[str, str]]) -> str:
+    last = messages[-1]['content'] if messages else ''
+    return f"stub response to: {last.strip()[:80]}"
+
+
+def fake_llm_response(messages: List[Dict[str, str]]) -> str:
+    """A plan or verification in the JSON the agents ask for, derived only from the prompt"""
+    prompt = "\n".join(message.get('content', '') for message in messages)
+    if "query planner" in prompt:
+        match = _QUERY_LINE.search(prompt)
+        query = (match.group(1) if match else prompt).lower()
+        if "approv" in query:
+            plan = PLAN_TEMPLATES["approval_request"]
+        elif "inv-" in query or "invoice" in query and ("flag" in query or "why" in query):
+            plan = PLAN_TEMPLATES["invoice_analysis"]
+        else:
+            plan = PLAN_TEMPLATES["general_inquiry"]
+        return json.dumps(dict(plan, reasoning="fake planner: keyword rules"))
+    if "result verifier" in prompt:
+        match = _MATCH_SCORE.search(prompt)
+        confidence = float(match.group(1)) if match else 0.6
+        listed = _DISCREPANCY_COUNT.search(prompt)
+        discrepancies = listed.group(1).count('"') // 2 if listed else 0
+        return json.dumps({
+            "confidence": confidence,
+            "summary": f"Fake verification: match score {confidence:.2f} with {discrepancies} discrepancies.",
+            "risks": ["Discrepancies found"] if discrepancies else [],
+            "recommendations": ["Manual review required before approval"] if confidence < 0.8 else [],
+            "conflicts": [],
+        })
+    return echo_response(messages)
+
+
+RESPONDERS = {"echo": echo_response, "fake": fake_llm_response}
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # Accept a burst of concurrent connections
+
+    def __init__(self, address: Tuple[str, int], latency: float = 0.0, rate_limit_every: int = 0,
+                 respond=echo_response, token_latency: float = 0.0):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.token_latency = token_latency  # Extra seconds per streamed chunk
+        self.rate_limit_every = rate_limit_every  # Answer every Nth request with 429 (0 = never)
+        self.respond = respond
+        self.requests_served = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def handle_error(self, request, client_address):
+        # A client dropping its pooled keep-alive connections (e.g. a server under test exiting) is not an error
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_stub_server(port: int = 0, latency: float = 0.0, rate_limit_every: int = 0,
+                      respond=echo_response, token_latency: float = 0.0) -> StubServer:
+    """Run a stub server on a background thread; port 0 picks a free port (see .base_url)"""
+    server = StubServer(('127.0.0.1', port), latency, rate_limit_every, respond, token_latency)
+    threading.Thread(target=server.serve_forever, name="llm-stub", daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per completion")
+    parser.add_argument('--rate-limit-every', type=int, default=0, help="return 429 on every Nth request")
+    parser.add_argument('--token-latency', type=float, default=0.0, help="seconds per chunk of a streamed reply")
+    parser.add_argument('--respond', choices=sorted(RESPONDERS), default="echo",
+                        help="echo the prompt, or fake planner/verifier JSON")
+    args = parser.parse_args()
+
+    server = StubServer(('127.0.0.1', args.port), args.latency, args.rate_limit_every,
+                        respond=RESPONDERS[args.respond], token_latency=args.token_latency)
+    print(f"LLM stub listening on {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,80 @@
+"""Measure LLM client throughput under concurrent load against the local stub (no network needed).
+
+    python -m tools.llm_throughput --queries 100 --latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List, Any
+
+from tools.llm_stub_server import start_stub_server
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run_async(client, queries: int) -> Dict[str, Any]:
+    async def one(i: int) -> float:
+        started = time.perf_counter()
+        content = await client.achat_completion([{"role": "user", "content": f"throughput query {i}"}])
+        if content.startswith("Error:"):
+            raise RuntimeError(content)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(one(i) for i in range(queries)))
+    elapsed = time.perf_counter() - started
+    await client.aclose()
+    return {
+        "mode": "async",
+        "queries": queries,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_qps": round(queries / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+    }
+
+
+def run_sequential(client, queries: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    for i in range(queries):
+        client.chat_completion([{"role": "user", "content": f"sequential query {i}"}])
+    elapsed = time.perf_counter() - started
+    return {"mode": "sequential", "queries": queries, "elapsed_seconds": round(elapsed, 3),
+            "throughput_qps": round(queries / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.2, help="stub seconds per completion")
+    parser.add_argument('--concurrency', type=int, default=100, help="LLM_MAX_CONCURRENCY for the client")
+    parser.add_argument('--sequential-sample', type=int, default=10,
+                        help="sync calls made one after another, for comparison")
+    args = parser.parse_args()
+
+    server = start_stub_server(latency=args.latency)
+    os.environ['OPENAI_BASE_URL'] = server.base_url
+    os.environ['LLM_MAX_CONCURRENCY'] = str(args.concurrency)
+    os.environ.pop('OPENAI_API_KEY', None)  # Force the pooled HTTP path against the stub
+
+    from core.llm_cache import LLMResponseCache
+    from core.llm_client import LLMClient
+    # Memory-only cache; every query is distinct so nothing is served from it
+    client = LLMClient(cache=LLMResponseCache(db_path=""))
+
+    results = [asyncio.run(run_async(client, args.queries))]
+    if args.sequential_sample:
+        results.append(run_sequential(client, args.sequential_sample))
+    print(json.dumps(results, indent=2))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Load-test serve.py at several worker counts against the local LLM stub (no network needed).
+
+    python -m tools.load_test --workers 1 2 4 --clients 16 --duration 15
+
+Each run starts serve.py on a fresh port with its own session database, audit log
+and LLM cache, then drives /api/query from `--clients` client processes for
+`--duration` seconds. Every client keeps one session_id, so its requests land on
+arbitrary workers; the run checks that each session's history holds all of its
+interactions. Scaling is throughput relative to the 1-worker run (ideal: N).
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Any
+
+from tools.llm_stub_server import start_stub_server
+from tools.llm_throughput import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUERIES = [
+    "Why was invoice INV-123 flagged?",
+    "Show me all flagged invoices",
+    "Approve invoice INV-124",
+    "Why was invoice INV-125 flagged?",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_ready(port: int, process: subprocess.Popen, timeout: float = 120.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"serve.py exited with status {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/api/stats')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"serve.py did not answer on port {port} within {timeout}s")
+
+
+def run_client(port: int, client_id: int, duration: float) -> Dict[str, Any]:
+    """Send queries back to back on one keep-alive connection until `duration` has elapsed"""
+    session_id = f"load-{client_id}-{os.getpid()}"
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    i = 0
+    while time.perf_counter() < deadline:
+        body = json.dumps({"query": QUERIES[(client_id + i) % len(QUERIES)], "session_id": session_id})
+        i += 1
+        started = time.perf_counter()
+        try:
+            conn.request('POST', '/api/query', body, {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+                continue
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            continue
+        latencies.append(time.perf_counter() - started)
+    return {"session_id": session_id, "latencies": latencies, "errors": errors}
+
+
+def run_load(workers: int, args, stub_url: str, workdir: str) -> Dict[str, Any]:
+    port = free_port()
+    env = dict(os.environ,
+               OPENAI_BASE_URL=stub_url,
+               MEMORY_BACKEND='sqlite',
+               MEMORY_DB_PATH=os.path.join(workdir, f"sessions-{workers}.sqlite"),
+               AUDIT_LOG_FILE=os.path.join(workdir, f"audit-{workers}.jsonl"),
+               LLM_CACHE_PATH=os.path.join(workdir, f"llm_cache-{workers}.sqlite"))
+    env.pop('OPENAI_API_KEY', None)  # Force the pooled HTTP path against the stub
+    process = subprocess.Popen([sys.executable, 'serve.py', '--workers', str(workers), '--port', str(port)],
+                               cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+    try:
+        wait_until_ready(port, process)
+        with multiprocessing.Pool(args.clients) as pool:
+            started = time.perf_counter()
+            clients = pool.starmap(run_client, [(port, i, args.duration) for i in range(args.clients)])
+            elapsed = time.perf_counter() - started
+
+        # Shared session state: every client's interactions are in its session, whichever worker served them
+        from core.memory import SQLiteConversationMemory
+        sessions = SQLiteConversationMemory(db_path=env['MEMORY_DB_PATH'])
+        missing = sum(max(0, min(len(c["latencies"]), sessions.max_interactions)
+                          - len(sessions.get_session_history(c["session_id"]))) for c in clients)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    latencies = [latency for c in clients for latency in c["latencies"]]
+    return {
+        "workers": workers,
+        "clients": args.clients,
+        "requests": len(latencies),
+        "errors": sum(c["errors"] for c in clients),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "missing_session_interactions": missing,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=16, help="concurrent client processes")
+    parser.add_argument('--duration', type=float, default=15.0, help="seconds of load per worker count")
+    parser.add_argument('--latency', type=float, default=0.05, help="stub seconds per completion")
+    args = parser.parse_args()
+
+    server = start_stub_server(latency=args.latency)
+    results: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix="load-test-") as workdir:
+        for workers in args.workers:
+            results.append(run_load(workers, args, server.base_url, workdir))
+    baseline = next((r["throughput_rps"] for r in results if r["workers"] == 1), None)
+    for result in results:
+        if baseline:
+            result["scaling"] = round(result["throughput_rps"] / baseline, 2)
+    print(json.dumps({"cpu_count": os.cpu_count(), "runs": results}, indent=2))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Local vendor risk API stub (GET /vendors/<name>) for offline tests of the HTTP vendor backend.
+
+    python -m tools.vendor_stub_server --port 8766 --latency 0.2
+    VENDOR_API_URL=http://127.0.0.1:8766 python app.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Tuple
+from urllib.parse import unquote
+
+from agents.web_search import MOCK_VENDOR_DB
+
+
+class VendorStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so client connection pooling is exercised
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict[str, Any]):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        prefix = '/vendors/'
+        if not self.path.startswith(prefix):
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        server = self.server
+        with server.lock:
+            server.requests_served += 1
+        time.sleep(server.latency)
+        vendor = unquote(self.path[len(prefix):])
+        if vendor in server.vendors:
+            self._send_json(200, server.vendors[vendor])
+        else:
+            self._send_json(404, {"error": f"Unknown vendor {vendor}"})
+
+
+class VendorStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address: Tuple[str, int], latency: float = 0.0, vendors: Dict[str, Any] = None):
+        super().__init__(address, VendorStubHandler)
+        self.latency = latency
+        self.vendors = vendors if vendors is not None else MOCK_VENDOR_DB
+        self.requests_served = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_vendor_stub_server(port: int = 0, latency: float = 0.0, vendors: Dict[str, Any] = None) -> VendorStubServer:
+    """Run a stub server on a background thread; port 0 picks a free port (see .base_url)"""
+    server = VendorStubServer(('127.0.0.1', port), latency, vendors)
+    threading.Thread(target=server.serve_forever, name="vendor-stub", daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency', type=float, default=0.2, help="seconds per lookup")
+    args = parser.parse_args()
+
+    server = VendorStubServer(('127.0.0.1', args.port), args.latency)
+    print(f"Vendor stub listening on {server.base_url}")
+    server.serve_forever()
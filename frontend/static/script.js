@@ -33,28 +33,19 @@ class InvoicePOMatcher {
         this.addMessage(query, 'user');
         queryInput.value = '';
         
-        // Show loading
-        const loadingId = this.addMessage('🤔 Analyzing... <div class="loading"></div>', 'system');
+        // Show loading, filled in stage by stage as the server reports progress
+        const loadingId = this.addMessage(`
+            🤔 Analyzing... <div class="loading"></div>
+            <ul class="stage-list"></ul>
+            <p class="stream-summary"></p>
+        `, 'system');
         
         try {
-            const response = await fetch(`${this.apiBase}/query`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    query: query,
-                    session_id: this.sessionId
-                })
-            });
-
-            const result = await response.json();
+            const result = await this.streamQuery(query, (event, data) => this.renderStage(loadingId, event, data));
             
             // Update session ID
             if (result.session_id) {
-                this.sessionId = result.session_id;
-                document.getElementById('session-id').textContent = 
-                    result.session_id.substring(0, 8) + '...';
+                this.setSession(result.session_id);
             }
 
             // Remove loading message
@@ -64,7 +55,7 @@ class InvoicePOMatcher {
             this.displayResults(result);
             
             // Update audit log
-            this.updateAuditLog(result.audit_trail);
+            this.loadAuditLog();
             
         } catch (error) {
             this.removeMessage(loadingId);
@@ -72,6 +63,105 @@ class InvoicePOMatcher {
         }
     }
 
+    async streamQuery(query, onEvent) {
+        // POST with a streamed body: EventSource cannot send one, so the SSE stream is parsed by hand
+        const response = await fetch(`${this.apiBase}/query/stream`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                query: query,
+                session_id: this.sessionId,
+                profile: 'standard'
+            })
+        });
+        if (!response.ok) {
+            const error = await response.json().catch(() => ({}));
+            throw new Error(error.error || `HTTP ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let result = null;
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            
+            // Events are separated by a blank line; the last piece may still be incomplete
+            const blocks = buffer.split('\n\n');
+            buffer = blocks.pop();
+            for (const block of blocks) {
+                let event = 'message';
+                let data = '';
+                for (const line of block.split('\n')) {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                }
+                const payload = data ? JSON.parse(data) : {};
+                if (event === 'error') throw new Error(payload.error);
+                if (event === 'final') result = payload;
+                else onEvent(event, payload);
+            }
+        }
+        if (!result) throw new Error('The response ended before the final result');
+        return result;
+    }
+
+    renderStage(messageId, event, data) {
+        const message = document.getElementById(messageId);
+        if (!message) return;
+        const stages = message.querySelector('.stage-list');
+        const addStage = (text) => {
+            const item = document.createElement('li');
+            item.textContent = text;
+            stages.appendChild(item);
+        };
+
+        switch (event) {
+            case 'session':
+                this.setSession(data.session_id);
+                break;
+            case 'plan':
+                addStage(`🧭 Plan: ${data.query_type} (${(data.agents_to_call || []).join(', ')})`);
+                break;
+            case 'retrieval':
+                addStage(data.result && data.result.error ? `📄 Retrieval failed: ${data.result.error}` :
+                         `📄 Retrieved ${data.result ? data.result.documents : 0} documents`);
+                break;
+            case 'po_matching':
+                if (data.result && data.result.error) {
+                    addStage(`🔗 PO matching failed: ${data.result.error}`);
+                } else if (data.result) {
+                    addStage(`🔗 ${data.result.invoice_id}: match score ` +
+                             `${((data.result.match_score || 0) * 100).toFixed(0)}%, ` +
+                             `${(data.result.discrepancies || []).length} discrepancies`);
+                }
+                break;
+            case 'web_search':
+                if (data.result && data.result.found) {
+                    addStage(`🌐 ${data.result.vendor}: ${data.result.risk_level} risk`);
+                }
+                break;
+            case 'token':
+                // The verifier's summary, as the LLM writes it
+                message.querySelector('.stream-summary').textContent += data.text;
+                break;
+            case 'verification':
+                addStage(`✅ Verified: ${((data.confidence || 0) * 100).toFixed(0)}% confidence`);
+                break;
+        }
+        const messagesContainer = document.getElementById('chat-messages');
+        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    }
+
+    setSession(sessionId) {
+        this.sessionId = sessionId;
+        document.getElementById('session-id').textContent = sessionId.substring(0, 8) + '...';
+    }
+
     displayResults(result) {
         let html = `
             <div class="response-section">
@@ -142,18 +232,12 @@ class InvoicePOMatcher {
     }
 
     isApprovableQuery(result) {
-        return result.query_plan && 
-               result.query_plan.query_type === 'invoice_analysis' &&
+        return result.query_type === 'invoice_analysis' &&
                !result.requires_human_review;
     }
 
     generateApprovalActions(result) {
-        // Extract invoice ID from agent results
-        let invoiceId = 'INV-123'; // Default fallback
-        if (result.agent_results && result.agent_results.po_matching && 
-            result.agent_results.po_matching.invoice) {
-            invoiceId = result.agent_results.po_matching.invoice.invoice_id;
-        }
+        const invoiceId = result.invoice_id || 'INV-123'; // Default fallback
 
         return `
             <div class="approval-actions">
@@ -215,15 +299,26 @@ class InvoicePOMatcher {
         }
     }
 
-    updateAuditLog(auditTrail) {
-        if (!auditTrail || auditTrail.length === 0) return;
+    async loadAuditLog() {
+        if (!this.sessionId) return;
+        try {
+            // Only the newest page of the trail, rather than the whole trail with every response
+            const response = await fetch(
+                `${this.apiBase}/audit/${encodeURIComponent(this.sessionId)}?limit=5&order=desc`);
+            const page = await response.json();
+            this.updateAuditLog(page.entries);
+        } catch (error) {
+            console.error('Failed to load audit log:', error);
+        }
+    }
+
+    updateAuditLog(recentEntries) {
+        if (!recentEntries || recentEntries.length === 0) return;
         
         const auditLog = document.getElementById('audit-log');
         auditLog.innerHTML = '';
         
-        // Show last 5 audit entries
-        const recentEntries = auditTrail.slice(-5).reverse();
-        
+        // Newest first
         recentEntries.forEach(entry => {
             const auditItem = document.createElement('div');
             auditItem.className = 'audit-item';